@@ -79,14 +79,23 @@ async def after_server_starting(app: SanicVTHell, loop: asyncio.AbstractEventLoo
         logger.info("Attaching the IPC server and client")
         app.ipc = IPCServerClientBridge()
         app.ipc.attach(app)
+        app.ipc.on("job_reschedule", app.jobtimer.on_ipc_reschedule)
+        app.ipc.on("job_unschedule", app.jobtimer.on_ipc_unschedule)
+        app.ipc.on("autoscheduler_invalidate", app.autorules.on_ipc_invalidate)
 
 
 async def after_server_closing(app: SanicVTHell, loop: asyncio.AbstractEventLoop):
+    logger.info("Interrupting running child processes")
+    await app.supervisor.close()
+    logger.info("Flushing pending job state")
+    await app.jobstate.close()
     logger.info("Closing DB client")
     await Tortoise.close_connections()
     logger.info("Closing Holodex API")
     if app.holodex:
         await app.holodex.close()
+    logger.info("Closing shared HTTP connections")
+    await app.http.close()
     logger.info("Closing WSHandler")
     app.wshandler.close()
     if app.ipc:
@@ -141,7 +150,20 @@ def load_config():
     config["VTHELL_LOOP_DOWNLOADER"] = os.getenv("VTHELL_LOOP_DOWNLOADER", "60")
     config["VTHELL_LOOP_SCHEDULER"] = os.getenv("VTHELL_LOOP_SCHEDULER", "180")
     config["VTHELL_GRACE_PERIOD"] = os.getenv("VTHELL_GRACE_PERIOD", "120")
+    config["VTHELL_WORKERS_DOWNLOAD"] = os.getenv("VTHELL_WORKERS_DOWNLOAD", "0")
+    config["VTHELL_WORKERS_MUX"] = os.getenv("VTHELL_WORKERS_MUX", "2")
+    config["VTHELL_WORKERS_UPLOAD"] = os.getenv("VTHELL_WORKERS_UPLOAD", "2")
+    config["VTHELL_MUX_MODE"] = os.getenv("VTHELL_MUX_MODE", "mkv")
+    config["VTHELL_SCHEDULER_MODE"] = os.getenv("VTHELL_SCHEDULER_MODE", "live")
+    config["VTHELL_CHAT_COMPRESSION"] = os.getenv("VTHELL_CHAT_COMPRESSION", "none")
+    config["VTHELL_CHAT_COMPRESSION_LEVEL"] = os.getenv("VTHELL_CHAT_COMPRESSION_LEVEL", "0")
     config["HOLODEX_API_KEY"] = os.getenv("HOLODEX_API_KEY")
+    config["HOLODEX_CACHE_VIDEO_TTL"] = os.getenv("HOLODEX_CACHE_VIDEO_TTL", "60")
+    config["HOLODEX_CACHE_CHANNEL_TTL"] = os.getenv("HOLODEX_CACHE_CHANNEL_TTL", "300")
+    config["HOLODEX_CACHE_SIZE"] = os.getenv("HOLODEX_CACHE_SIZE", "256")
+    config["HOLODEX_PAGE_CONCURRENCY"] = os.getenv("HOLODEX_PAGE_CONCURRENCY", "4")
+    config["HOLODEX_RATE_LIMIT"] = os.getenv("HOLODEX_RATE_LIMIT", "4")
+    config["HOLODEX_RATE_BURST"] = os.getenv("HOLODEX_RATE_BURST", "10")
     if not isinstance(config["VTHELL_LOOP_DOWNLOADER"], (int, float)):
         try:
             config["VTHELL_LOOP_DOWNLOADER"] = int(config["VTHELL_LOOP_DOWNLOADER"])
@@ -185,6 +207,7 @@ def load_config():
     config["RCLONE_PATH"] = rclone_path
     config["RCLONE_DRIVE_TARGET"] = rclone_drive_target
     config["RCLONE_DISABLE"] = rclone_disable
+    config["RCLONE_STREAM_UPLOAD"] = map_to_boolean(os.getenv("RCLONE_STREAM_UPLOAD", "0"))
     if not test_ytarchive_binary(ytarchive_path):
         logger.error(
             "YTArchive binary not found, please download here: https://github.com/Kethsar/ytarchive/releases"
@@ -244,7 +267,18 @@ def setup_app():
     async def on_connect_ws(sid: str, ws):
         logger.info("Client connected: %s", sid)
         await app.wait_until_ready()
-        active_jobs = await models.VTHellJob.exclude(status=models.VTHellJobStatus.done)
+        active_status = models.VTHellJobStatus.except_for(models.VTHellJobStatus.done)
+        active_jobs = await models.VTHellJob.filter(status__in=active_status).only(
+            "id",
+            "title",
+            "filename",
+            "start_time",
+            "channel_id",
+            "member_only",
+            "status",
+            "resolution",
+            "error",
+        )
         as_json_fmt = []
         for job in active_jobs:
             as_json_fmt.append(
@@ -7,10 +7,12 @@ All of VTHell internals module being used.
 :license: MIT, see LICENSE for more details.
 """
 
-from . import chat, db, holodex, notifier, routes, struct, tasks, ws
+from . import chat, db, holodex, jobs, notifier, routes, struct, tasks, ws
+from .autoscheduler import *
 from .constants import *
 from .decorator import *
 from .discover import *
+from .httpclient import *
 from .logme import *
 from .monke import *
 from .runner import *
@@ -0,0 +1,297 @@
+"""
+MIT License
+
+Copyright (c) 2020-present noaione
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import re
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterable, List, Optional, Pattern, Tuple
+
+from internals.db import models
+
+if TYPE_CHECKING:
+    from internals.holodex import HolodexVideo
+    from internals.vth import SanicVTHell
+
+__all__ = ("CompiledChain", "CompiledRuleSet", "AutoSchedulerRules")
+
+logger = logging.getLogger("Internals.AutoScheduler")
+# (video, casefolded title) -> bool
+ChainPredicate = Callable[["HolodexVideo", str], bool]
+
+
+def _compile_regex(pattern: str) -> Optional[Pattern[str]]:
+    try:
+        return re.compile(pattern, re.IGNORECASE)
+    except re.error as exc:
+        logger.error(f"Invalid regex rule {pattern!r}, ignoring it: {exc}")
+        return None
+
+
+def _compile_alternation(words: Iterable[str]) -> Optional[Pattern[str]]:
+    """Compile casefolded words into one alternation regex, longest first so nothing is shadowed"""
+    words = sorted(set(words), key=len, reverse=True)
+    if not words:
+        return None
+    return re.compile("|".join(map(re.escape, words)))
+
+
+def _compile_any_regex(patterns: Iterable[str]) -> Tuple[Optional[Pattern[str]], List[Pattern[str]]]:
+    """
+    Try to merge multiple regex into a single alternation, if it can't be merged
+    (inline flags, backreferences, and more) it will fallback to list of compiled regex.
+    """
+    compiled = [regex for regex in map(_compile_regex, patterns) if regex is not None]
+    if not compiled:
+        return None, []
+    if len(compiled) == 1:
+        return compiled[0], []
+    try:
+        merged = re.compile("|".join(f"(?:{regex.pattern})" for regex in compiled), re.IGNORECASE)
+    except re.error:
+        return None, compiled
+    if any(regex.groups for regex in compiled):
+        # Numbered groups and backreferences would be shifted after merging
+        return None, compiled
+    return merged, []
+
+
+def _search_any(merged: Optional[Pattern[str]], fallback: List[Pattern[str]], text: str) -> bool:
+    if merged is not None and merged.search(text) is not None:
+        return True
+    return any(regex.search(text) is not None for regex in fallback)
+
+
+class CompiledChain:
+    """Every chain of a word/regex rule precompiled as a predicate, all of it need to match"""
+
+    __slots__ = ("predicates",)
+
+    def __init__(self, chains: Optional[List[Dict[str, str]]]):
+        self.predicates: List[ChainPredicate] = []
+        for chain in chains or []:
+            predicate = self._compile(chain)
+            if predicate is not None:
+                self.predicates.append(predicate)
+
+    @staticmethod
+    def _compile(chain: Dict[str, str]) -> Optional[ChainPredicate]:
+        chain_type, chain_data = chain.get("type"), chain.get("data")
+        if not isinstance(chain_data, str):
+            return lambda video, title: False
+        if chain_type == "word":
+            word = chain_data.casefold()
+            return lambda video, title: word in title
+        elif chain_type == "regex_word":
+            regex = _compile_regex(chain_data)
+            if regex is None:
+                return lambda video, title: False
+            return lambda video, title: regex.search(video.title) is not None
+        elif chain_type == "group":
+            group = chain_data.casefold()
+            return lambda video, title: bool(video.org) and video.org.casefold() == group
+        elif chain_type == "channel":
+            return lambda video, title: video.channel_id == chain_data
+        # Unknown chain type is ignored, same as before
+        return None
+
+    def __bool__(self) -> bool:
+        return bool(self.predicates)
+
+    def matches(self, video: HolodexVideo, title: str) -> bool:
+        return all(predicate(video, title) for predicate in self.predicates)
+
+
+class CompiledRuleSet:
+    """
+    The auto scheduler rules compiled into a single matcher.
+
+    Channel and group rules become a set lookup, unchained word rules become one alternation
+    regex matched against the casefolded title, and every regex is compiled only once.
+    """
+
+    def __init__(self, schedulers: List[models.VTHellAutoScheduler]):
+        self.total = len(schedulers)
+        include = [rule for rule in schedulers if rule.include]
+        exclude = [rule for rule in schedulers if not rule.include]
+        self.total_include = len(include)
+        self.has_include = len(include) > 0
+
+        def by_type(rules: List[models.VTHellAutoScheduler], rule_type: models.VTHellAutoType):
+            return [rule for rule in rules if rule.type == rule_type]
+
+        self.exclude_channels = frozenset(rule.data for rule in by_type(exclude, models.VTHellAutoType.channel))
+        self.exclude_groups = frozenset(rule.data.casefold() for rule in by_type(exclude, models.VTHellAutoType.group))
+        self.exclude_words = _compile_alternation(
+            rule.data.casefold() for rule in by_type(exclude, models.VTHellAutoType.word)
+        )
+        self.exclude_regex, self.exclude_regex_list = _compile_any_regex(
+            rule.data for rule in by_type(exclude, models.VTHellAutoType.regex_word)
+        )
+
+        self.include_channels = frozenset(rule.data for rule in by_type(include, models.VTHellAutoType.channel))
+        self.include_groups = frozenset(rule.data.casefold() for rule in by_type(include, models.VTHellAutoType.group))
+        # Unchained word/regex rule can be merged, chained one need to be checked one by one.
+        include_words = by_type(include, models.VTHellAutoType.word)
+        include_regexes = by_type(include, models.VTHellAutoType.regex_word)
+        self.include_words = _compile_alternation(rule.data.casefold() for rule in include_words if not rule.chains)
+        self.include_regex, self.include_regex_list = _compile_any_regex(
+            rule.data for rule in include_regexes if not rule.chains
+        )
+        self.chained_words: List[Tuple[str, CompiledChain]] = [
+            (rule.data.casefold(), CompiledChain(rule.chains)) for rule in include_words if rule.chains
+        ]
+        self.chained_regexes: List[Tuple[Pattern[str], CompiledChain]] = []
+        for rule in include_regexes:
+            if not rule.chains:
+                continue
+            regex = _compile_regex(rule.data)
+            if regex is not None:
+                self.chained_regexes.append((regex, CompiledChain(rule.chains)))
+
+    @staticmethod
+    def fingerprint(schedulers: List[models.VTHellAutoScheduler]) -> int:
+        return hash(
+            tuple(
+                (rule.pk, rule.type.value, rule.data, rule.include, repr(rule.chains))
+                for rule in sorted(schedulers, key=lambda rule: rule.pk)
+            )
+        )
+
+    def is_excluded(self, video: HolodexVideo, title: str) -> bool:
+        if video.channel_id in self.exclude_channels:
+            return True
+        if video.org and video.org.casefold() in self.exclude_groups:
+            return True
+        if self.exclude_words is not None and self.exclude_words.search(title) is not None:
+            return True
+        return _search_any(self.exclude_regex, self.exclude_regex_list, video.title)
+
+    def is_included(self, video: HolodexVideo, title: str) -> bool:
+        if video.channel_id in self.include_channels:
+            return True
+        if video.org and video.org.casefold() in self.include_groups:
+            return True
+        if self.include_words is not None and self.include_words.search(title) is not None:
+            return True
+        if _search_any(self.include_regex, self.include_regex_list, video.title):
+            return True
+        for word, chain in self.chained_words:
+            if word in title and chain.matches(video, title):
+                return True
+        for regex, chain in self.chained_regexes:
+            if regex.search(video.title) is not None and chain.matches(video, title):
+                return True
+        return False
+
+    def matches(self, video: HolodexVideo) -> bool:
+        title = video.title.casefold()
+        if self.is_excluded(video, title):
+            return False
+        return self.is_included(video, title)
+
+    def filter(self, videos: Iterable[HolodexVideo]) -> List[HolodexVideo]:
+        return [video for video in videos if self.matches(video)]
+
+
+class AutoSchedulerRules:
+    """
+    Hold the compiled auto scheduler rules for the first process.
+
+    The rules are only queried again after an invalidation, which is sent by the auto scheduler
+    routes from any worker. Each invalidation bump the rules version and wake up the scheduler.
+    """
+
+    # Wait a bit after a change before waking up the scheduler, in case more change is coming.
+    SETTLE_DELAY = 2.0
+
+    def __init__(self, app: SanicVTHell):
+        self._app = app
+        self._fingerprint: Optional[int] = None
+        self._compiled: Optional[CompiledRuleSet] = None
+        self._version = 0
+        self._compiled_version = -1
+        self._changed: Optional[asyncio.Event] = None
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    @property
+    def compiled(self) -> Optional[CompiledRuleSet]:
+        return self._compiled
+
+    @property
+    def changed(self) -> asyncio.Event:
+        # Lazily created so it's bound to the running loop
+        if self._changed is None:
+            self._changed = asyncio.Event()
+        return self._changed
+
+    async def get(self) -> CompiledRuleSet:
+        if self._compiled is not None and self._compiled_version == self._version:
+            return self._compiled
+        version = self._version
+        schedulers = await models.VTHellAutoScheduler.all()
+        fingerprint = CompiledRuleSet.fingerprint(schedulers)
+        if self._compiled is None or fingerprint != self._fingerprint:
+            logger.info(f"Compiling {len(schedulers)} auto scheduler rule(s) (version {version})")
+            self._compiled = CompiledRuleSet(schedulers)
+            self._fingerprint = fingerprint
+        self._compiled_version = version
+        return self._compiled
+
+    def invalidate(self):
+        self._version += 1
+        logger.info(f"Auto scheduler rules changed, bumping version to {self._version}")
+        self.changed.set()
+
+    async def notify_changed(self):
+        """
+        Notify that the auto scheduler rules got modified.
+        Can be called from any worker, it will be forwarded to the first process.
+        """
+        if self._app.first_process:
+            self.invalidate()
+        elif self._app.ipc:
+            await self._app.ipc.emit("autoscheduler_invalidate", {"worker": self._app.worker_num})
+
+    async def on_ipc_invalidate(self, data: Any):
+        if self._app.first_process:
+            self.invalidate()
+
+    async def wait_for_change(self, timeout: float) -> bool:
+        """Sleep for the timeout or until the rules changed, return True if it got changed"""
+        try:
+            await asyncio.wait_for(self.changed.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            return False
+        await asyncio.sleep(self.SETTLE_DELAY)
+        self.changed.clear()
+        return True
+
+    def __repr__(self) -> str:
+        total = self._compiled.total if self._compiled is not None else None
+        return f"<AutoSchedulerRules version={self._version} rules={total}>"
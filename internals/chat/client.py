@@ -29,11 +29,11 @@ import hashlib
 import logging
 import time
 from enum import Enum
+from functools import lru_cache
 from http.cookies import Morsel
-from typing import TYPE_CHECKING, Any, Dict, Optional
+from typing import TYPE_CHECKING, Any, Callable, Dict, Optional, Tuple
 from urllib.parse import quote as url_quote
 
-import aiofiles
 import aiohttp
 import pendulum
 
@@ -46,7 +46,8 @@ from internals.chat.parser import (
     parse_youtube_video_data,
 )
 from internals.chat.utils import camel_case_split, remove_prefixes, remove_suffixes, try_get_first_key
-from internals.utils import find_cookies_file, parse_cookie_to_morsel, parse_expiry_as_date
+from internals.httpclient import HTTPClientManager
+from internals.utils import parse_expiry_as_date
 
 if TYPE_CHECKING:
     from internals.chat.writer import JSONWriter
@@ -54,14 +55,26 @@ if TYPE_CHECKING:
 __all__ = ("ChatDownloader",)
 
 
+@lru_cache(maxsize=None)
+def normalize_action_type(action_type: str) -> str:
+    return camel_case_split(remove_suffixes(action_type, ("Action", "Command")))
+
+
+@lru_cache(maxsize=None)
+def normalize_message_type(message_type: str) -> str:
+    return camel_case_split(remove_suffixes(remove_prefixes(message_type, "liveChat"), "Renderer"))
+
+
 class ChatEvent(Enum):
     data = 0
     wait = 1
 
 
 class ChatDownloader:
-    def __init__(self, video_id: str):
+    def __init__(self, video_id: str, http: Optional[HTTPClientManager] = None):
         self.session: aiohttp.ClientSession = None
+        self.http = http
+        self._own_http = http is None
         self.video_id = video_id
         self.logger = logging.getLogger(f"Internals.ChatDownloader[{video_id}]")
 
@@ -107,7 +120,8 @@ class ChatDownloader:
     _KNOWN_ADD_BANNER_TYPES = {
         "addBannerToLiveChatCommand": [
             "liveChatBannerRenderer",
-            "liveChatBannerHeaderRenderer" "liveChatTextMessageRenderer",
+            "liveChatBannerHeaderRenderer",
+            "liveChatTextMessageRenderer",
         ]
     }
     _KNOWN_REMOVE_BANNER_TYPES = {"removeBannerForLiveChatCommand": ["removeBanner"]}  # targetActionId
@@ -130,7 +144,68 @@ class ChatDownloader:
         **_KNOWN_IGNORE_ACTION_TYPES,
     }
 
-    _KNOWN_IGNORE_MESSAGE_TYPES = ["liveChatPlaceholderItemRenderer"]
+    # Action handlers, each returns the original item, the original message type, and the parsed data
+    def _handle_item_action(self, action_type: str, action: dict, data: dict, offset: Optional[int]):
+        original_item = complex_walk(action, f"{action_type}.item") or {}
+        original_message_type = try_get_first_key(original_item)
+        return original_item, original_message_type, YoutubeChatParser.parse_item(original_item, data, offset)
+
+    def _handle_remove_action(self, action_type: str, action: dict, data: dict, offset: Optional[int]):
+        if action_type == "markChatItemAsDeletedAction":
+            original_message_type = "deletedMessage"
+        else:  # markChatItemsByAuthorAsDeletedAction
+            original_message_type = "banUser"
+        return action, original_message_type, YoutubeChatParser.parse_item(action, data, offset)
+
+    def _handle_replace_action(self, action_type: str, action: dict, data: dict, offset: Optional[int]):
+        original_item = complex_walk(action, f"{action_type}.replacementItem") or {}
+        original_message_type = try_get_first_key(original_item)
+        return original_item, original_message_type, YoutubeChatParser.parse_item(original_item, data, offset)
+
+    def _handle_tooltip_action(self, action_type: str, action: dict, data: dict, offset: Optional[int]):
+        original_item = complex_walk(action, f"{action_type}.tooltip") or {}
+        original_message_type = try_get_first_key(original_item)
+        return original_item, original_message_type, YoutubeChatParser.parse_item(original_item, data, offset)
+
+    def _handle_add_banner_action(self, action_type: str, action: dict, data: dict, offset: Optional[int]):
+        original_item = complex_walk(action, f"{action_type}.bannerRenderer")
+        if not original_item:
+            self.logger.debug(
+                "No bannerRenderer item\n" f"Action type: {action_type}\n" f"Action: {action}\n" f"Parsed data: {data}"
+            )
+            return {}, None, data
+
+        original_message_type = try_get_first_key(original_item)
+
+        header = original_item[original_message_type].get("header")
+        parsed_header = YoutubeChatParser.parse_item(header, offset=offset)
+        header_message = parsed_header.get("message")
+
+        contents = original_item[original_message_type].get("contents")
+        parsed_contents = YoutubeChatParser.parse_item(contents, offset=offset)
+
+        data.update(parsed_header)
+        data.update(parsed_contents)
+        data["header_message"] = header_message
+        return original_item, original_message_type, data
+
+    def _handle_remove_banner_action(self, action_type: str, action: dict, data: dict, offset: Optional[int]):
+        return action, "removeBanner", YoutubeChatParser.parse_item(action, data, offset)
+
+    # Action type -> handler, so every action is dispatched with a single lookup
+    _ACTION_HANDLERS: Dict[str, Callable[..., Tuple[dict, Optional[str], dict]]] = {
+        **dict.fromkeys(_KNOWN_ITEM_ACTION_TYPES, _handle_item_action),
+        **dict.fromkeys(_KNOWN_REMOVE_ACTION_TYPES, _handle_remove_action),
+        **dict.fromkeys(_KNOWN_REPLACE_ACTION_TYPES, _handle_replace_action),
+        **dict.fromkeys(_KNOWN_TOOLTIP_ACTION_TYPES, _handle_tooltip_action),
+        **dict.fromkeys(_KNOWN_ADD_BANNER_TYPES, _handle_add_banner_action),
+        **dict.fromkeys(_KNOWN_REMOVE_BANNER_TYPES, _handle_remove_banner_action),
+    }
+    _KNOWN_ACTION_MESSAGE_TYPES = {
+        action_type: frozenset(message_types) for action_type, message_types in _KNOWN_ACTION_TYPES.items()
+    }
+
+    _KNOWN_IGNORE_MESSAGE_TYPES = frozenset(["liveChatPlaceholderItemRenderer"])
     _KEYS_TO_IGNORE = [
         # to actually ignore
         "contextMenuAccessibility",
@@ -170,28 +245,23 @@ class ChatDownloader:
     ]
 
     async def create(self):
-        cookie_path = await find_cookies_file()
+        if self.http is None:
+            self.http = HTTPClientManager()
         header = {
             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/86.0.4240.111 Safari/537.36",  # noqa
             "Accept-Language": "en-US, en, *",
         }
-        self.session = aiohttp.ClientSession(headers=header)
-        if cookie_path is not None:
-            self.logger.info("Loading cookies from %s", cookie_path)
-            async with aiofiles.open(cookie_path, "r") as fp:
-                cookies_str = await fp.read()
-            try:
-                cookie_jar = parse_cookie_to_morsel(cookies_str)
-            except ValueError:
-                self.logger.error("Invalid Netscape Cookie File, ignoring cookies!")
-
-            for name, cookie in cookie_jar.items():
-                self.session.cookie_jar.update_cookies({name: cookie})
-            self.logger.info("Loaded %d cookies", len(cookie_jar))
+        self.session = self.http.create_session(headers=header)
+        cookie_jar = await self.http.load_cookies()
+        if cookie_jar:
+            self.session.cookie_jar.update_cookies(cookie_jar)
+            self.logger.info("Using %d cookies", len(cookie_jar))
 
     async def close(self):
         if self.session and not self.session.closed:
             await self.session.close()
+        if self._own_http and self.http is not None:
+            await self.http.close()
 
     async def _session_get(self, url: str, **kwargs):
         async with self.session.get(url, **kwargs) as resp:
@@ -222,9 +292,7 @@ class ChatDownloader:
             morsel_sapis["path"] = "/"
             self.session.cookie_jar.update_cookies({"SAPISID": morsel_sapis})
 
-        sapisid_hash = hashlib.sha1(
-            f"{time_now} {sapisid_cookie} https://www.youtube.com".encode("utf-8")
-        ).hexdigest()
+        sapisid_hash = hashlib.sha1(f"{time_now} {sapisid_cookie} https://www.youtube.com".encode("utf-8")).hexdigest()
         return f"SAPISIDHASH {time_now}_{sapisid_hash}"
 
     def _extract_account_syncid(self, ytcfg):
@@ -353,126 +421,11 @@ class ChatDownloader:
 
             actions = info.get("actions", [])
             if actions:
+                # Checked once per batch so the diagnostic is skipped entirely when DEBUG is off
+                debug = self.logger.isEnabledFor(logging.DEBUG)
                 for action in actions:
-                    data = {}
-
-                    # if it is a replay chat item action, must re-base it
-                    replay_chat_item_action = action.get("replayChatItemAction")
-                    if replay_chat_item_action:
-                        offset_time = replay_chat_item_action.get("videoOffsetTimeMsec")
-                        if offset_time:
-                            data["time_in_seconds"] = float(offset_time) / 1000
-
-                        action = replay_chat_item_action["actions"][0]
-
-                    action.pop("clickTrackingParams", None)
-                    original_action_type = try_get_first_key(action)
-
-                    data["action_type"] = camel_case_split(
-                        remove_suffixes(original_action_type, ("Action", "Command"))
-                    )
-
-                    original_message_type = None
-                    original_item = {}
-
-                    # We now parse the info and get the message
-                    # type based on the type of action
-                    if original_action_type in self._KNOWN_ITEM_ACTION_TYPES:
-                        original_item = complex_walk(action, f"{original_action_type}.item")
-
-                        original_message_type = try_get_first_key(original_item)
-                        data = YoutubeChatParser.parse_item(original_item, data, offset)
-                    elif original_action_type in self._KNOWN_REMOVE_ACTION_TYPES:
-                        original_item = action
-                        if original_action_type == "markChatItemAsDeletedAction":
-                            original_message_type = "deletedMessage"
-                        else:  # markChatItemsByAuthorAsDeletedAction
-                            original_message_type = "banUser"
-
-                        data = YoutubeChatParser.parse_item(original_item, data, offset)
-                    elif original_action_type in self._KNOWN_REPLACE_ACTION_TYPES:
-                        original_item = complex_walk(action, f"{original_action_type}.replacementItem")
-
-                        original_message_type = try_get_first_key(original_item)
-                        data = YoutubeChatParser.parse_item(original_item, data, offset)
-                    elif original_action_type in self._KNOWN_TOOLTIP_ACTION_TYPES:
-                        original_item = complex_walk(action, f"{original_action_type}.tooltip")
-
-                        original_message_type = try_get_first_key(original_item)
-                        data = YoutubeChatParser.parse_item(original_item, data, offset)
-                    elif original_action_type in self._KNOWN_ADD_BANNER_TYPES:
-                        original_item = complex_walk(action, f"{original_action_type}.bannerRenderer")
-
-                        if original_item:
-                            original_message_type = try_get_first_key(original_item)
-
-                            header = original_item[original_message_type].get("header")
-                            parsed_header = YoutubeChatParser.parse_item(header, offset=offset)
-                            header_message = parsed_header.get("message")
-
-                            contents = original_item[original_message_type].get("contents")
-                            parsed_contents = YoutubeChatParser.parse_item(contents, offset=offset)
-
-                            data.update(parsed_header)
-                            data.update(parsed_contents)
-                            data["header_message"] = header_message
-                        else:
-                            self.logger.debug(
-                                "No bannerRenderer item\n"
-                                f"Action type: {original_action_type}\n"
-                                f"Action: {action}\n"
-                                f"Parsed data: {data}"
-                            )
-                    elif original_action_type in self._KNOWN_REMOVE_BANNER_TYPES:
-                        original_item = action
-                        original_message_type = "removeBanner"
-                        data = self._parse_item(original_item, data, offset)
-                    elif original_action_type in self._KNOWN_IGNORE_ACTION_TYPES:
-                        continue
-                    else:
-                        self.logger.debug(f"Unknown action: {original_action_type}\n{action}\n{data}")
-
-                    test_for_missing_keys = original_item.get(original_message_type, {}).keys()
-                    missing_keys = test_for_missing_keys - self._KNOWN_KEYS
-
-                    if not data:
-                        self.logger.debug(
-                            f"Parse of action returned empty results: {original_action_type}\n{action}"
-                        )
-
-                    if missing_keys:
-                        self.logger.debug(
-                            f"Missing keys found: {missing_keys}\n"
-                            f"Message type: {original_message_type}\n"
-                            f"Action type: {original_action_type}\n"
-                            f"Action: {action}\n"
-                            f"Parsed data: {data}"
-                        )
-
-                    if original_message_type:
-                        new_index = remove_prefixes(original_message_type, "liveChat")
-                        new_index = remove_suffixes(new_index, "Renderer")
-                        data["message_type"] = camel_case_split(new_index)
-
-                        # TODO add option to keep placeholder items
-                        if original_message_type in self._KNOWN_IGNORE_MESSAGE_TYPES:
-                            continue
-                            # skip placeholder items
-                        elif original_message_type not in self._KNOWN_ACTION_TYPES[original_action_type]:
-                            self.logger.debug(
-                                f'Unknown message type "{original_message_type}"\n'
-                                f"New message type: {data['message_type']}\n"
-                                f"Action: {action}\n"
-                                f"Parsed data: {data}"
-                            )
-
-                    else:
-                        # Ignore
-                        self.logger.debug(
-                            f"No message type found for action: {original_action_type}\n"
-                            f"Action: {action}\n"
-                            f"Parsed data: {data}"
-                        )
+                    data = self._parse_action(action, offset, debug)
+                    if data is None:
                         continue
 
                     if is_replay:
@@ -508,9 +461,9 @@ class ChatDownloader:
                     # set new chat continuation
                     # overwrite if there is continuation data
                     continuation = continuation_info.get("continuation")
-                    click_tracking_params = continuation_info.get(
-                        "clickTrackingParams"
-                    ) or continuation_info.get("trackingParams")
+                    click_tracking_params = continuation_info.get("clickTrackingParams") or continuation_info.get(
+                        "trackingParams"
+                    )
                     # there is a chat continuation
                     no_continuation = False
                 elif continuation_key in self._KNOWN_SEEK_CONTINUATIONS:
@@ -532,6 +485,78 @@ class ChatDownloader:
             if first_time:
                 first_time = False
 
+    def _parse_action(self, action: Dict[str, Any], offset: Optional[int], debug: bool = False):
+        """
+        Parse a single chat action, returns None if the action should be skipped.
+        Set debug to True to log every unknown action, message type, and keys.
+        """
+        data = {}
+
+        # if it is a replay chat item action, must re-base it
+        replay_chat_item_action = action.get("replayChatItemAction")
+        if replay_chat_item_action:
+            offset_time = replay_chat_item_action.get("videoOffsetTimeMsec")
+            if offset_time:
+                data["time_in_seconds"] = float(offset_time) / 1000
+
+            action = replay_chat_item_action["actions"][0]
+
+        action.pop("clickTrackingParams", None)
+        original_action_type = try_get_first_key(action)
+        if original_action_type in self._KNOWN_IGNORE_ACTION_TYPES:
+            return None
+
+        data["action_type"] = normalize_action_type(original_action_type)
+
+        # We now parse the info and get the message type based on the type of action
+        handler = self._ACTION_HANDLERS.get(original_action_type)
+        if handler is not None:
+            original_item, original_message_type, data = handler(self, original_action_type, action, data, offset)
+        else:
+            original_item, original_message_type = {}, None
+            if debug:
+                self.logger.debug(f"Unknown action: {original_action_type}\n{action}\n{data}")
+
+        if debug:
+            test_for_missing_keys = original_item.get(original_message_type, {}).keys()
+            missing_keys = test_for_missing_keys - self._KNOWN_KEYS
+
+            if not data:
+                self.logger.debug(f"Parse of action returned empty results: {original_action_type}\n{action}")
+
+            if missing_keys:
+                self.logger.debug(
+                    f"Missing keys found: {missing_keys}\n"
+                    f"Message type: {original_message_type}\n"
+                    f"Action type: {original_action_type}\n"
+                    f"Action: {action}\n"
+                    f"Parsed data: {data}"
+                )
+
+        if not original_message_type:
+            # Ignore
+            if debug:
+                self.logger.debug(
+                    f"No message type found for action: {original_action_type}\n"
+                    f"Action: {action}\n"
+                    f"Parsed data: {data}"
+                )
+            return None
+
+        data["message_type"] = normalize_message_type(original_message_type)
+        # TODO add option to keep placeholder items
+        if original_message_type in self._KNOWN_IGNORE_MESSAGE_TYPES:
+            # skip placeholder items
+            return None
+        if debug and original_message_type not in self._KNOWN_ACTION_MESSAGE_TYPES.get(original_action_type, ()):
+            self.logger.debug(
+                f'Unknown message type "{original_message_type}"\n'
+                f"New message type: {data['message_type']}\n"
+                f"Action: {action}\n"
+                f"Parsed data: {data}"
+            )
+        return data
+
     async def _validate_result(self, chat_info: ChatDetails):
         if not chat_info.continuations:
             playability_status = chat_info.player_response.get("playabilityStatus", {})
@@ -604,9 +629,7 @@ class ChatDownloader:
                 else:
                     raise NoChatReplay(error_message)
 
-    async def _actually_start(
-        self, chat_info: ChatDetails, writer: JSONWriter, start_at: Optional[int] = None
-    ):
+    async def _actually_start(self, chat_info: ChatDetails, writer: JSONWriter, start_at: Optional[int] = None):
         try:
             async for event, chat in self._iterate_chat(chat_info, start_at):
                 if event == ChatEvent.data:
@@ -77,10 +77,27 @@ class ChatDownloaderManager(InternalSignalHandler):
         if last_timestamp is not None and not isinstance(last_timestamp, (int, float)):
             last_timestamp = float_or_none(last_timestamp)
         force_rewrite = map_to_boolean(context.get("force", False))
-        chat_downloader = ChatDownloader(video.id)
+        chat_downloader = ChatDownloader(video.id, app.http)
         filename = video.filename + ".chat.json"
-        jwriter = JSONWriter(filename, force_rewrite)
+        jwriter = JSONWriter(
+            filename,
+            force_rewrite,
+            compression=app.config.VTHELL_CHAT_COMPRESSION,
+            level=app.config.VTHELL_CHAT_COMPRESSION_LEVEL,
+        )
         await jwriter.init()
+        if jwriter.resumed:
+            # The stream is cut back to what the index committed, so anything the caller
+            # read past that is gone and we need to continue from the index instead.
+            if last_timestamp != jwriter.last_timestamp:
+                logger.debug(
+                    "Ignoring last timestamp %s for %s, using the index %s",
+                    last_timestamp,
+                    video.id,
+                    jwriter.last_timestamp,
+                )
+            last_timestamp = jwriter.last_timestamp
+            logger.info("Resuming chat for %s from %d saved messages", video.id, jwriter.count)
         ChatManager._actives[video.id] = chat_downloader
         is_async_cancel = False
         chat_job, _ = await VTHellJobChatTemporary.get_or_create(
@@ -97,7 +114,8 @@ class ChatDownloaderManager(InternalSignalHandler):
         await chat_downloader.close()
         await jwriter.close()
         if not is_async_cancel:
-            logger.info("Chat downloader for %s finished, sending upload signal", video.id)
+            total = await jwriter.finalize()
+            logger.info("Chat downloader for %s finished with %d messages, sending upload signal", video.id, total)
             await app.dispatch("internals.chat.uploader", context={"job": chat_job, "app": app})
         else:
             logger.info("Chat downloader for %s was cancelled", video.id)
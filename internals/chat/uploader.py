@@ -27,24 +27,32 @@ from __future__ import annotations
 import asyncio
 import logging
 import os
-from pathlib import Path
 from typing import TYPE_CHECKING, Any, Dict
 
+from internals.chat.writer import JSONWriter, find_chat_archive
 from internals.db import VTHellJobChatTemporary
 from internals.struct import InternalSignalHandler
-from internals.utils import build_rclone_path
+from internals.utils import build_rclone_path, read_stream_lines, read_stream_tail
 
 if TYPE_CHECKING:
     from internals.vth import SanicVTHell
 
 __all__ = ("ChatDownloaderUploaderReceiver",)
 logger = logging.getLogger("ChatJob.Uploader")
-CHATDUMP_PATH = Path(__file__).absolute().parent.parent.parent / "chatarchive"
 
 
 async def upload_files(data: VTHellJobChatTemporary, app: SanicVTHell):
-    final_output = CHATDUMP_PATH / data.filename
-    if not final_output.exists():
+    jwriter = JSONWriter(
+        data.filename,
+        compression=app.config.VTHELL_CHAT_COMPRESSION,
+        level=app.config.VTHELL_CHAT_COMPRESSION_LEVEL,
+    )
+    if jwriter.stream_path.exists():
+        # The downloader stopped before converting the stream, do it now
+        logger.info(f"[{data.id}] Converting chat stream into the final archive")
+        await jwriter.finalize()
+    final_output = find_chat_archive(data.filename)
+    if final_output is None:
         logger.warning(f"[{data.id}] chat dump not found, skipping")
         await data.delete()
         return
@@ -59,32 +67,26 @@ async def upload_files(data: VTHellJobChatTemporary, app: SanicVTHell):
 
     rclone_args = [app.config.RCLONE_PATH, "-v", "-P", "copy", str(final_output), target_folder]
     logger.debug(f"[{data.id}] Starting rclone with args: {rclone_args}")
-    rclone_process = await asyncio.create_subprocess_exec(
-        *rclone_args, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+    rclone_process = await app.supervisor.spawn(
+        data.id, "rclone", *rclone_args, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
     )
     error_line = ""
-    while True:
-        try:
-            async for line in rclone_process.stdout:
-                line = line.decode("utf-8").rstrip()
-                logger.debug(f"[{data.id}] rclone: {line}")
-                if "error" in line.lower():
-                    error_line = line
-                elif "failed to copy" in line.lower():
-                    error_line = line
-        except Exception:
-            logger.debug(f"[{data.id}] rclone buffer exceeded, silently ignoring...")
-            continue
-        else:
-            break
+    stderr_task = app.loop.create_task(read_stream_tail(rclone_process.stderr))
+    async for line in read_stream_lines(rclone_process.stdout):
+        logger.debug(f"[{data.id}] rclone: {line}")
+        if "error" in line.lower():
+            error_line = line
+        elif "failed to copy" in line.lower():
+            error_line = line
 
     await rclone_process.wait()
+    stderr = await stderr_task
     ret_code = rclone_process.returncode
     if ret_code != 0:
         logger.error(
             f"[{data.id}] rclone exited with code {ret_code}, aborting uploading please do manual upload later!"
         )
-        logger.error(error_line)
+        logger.error(error_line or stderr)
         return
     await data.delete()
 
@@ -23,6 +23,7 @@ SOFTWARE.
 """
 
 import re
+from functools import lru_cache
 from typing import Any, Optional
 
 import pendulum
@@ -57,8 +58,12 @@ def int_or_none(number: int, default: Optional[Any] = None):
         return default
 
 
+_CAMEL_CASE_RE = re.compile(r"[A-Z]?[a-z]+|[A-Z]+(?=[A-Z]|$)")
+
+
+@lru_cache(maxsize=1024)
 def camel_case_split(word):
-    return "_".join(re.findall(r"[A-Z]?[a-z]+|[A-Z]+(?=[A-Z]|$)", word)).lower()
+    return "_".join(_CAMEL_CASE_RE.findall(word)).lower()
 
 
 def wrap_as_list(item):
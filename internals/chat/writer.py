@@ -25,82 +25,292 @@ SOFTWARE.
 from __future__ import annotations
 
 import asyncio
+import gzip
 import os
 from pathlib import Path
-from typing import TYPE_CHECKING, Any
+from typing import TYPE_CHECKING, Any, BinaryIO, Dict, Literal, Optional
 
 import aiofiles
 import orjson
 
 if TYPE_CHECKING:
-    from aiofiles.threadpool.binary import AsyncBufferedReader
+    from aiofiles.threadpool.binary import AsyncBufferedIOBase
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
 
 SAVE_PATH = Path(__file__).absolute().parent.parent.parent / "chatarchive"
+ChatCompression = Literal["none", "gzip", "zstd"]
+# The suffix added to the final archive, and the level used when it's set to 0
+COMPRESSION_SUFFIXES = {"none": "", "gzip": ".gz", "zstd": ".zst"}
+COMPRESSION_DEFAULT_LEVEL = {"none": 0, "gzip": 6, "zstd": 10}
+
+__all__ = (
+    "JSONWriter",
+    "COMPRESSION_SUFFIXES",
+    "find_chat_archive",
+    "has_zstandard",
+)
+
+
+def has_zstandard():
+    return zstandard is not None
+
+
+def find_chat_archive(file_name: str) -> Optional[Path]:
+    """Find the finished archive of a chat, compressed or not"""
+    for suffix in COMPRESSION_SUFFIXES.values():
+        archive_path = SAVE_PATH / (file_name + suffix)
+        if archive_path.exists():
+            return archive_path
+    return None
+
+
+def _open_compressed(path: Path, compression: ChatCompression, level: int) -> BinaryIO:
+    if compression == "gzip":
+        return gzip.open(path, "wb", compresslevel=level)
+    if compression == "zstd":
+        compressor = zstandard.ZstdCompressor(level=level)
+        return compressor.stream_writer(path.open("wb"))
+    return path.open("wb")
+
+
+def _multiline_indent(text: bytes):
+    padding = 2 * b" "
+    return b"".join(map(lambda x: padding + x, text.splitlines(True)))
+
+
+def _stream_to_json_array(source: Path, target: Path, compression: ChatCompression = "none", level: int = 0):
+    """
+    Convert a newline-delimited JSON file into a pretty JSON array, line by line.
+    The output goes through the compressor as it's written, if there is one.
+    The target is written to a temporary file first then replaced.
+    """
+    temp_target = target.with_name(target.name + ".tmp")
+    total = 0
+    with source.open("rb") as src, _open_compressed(temp_target, compression, level) as dst:
+        dst.write(b"[")
+        for line in src:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                item = orjson.loads(line)
+            except orjson.JSONDecodeError:
+                # Partially written line from a crash, skip it
+                continue
+            dst.write(b",\n" if total > 0 else b"\n")
+            dst.write(_multiline_indent(orjson.dumps(item, option=orjson.OPT_INDENT_2)))
+            total += 1
+        dst.write(b"\n]" if total > 0 else b"]")
+    os.replace(temp_target, target)
+    return total
+
+
+def _json_array_to_stream(source: Path, target: Path):
+    """Convert the old JSON array archive into newline-delimited JSON"""
+    try:
+        previous_items = orjson.loads(source.read_bytes())
+    except orjson.JSONDecodeError:
+        previous_items = []
+    if not isinstance(previous_items, list):
+        previous_items = []
+    with target.open("wb") as dst:
+        for previous in previous_items:
+            dst.write(orjson.dumps(previous) + b"\n")
+
+
+def _get_timestamp(item: Any):
+    if isinstance(item, dict):
+        return item.get("timestamp")
+    return None
+
+
+def _read_index(path: Path) -> Optional[Dict[str, Any]]:
+    try:
+        index = orjson.loads(path.read_bytes())
+    except (OSError, orjson.JSONDecodeError):
+        return None
+    if not isinstance(index, dict) or not isinstance(index.get("size"), int):
+        return None
+    return index
+
+
+def _write_index(path: Path, index: Dict[str, Any]):
+    temp_path = path.with_name(path.name + ".tmp")
+    temp_path.write_bytes(orjson.dumps(index))
+    os.replace(temp_path, path)
+
+
+def _scan_stream(path: Path) -> Dict[str, Any]:
+    """
+    Rebuild the index of a stream that does not have one, line by line.
+    Anything after the last complete message is cut off.
+    """
+    size = count = 0
+    first_timestamp = last_timestamp = None
+    with path.open("rb+") as fp:
+        for line in fp:
+            if not line.endswith(b"\n"):
+                break
+            try:
+                item = orjson.loads(line)
+            except orjson.JSONDecodeError:
+                break
+            timestamp = _get_timestamp(item)
+            if first_timestamp is None:
+                first_timestamp = timestamp
+            if timestamp is not None:
+                last_timestamp = timestamp
+            size += len(line)
+            count += 1
+        fp.truncate(size)
+    return {"size": size, "count": count, "first_timestamp": first_timestamp, "last_timestamp": last_timestamp}
+
 
-__all__ = ("JSONWriter",)
+def _prepare_resume(stream_path: Path, index_path: Path) -> Dict[str, Any]:
+    """
+    Make the stream consistent with its index so we can append to it again.
+
+    The index is written after every flush, so anything past the indexed size is
+    a batch that was cut off halfway and will be fetched again on resume.
+    """
+    index = _read_index(index_path)
+    stream_size = stream_path.stat().st_size
+    if index is None or index["size"] > stream_size:
+        index = _scan_stream(stream_path)
+        _write_index(index_path, index)
+    elif index["size"] < stream_size:
+        os.truncate(stream_path, index["size"])
+    return index
 
 
 class JSONWriter:
-    def __init__(self, file_name: str, overwrite: bool = True) -> None:
+    """
+    Write chat messages as newline-delimited JSON into ``<name>.jsonl``
+
+    Messages are kept in a small in-memory buffer and written out on :meth:`flush`
+    or when the buffer grows past :attr:`BUFFER_SIZE`. The JSON array that we
+    upload is only produced on :meth:`finalize`.
+
+    Every flush also rewrites a small index next to the stream (``<name>.jsonl.idx``)
+    with the committed size, message count, and first/last timestamp. Resuming
+    only needs to read that index and append, the body is never parsed.
+    """
+
+    BUFFER_SIZE = 256 * 1024
+
+    def __init__(
+        self, file_name: str, overwrite: bool = True, compression: ChatCompression = "none", level: int = 0
+    ) -> None:
         if not file_name.endswith(".json"):
             file_name += ".json"
+        if compression == "zstd" and zstandard is None:
+            compression = "gzip"
         self.filename = file_name
         self.save_path = SAVE_PATH / file_name
+        self.compression = compression
+        self.level = level or COMPRESSION_DEFAULT_LEVEL[compression]
+        self.archive_path = SAVE_PATH / (file_name + COMPRESSION_SUFFIXES[compression])
+        self.stream_path = SAVE_PATH / (file_name + "l")
+        self.index_path = SAVE_PATH / (file_name + "l.idx")
         self.overwrite = overwrite
-        self.file: AsyncBufferedReader = None
+        self.file: AsyncBufferedIOBase = None
+        self._buffer = bytearray()
         self._is_closed: bool = True
+        # True if init() continued an existing stream, the index is then the only source of truth
+        self.resumed: bool = False
+
+        self.size: int = 0
+        self.count: int = 0
+        self.first_timestamp: Optional[int] = None
+        self.last_timestamp: Optional[int] = None
+        self._buffer_count: int = 0
+        self._buffer_first_timestamp: Optional[int] = None
+        self._buffer_last_timestamp: Optional[int] = None
 
     @property
     def closed(self):
         return self._is_closed
 
+    @classmethod
+    def read_index(cls, file_name: str) -> Optional[Dict[str, Any]]:
+        """Read the index of an unfinished chat stream, returns None if there is none"""
+        if not file_name.endswith(".json"):
+            file_name += ".json"
+        return _read_index(SAVE_PATH / (file_name + "l.idx"))
+
     async def init(self):
         loop = asyncio.get_event_loop()
         await loop.run_in_executor(None, self.save_path.parent.mkdir, 0o777, True, True)
-        await loop.run_in_executor(None, self.save_path.touch)
-        previous_items = []
-        file = await aiofiles.open(str(self.save_path), "rb+")
-        self.file = file
-        self._is_closed = False
+        mode = "wb"
         if not self.overwrite:
-            load_data = await file.read()
-            try:
-                previous_items = orjson.loads(load_data)
-            except orjson.JSONDecodeError:
-                pass
-
-        await file.truncate(0)
-        for previous in previous_items:
-            await self.write(previous)
+            mode = "ab"
+            if not self.stream_path.exists() and self.save_path.exists():
+                # Resume from an archive written by the old array writer
+                await loop.run_in_executor(None, _json_array_to_stream, self.save_path, self.stream_path)
+            if self.stream_path.exists():
+                index = await loop.run_in_executor(None, _prepare_resume, self.stream_path, self.index_path)
+                self.resumed = True
+                self.size = index["size"]
+                self.count = index.get("count", 0)
+                self.first_timestamp = index.get("first_timestamp")
+                self.last_timestamp = index.get("last_timestamp")
+        self.file = await aiofiles.open(str(self.stream_path), mode)
+        self._is_closed = False
+        if mode == "wb":
+            await loop.run_in_executor(None, _write_index, self.index_path, self.index)
 
-    def _multiline_indent(self, text):
-        padding = 2 * " "
-        return "".join(map(lambda x: padding + x, text.splitlines(True)))
+    @property
+    def index(self) -> Dict[str, Any]:
+        return {
+            "size": self.size,
+            "count": self.count,
+            "first_timestamp": self.first_timestamp,
+            "last_timestamp": self.last_timestamp,
+        }
 
     async def close(self):
         if self.file and not self.closed:
-            await self.file.flush()
+            await self.flush()
             await self.file.close()
+            self._is_closed = True
 
     async def flush(self):
+        if self.closed:
+            return
+        if not self._buffer:
+            await self.file.flush()
+            return
+        to_write = bytes(self._buffer)
+        self._buffer.clear()
+        await self.file.write(to_write)
         await self.file.flush()
 
-    async def _actual_write(self, item: Any, flush: bool = False):
-        await self.file.seek(0, os.SEEK_END)
-
-        to_write = orjson.dumps(item, option=orjson.OPT_INDENT_2).decode("utf-8")
-        to_write = "\n" + self._multiline_indent(to_write)
-
-        if await self.file.tell() == 0:
-            await self.file.write("[".encode("utf-8"))
-        else:
-            await self.file.seek(-2, os.SEEK_END)
-            await self.file.write(", ".encode("utf-8"))
+        self.size += len(to_write)
+        self.count += self._buffer_count
+        if self.first_timestamp is None:
+            self.first_timestamp = self._buffer_first_timestamp
+        if self._buffer_last_timestamp is not None:
+            self.last_timestamp = self._buffer_last_timestamp
+        self._buffer_count = 0
+        self._buffer_first_timestamp = self._buffer_last_timestamp = None
+        # Only written after the data itself, so the index never points past the stream
+        await asyncio.get_event_loop().run_in_executor(None, _write_index, self.index_path, self.index)
 
-        await self.file.write(to_write.encode("utf-8"))
-        await self.file.write("\n]".encode("utf-8"))
+    async def _actual_write(self, item: Any, flush: bool = False):
+        self._buffer += orjson.dumps(item)
+        self._buffer += b"\n"
+        self._buffer_count += 1
+        timestamp = _get_timestamp(item)
+        if timestamp is not None:
+            if self._buffer_first_timestamp is None:
+                self._buffer_first_timestamp = timestamp
+            self._buffer_last_timestamp = timestamp
 
-        if flush:
+        if flush or len(self._buffer) >= self.BUFFER_SIZE:
             await self.flush()
 
     async def write(self, item: Any, flush: bool = False):
@@ -109,3 +319,23 @@ class JSONWriter:
             await self._actual_write(item, flush)
         except asyncio.CancelledError:
             await self.close()
+
+    async def finalize(self):
+        """
+        Convert the newline-delimited stream into the final JSON array file at :attr:`archive_path`,
+        compressed if it's enabled. The stream file is removed afterwards, returns the amount of converted messages.
+        """
+        await self.close()
+        if not self.stream_path.exists():
+            return 0
+        loop = asyncio.get_event_loop()
+        total = await loop.run_in_executor(
+            None, _stream_to_json_array, self.stream_path, self.archive_path, self.compression, self.level
+        )
+        await loop.run_in_executor(None, os.remove, str(self.stream_path))
+        if self.index_path.exists():
+            await loop.run_in_executor(None, os.remove, str(self.index_path))
+        if self.archive_path != self.save_path and self.save_path.exists():
+            # Leftover from resuming an old uncompressed archive
+            await loop.run_in_executor(None, os.remove, str(self.save_path))
+        return total
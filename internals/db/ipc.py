@@ -29,7 +29,7 @@ from __future__ import annotations
 import asyncio
 import logging
 from pathlib import Path
-from typing import TYPE_CHECKING, Any, Dict, Optional, Union
+from typing import TYPE_CHECKING, Any, Callable, Coroutine, Dict, List, Optional, Union
 
 import orjson
 import pendulum
@@ -40,6 +40,8 @@ from internals.ws import WebSocketPacket
 if TYPE_CHECKING:
     from internals.vth import SanicVTHell
 
+    IPCEventCallback = Callable[[Optional[Any]], Coroutine[Any, Any, None]]
+
 
 BASE_PATH = Path(__file__).absolute().parent.parent.parent
 __all__ = ("IPCServerClientBridge", "IPCConnection")
@@ -112,6 +114,8 @@ class IPCConnection:
                     logger.debug("Got IPC event from server %s, rebroadcasting to WS emitter", packet.event)
                     event_name = packet.event[3:]
                     await self._app.wshandler.emit(event_name, packet.data)
+                elif self._app.ipc is not None:
+                    await self._app.ipc.dispatch(packet.event, packet.data)
         except asyncio.CancelledError:
             return
 
@@ -191,6 +195,7 @@ class IPCConnection:
         sid = self._id
         receive_task = asyncio.ensure_future(self._receiver())
         dispatch_task = asyncio.ensure_future(self._dispatcher())
+        listen_task = asyncio.ensure_future(self._listen_for_message())
         if isinstance(receive_task, asyncio.Task):
             receive_task.set_name(f"ipc-client_{sid}-receiver_task")
             receive_task.add_done_callback(self._closed_down_task)
@@ -199,9 +204,13 @@ class IPCConnection:
             dispatch_task.set_name(f"ipc-client_{sid}-dispatcher_task")
             dispatch_task.add_done_callback(self._closed_down_task)
             self._listener_tasks[f"ipc-client_{sid}-dispatcher_task"] = dispatch_task
+        if isinstance(listen_task, asyncio.Task):
+            listen_task.set_name(f"ipc-client_{sid}-listener_task")
+            listen_task.add_done_callback(self._closed_down_task)
+            self._listener_tasks[f"ipc-client_{sid}-listener_task"] = listen_task
 
         _, pending = await asyncio.wait(
-            [receive_task, dispatch_task],
+            [receive_task, dispatch_task, listen_task],
             return_when=asyncio.FIRST_COMPLETED,
         )
         logger.info("Stopping all IPC task for %s since it closed down.", sid)
@@ -217,6 +226,7 @@ class IPCServerClientBridge:
         self._app: Optional[SanicVTHell] = None
 
         self._connection_manager: Dict[str, IPCConnection] = {}
+        self._listener_callbacks: Dict[str, List[IPCEventCallback]] = {}
 
         self._extra_tasks: Dict[str, asyncio.Task] = {}
 
@@ -283,6 +293,23 @@ class IPCServerClientBridge:
         for conn in self._connection_manager.values():
             await conn.emit(event, data)
 
+    def on(self, event: str, handler: IPCEventCallback) -> None:
+        """Listen to a non-websocket IPC event"""
+        if event not in self._listener_callbacks:
+            self._listener_callbacks[event] = []
+        self._listener_callbacks[event].append(handler)
+
+    async def dispatch(self, event: str, data: Any):
+        callbacks = self._listener_callbacks.get(event, [])
+        if len(callbacks) < 1:
+            logger.debug("Got IPC event %s but no one is listening to it, dropping", event)
+            return
+        for callback in callbacks:
+            try:
+                await callback(data)
+            except Exception as exc:
+                logger.error("Failed to handle IPC event %s", event, exc_info=exc)
+
     def close(self):
         for conn in self._connection_manager.values():
             conn.close()
@@ -25,13 +25,21 @@ SOFTWARE.
 from __future__ import annotations
 
 from enum import Enum, IntEnum
-from typing import Optional, Type
+from typing import List, Optional, Type
 
 import orjson
 from tortoise import fields
 from tortoise.models import Model
 
-__all__ = ("VTHellJob", "VTHellAutoType", "VTHellAutoScheduler", "VTHellJobStatus", "VTHellJobChatTemporary")
+__all__ = (
+    "VTHellJob",
+    "VTHellAutoType",
+    "VTHellAutoScheduler",
+    "VTHellJobStatus",
+    "VTHellJobChatTemporary",
+    "VTHellJobCheckpoint",
+    "VTHellJobProcess",
+)
 
 
 def orjson_dumps(obj: object) -> bytes:
@@ -61,6 +69,11 @@ class VTHellJobStatus(str, Enum):
     # Cancelled, member locked stream, geo-locked, private, and more
     cancelled = "CANCELLED"
 
+    @classmethod
+    def except_for(cls: Type[VTHellJobStatus], *statuses: VTHellJobStatus) -> List[VTHellJobStatus]:
+        """Get every status except the provided one, useful for an indexed ``status__in`` query"""
+        return [status for status in cls if status not in statuses]
+
 
 class VTHellJob(Model):
     id = fields.CharField(pk=True, unique=True, index=True, max_length=128)
@@ -74,6 +87,31 @@ class VTHellJob(Model):
     last_status = fields.CharEnumField(VTHellJobStatus, null=True, max_length=24)
     error = fields.TextField(null=True)
 
+    class Meta:
+        indexes = (("status", "start_time"),)
+
+
+class VTHellJobCheckpoint(Model):
+    # Same as the job ID
+    id = fields.CharField(pk=True, unique=True, index=True, max_length=128)
+    # Partial download that has been kept, in order: [{"file": "...", "fragments": 0, "downloaded": 0}]
+    parts = fields.JSONField(null=False, default=list, encoder=orjson_dumps, decoder=orjson.loads)
+    # Progress of the current download attempt
+    fragments = fields.IntField(null=False, default=0)
+    downloaded = fields.BigIntField(null=False, default=0)
+    updated_at = fields.BigIntField(null=False, default=0)
+
+
+class VTHellJobProcess(Model):
+    id = fields.IntField(pk=True)
+    job_id = fields.CharField(null=False, index=True, max_length=128)
+    # ytarchive, ffmpeg, mkvmerge, rclone, and more
+    name = fields.CharField(null=False, max_length=24)
+    pid = fields.IntField(null=False)
+    # The full path or name of the executable, used to make sure the PID is not reused
+    executable = fields.TextField(null=False)
+    started_at = fields.BigIntField(null=False)
+
 
 class VTHellJobChatTemporary(Model):
     id = fields.CharField(pk=True, unique=True, index=True, max_length=128)
@@ -7,5 +7,8 @@ A simple implementation of Holodex API
 :license: MIT, see LICENSE for more details.
 """
 
+from .cache import *
 from .client import *
+from .mirror import *
 from .models import *
+from .transport import *
@@ -0,0 +1,144 @@
+"""
+MIT License
+
+Copyright (c) 2020-present noaione
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+from collections import OrderedDict
+from time import monotonic
+from typing import Any, Awaitable, Callable, Dict, Generic, Hashable, Optional, Tuple, TypeVar
+
+__all__ = ("HolodexCache",)
+
+logger = logging.getLogger("Internals.Holodex.Cache")
+T = TypeVar("T")
+
+
+class HolodexCache(Generic[T]):
+    """
+    A LRU cache with TTL for the Holodex API response.
+
+    Concurrent request for the same key will share a single upstream request (single-flight),
+    and the result is only cached if it's not None since that could be a failed request.
+    A ttl of 0 will disable the cache, but the request will still be coalesced.
+    """
+
+    def __init__(self, name: str, ttl: float, maxsize: int = 256):
+        self.name = name
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._data: OrderedDict[Hashable, Tuple[float, T]] = OrderedDict()
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def _get_fresh(self, key: Hashable) -> Tuple[bool, Optional[T]]:
+        cached = self._data.get(key)
+        if cached is None:
+            return False, None
+        expires_at, value = cached
+        if expires_at < monotonic():
+            del self._data[key]
+            return False, None
+        self._data.move_to_end(key)
+        return True, value
+
+    def get(self, key: Hashable) -> Tuple[bool, Optional[T]]:
+        """Get the cached value without fetching it, returns if it's found and the value"""
+        found, value = self._get_fresh(key)
+        if found:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return found, value
+
+    def set(self, key: Hashable, value: T):
+        if self.ttl <= 0 or self.maxsize <= 0:
+            return
+        self._data[key] = (monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, key: Hashable):
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+    async def _fetch(self, key: Hashable, fetcher: Callable[[], Awaitable[Optional[T]]]) -> Optional[T]:
+        try:
+            value = await fetcher()
+            if value is not None:
+                self.set(key, value)
+            return value
+        finally:
+            self._inflight.pop(key, None)
+
+    @staticmethod
+    def _consume_exception(task: asyncio.Future):
+        # Mark it as retrieved, every waiter might have been cancelled already.
+        if not task.cancelled():
+            task.exception()
+
+    async def get_or_fetch(self, key: Hashable, fetcher: Callable[[], Awaitable[Optional[T]]]) -> Optional[T]:
+        found, value = self._get_fresh(key)
+        if found:
+            self.hits += 1
+            return value
+        inflight = self._inflight.get(key)
+        if inflight is None:
+            self.misses += 1
+            # The fetch is owned by the cache and not by the first caller, so cancelling
+            # any caller (including the one that started it) never cancels it for the others.
+            inflight = asyncio.ensure_future(self._fetch(key, fetcher))
+            inflight.add_done_callback(self._consume_exception)
+            self._inflight[key] = inflight
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(inflight)
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses + self.coalesced
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "hit_ratio": (self.hits + self.coalesced) / total if total > 0 else 0.0,
+        }
+
+    def __repr__(self) -> str:
+        return f"<HolodexCache name={self.name} size={len(self._data)} hits={self.hits} misses={self.misses}>"
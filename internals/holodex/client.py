@@ -26,17 +26,22 @@ from __future__ import annotations
 
 import asyncio
 import logging
-from typing import TYPE_CHECKING, List, Optional, Type, Union
+from typing import TYPE_CHECKING, Any, AsyncIterator, Dict, List, Optional, Set, Type, Union
 
 import aiohttp
+import orjson
 import pendulum
 
 from ._types import HolodexPaginatedVideo
 from ._types import HolodexVideo as HolodexVideoPayload
 from ._types import HolodexVideoStatus
+from .cache import HolodexCache
+from .mirror import HolodexLiveDelta, HolodexLiveMirror
 from .models import HolodexVideo
+from .transport import HolodexTransport
 
 if TYPE_CHECKING:
+    from internals.httpclient import HTTPClientManager
     from internals.vth import SanicVTHell
 
 __all__ = ("HolodexAPI",)
@@ -46,12 +51,33 @@ logger = logging.getLogger("Internals.Holodex")
 
 class HolodexAPI:
     BASE = "https://holodex.net/api/v2/"
-
-    def __init__(self, api_key: Optional[str] = None, *, loop: Optional[asyncio.AbstractEventLoop] = None):
+    MAX_BATCH_IDS = 50
+
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        *,
+        loop: Optional[asyncio.AbstractEventLoop] = None,
+        video_ttl: float = 60,
+        channel_ttl: float = 300,
+        cache_size: int = 256,
+        page_concurrency: int = 4,
+        rate_limit: float = 4,
+        rate_burst: float = 10,
+        http: Optional[HTTPClientManager] = None,
+    ):
         self.api_key = api_key
+        self.http = http
         self._loop = loop or asyncio.get_event_loop()
+        self.video_cache: HolodexCache[HolodexVideo] = HolodexCache("video", video_ttl, cache_size)
+        self.channel_cache: HolodexCache[List[HolodexVideo]] = HolodexCache("channel", channel_ttl, cache_size)
+        self.page_concurrency = page_concurrency
+        self.rate_limit = rate_limit
+        self.rate_burst = rate_burst
 
         self.client: aiohttp.ClientSession = None
+        self.transport: HolodexTransport = None
+        self.lives = HolodexLiveMirror()
         self.__ready: bool = False
 
     @property
@@ -59,15 +85,17 @@ class HolodexAPI:
         return self.__ready
 
     async def create(self):
-        self.client = aiohttp.ClientSession(
-            loop=self._loop,
-            headers={
-                "Content-Type": "application/json",
-                "User-Agent": "VTHell/3.0.0 (+https://github.com/noaione/vthell)",
-            },
-        )
+        headers = {
+            "Content-Type": "application/json",
+            "User-Agent": "VTHell/3.0.0 (+https://github.com/noaione/vthell)",
+        }
+        if self.http is not None:
+            self.client = self.http.create_session(headers=headers)
+        else:
+            self.client = aiohttp.ClientSession(loop=self._loop, headers=headers)
         if self.api_key:
             self.client.headers.update({"X-APIKEY": self.api_key})
+        self.transport = HolodexTransport(self.client, self.rate_limit, self.rate_burst, loop=self._loop)
         self.__ready = True
 
     @staticmethod
@@ -77,30 +105,41 @@ class HolodexAPI:
         dt = pendulum.parse(date_time, tz="UTC")
         return dt.int_timestamp
 
-    async def get_channel_videos(self, channel_id: str):
+    async def get_channel_videos(self, channel_id: str, *, refresh: bool = False) -> List[HolodexVideo]:
+        if refresh:
+            self.channel_cache.invalidate(channel_id)
+        results = await self.channel_cache.get_or_fetch(channel_id, lambda: self._fetch_channel_videos(channel_id))
+        return results or []
+
+    async def _fetch_channel_videos(self, channel_id: str) -> Optional[List[HolodexVideo]]:
         params = {
             "limit": 50,
             "include": "live_info",
         }
         request_path = f"{self.BASE}channels/{channel_id}/videos"
-        async with self.client.get(request_path, params=params) as response:
-            if response.status != 200:
-                return []
-            response_json: List[HolodexVideoPayload] = await response.json()
+        response = await self.transport.request("channel_videos", request_path, params=params)
+        if response is None or response.status != 200:
+            return None
+        response_json: List[HolodexVideoPayload] = response.json()
+
+        return self._coerce_videos(response_json)
 
+    @classmethod
+    def _coerce_videos(cls: Type[HolodexAPI], videos: List[HolodexVideoPayload]) -> List[HolodexVideo]:
         coerced_data: List[HolodexVideo] = []
-        for video in response_json:
+        for video in videos:
             video_type = video.get("type")
             if video_type != "stream":
                 continue
-            start_time = self._convert_date_to_unix(video.get("start_actual"))
+            start_time = cls._convert_date_to_unix(video.get("start_actual"))
             if start_time is None:
-                start_time = self._convert_date_to_unix(video.get("start_scheduled"))
+                start_time = cls._convert_date_to_unix(video.get("start_scheduled"))
             channel_id = video.get("channel_id") or video.get("channel", {}).get("id")
             if channel_id is None:
                 continue
 
             org_group = video.get("channel", {}).get("org")
+
             video_url = f"https://youtube.com/watch?v={video['id']}"
             is_member = "member" in video.get("topic_id", "").lower()
             coerced_data.append(
@@ -115,7 +154,6 @@ class HolodexAPI:
                     is_member,
                 )
             )
-
         return coerced_data
 
     async def close(self):
@@ -128,7 +166,25 @@ class HolodexAPI:
             return int(number)
         return number
 
-    async def _get_videos_paginated(self, status: HolodexVideoStatus, endpoint: str):
+    async def _get_video_page(
+        self, endpoint: str, params: Dict[str, Any], offset: int
+    ) -> Optional[HolodexPaginatedVideo]:
+        page_params = {**params, "offset": offset}
+        response = await self.transport.request(endpoint, f"{self.BASE}{endpoint}", params=page_params)
+        if response is None or response.status != 200:
+            logger.error(f"Failed to get {endpoint} at offset {offset}: {response and response.status}")
+            return None
+        return response.json()
+
+    async def iter_videos_paginated(
+        self, status: Optional[HolodexVideoStatus], endpoint: str = "videos", concurrency: Optional[int] = None
+    ) -> AsyncIterator[HolodexVideo]:
+        """
+        Fetch every page of a paginated videos endpoint, and yield the video as soon as the page arrived.
+
+        The first page is fetched alone to know the total, the rest of the page is then fetched
+        concurrently (bounded by the concurrency), so the video is not yielded in order.
+        """
         sort_by = "available_at"
         if status == "upcoming":
             sort_by = "start_scheduled"
@@ -146,84 +202,159 @@ class HolodexAPI:
         }
         if status is not None:
             params["status"] = status
-        collected_videos: List[HolodexVideoPayload] = []
-        offset = 0
-        while True:
-            params["offset"] = offset
-            async with self.client.get(f"{self.BASE}{endpoint}", params=params) as response:
-                if response.status != 200:
-                    break
-                response_json: List[HolodexPaginatedVideo] = await response.json()
-
-            total_item = self.to_int(response_json.get("total", "0"))
-            if total_item < 1:
-                break
-
-            collected_videos.extend(response_json["items"])
-            offset += limitation + 1
-            if len(collected_videos) >= total_item:
-                break
-
-        return collected_videos
+        concurrency = max(concurrency or self.page_concurrency, 1)
+
+        first_page = await self._get_video_page(endpoint, params, 0)
+        if first_page is None:
+            return
+        total_item = self.to_int(first_page.get("total", "0"))
+        seen_ids: Set[str] = set()
+
+        def unseen_videos(page: HolodexPaginatedVideo):
+            # The pages might shift a bit while being fetched, so make sure it's not yielded twice
+            for video in self._coerce_videos(page.get("items", [])):
+                if video.id not in seen_ids:
+                    seen_ids.add(video.id)
+                    yield video
+
+        for video in unseen_videos(first_page):
+            yield video
+        if total_item <= limitation:
+            return
+
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def fetch_page(offset: int):
+            async with semaphore:
+                return await self._get_video_page(endpoint, params, offset)
+
+        tasks = [self._loop.create_task(fetch_page(offset)) for offset in range(limitation, total_item, limitation)]
+        try:
+            for next_page in asyncio.as_completed(tasks):
+                page = await next_page
+                if page is None:
+                    continue
+                for video in unseen_videos(page):
+                    yield video
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _get_videos_paginated(self, status: HolodexVideoStatus, endpoint: str) -> List[HolodexVideo]:
+        return [video async for video in self.iter_videos_paginated(status, endpoint)]
 
     async def get_lives(self):
-        async with self.client.get(f"{self.BASE}live") as response:
-            if response.status != 200:
-                logger.error(f"Failed to get live videos: {response.status}")
-                return []
-            try:
-                results: List[HolodexVideoPayload] = await response.json()
-            except Exception:
-                logger.exception("Failed to parse live videos")
-                return []
-
-        coerced_data: List[HolodexVideo] = []
-        for video in results:
-            video_type = video.get("type")
-            if video_type != "stream":
-                continue
-            start_time = self._convert_date_to_unix(video.get("start_actual"))
-            if start_time is None:
-                start_time = self._convert_date_to_unix(video.get("start_scheduled"))
-            channel_id = video.get("channel_id") or video.get("channel", {}).get("id")
-            if channel_id is None:
-                continue
-
-            org_group = video.get("channel", {}).get("org")
-
-            video_url = f"https://youtube.com/watch?v={video['id']}"
-            is_member = "member" in video.get("topic_id", "").lower()
-            coerced_data.append(
-                HolodexVideo(
-                    video["id"],
-                    video["title"],
-                    start_time,
-                    channel_id,
-                    org_group,
-                    video["status"],
-                    video_url,
-                    is_member,
-                )
-            )
-
-        return coerced_data
+        response = await self.transport.request("live", f"{self.BASE}live")
+        if response is None or response.status != 200:
+            logger.error(f"Failed to get live videos: {response and response.status}")
+            return []
+        try:
+            results: List[HolodexVideoPayload] = response.json()
+        except Exception:
+            logger.exception("Failed to parse live videos")
+            return []
+
+        return self._coerce_videos(results)
+
+    async def sync_lives(self) -> Optional[HolodexLiveDelta]:
+        """
+        Poll the live/upcoming set and apply it to the local mirror.
+
+        It will use a conditional request if Holodex gave us a validator before, if not
+        the response body digest is compared so an identical payload is not parsed again.
+        Returns None if the request failed, the mirror is not touched in that case.
+        """
+        headers = self.lives.conditional_headers()
+        response = await self.transport.request("live", f"{self.BASE}live", headers=headers)
+        if response is None:
+            return None
+        if response.status == 304:
+            return HolodexLiveDelta(unchanged=len(self.lives), not_modified=True)
+        if response.status != 200:
+            logger.error(f"Failed to get live videos: {response.status}")
+            return None
+        raw_body = response.body
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+
+        body_digest = hash(raw_body)
+        if body_digest == self.lives.body_digest:
+            self.lives.etag = etag
+            self.lives.last_modified = last_modified
+            return HolodexLiveDelta(unchanged=len(self.lives), not_modified=True)
+        try:
+            results: List[HolodexVideoPayload] = orjson.loads(raw_body)
+        except Exception:
+            logger.exception("Failed to parse live videos")
+            return None
+        self.lives.etag = etag
+        self.lives.last_modified = last_modified
+        self.lives.body_digest = body_digest
+        return self.lives.apply(self._coerce_videos(results))
 
     async def get_video(self, video_id: str) -> Optional[HolodexVideo]:
+        return await self.video_cache.get_or_fetch(video_id, lambda: self._fetch_video(video_id))
+
+    async def _fetch_video(self, video_id: str) -> Optional[HolodexVideo]:
         params = {
             "id": video_id,
             "include": "live_info",
         }
 
-        async with self.client.get(f"{self.BASE}videos", params=params) as resp:
-            if resp.status != 200:
-                return None
-            json_resp: List[HolodexVideoPayload] = await resp.json()
+        response = await self.transport.request("videos", f"{self.BASE}videos", params=params)
+        if response is None or response.status != 200:
+            return None
+        json_resp: List[HolodexVideoPayload] = response.json()
 
         if len(json_resp) < 1:
             return None
 
-        selected_video = json_resp[0]
+        return self._coerce_single_video(json_resp[0])
+
+    async def get_videos(self, video_ids: List[str]) -> Dict[str, Optional[HolodexVideo]]:
+        """
+        Get multiple videos at once, cached video is used directly and the rest is requested
+        with comma separated IDs in a single request (for every 50 videos).
+
+        Video that are not found or invalid will be mapped to None, while video that failed
+        to be requested will not be included in the results.
+        """
+        results: Dict[str, Optional[HolodexVideo]] = {}
+        missing: List[str] = []
+        for video_id in dict.fromkeys(video_ids):
+            found, cached = self.video_cache.get(video_id)
+            if found:
+                results[video_id] = cached
+            else:
+                missing.append(video_id)
+
+        for i in range(0, len(missing), self.MAX_BATCH_IDS):
+            chunk = missing[i : i + self.MAX_BATCH_IDS]
+            params = {
+                "id": ",".join(chunk),
+                "include": "live_info",
+                # /videos is paginated, make sure every requested ID fits in one page
+                "limit": len(chunk),
+            }
+            response = await self.transport.request("videos", f"{self.BASE}videos", params=params)
+            if response is None or response.status != 200:
+                logger.error(f"Failed to get {len(chunk)} videos: {response and response.status}")
+                continue
+            json_resp: List[HolodexVideoPayload] = response.json()
+
+            for video_id in chunk:
+                results[video_id] = None
+            for payload in json_resp:
+                if payload is None or payload.get("id") not in results:
+                    continue
+                video = self._coerce_single_video(payload)
+                results[payload["id"]] = video
+                if video is not None:
+                    self.video_cache.set(video.id, video)
+        return results
 
+    @classmethod
+    def _coerce_single_video(cls: Type[HolodexAPI], selected_video: HolodexVideoPayload) -> Optional[HolodexVideo]:
         if selected_video is None:
             return None
 
@@ -238,9 +369,9 @@ class HolodexAPI:
         if stream_status == "missing":
             # Stream is private, dont add.
             return None
-        start_time = self._convert_date_to_unix(selected_video.get("start_actual"))
+        start_time = cls._convert_date_to_unix(selected_video.get("start_actual"))
         if start_time is None:
-            start_time = self._convert_date_to_unix(selected_video.get("start_scheduled"))
+            start_time = cls._convert_date_to_unix(selected_video.get("start_scheduled"))
         channel_id = selected_video.get("channel_id") or selected_video.get("channel", {}).get("id")
         if channel_id is None:
             return None
@@ -259,12 +390,29 @@ class HolodexAPI:
             is_member,
         )
 
+    def stats(self):
+        return {
+            "video": self.video_cache.stats(),
+            "channel": self.channel_cache.stats(),
+            "transport": self.transport.stats() if self.transport is not None else None,
+        }
+
     @classmethod
     def attach(cls: Type[HolodexAPI], app: SanicVTHell):
         config = app.config.get("HOLODEX_API_KEY")
 
         async def init_holodex_api(app: SanicVTHell):
-            holodex = cls(config, loop=app.loop)
+            holodex = cls(
+                config,
+                loop=app.loop,
+                video_ttl=app.config.HOLODEX_CACHE_VIDEO_TTL,
+                channel_ttl=app.config.HOLODEX_CACHE_CHANNEL_TTL,
+                cache_size=app.config.HOLODEX_CACHE_SIZE,
+                page_concurrency=app.config.HOLODEX_PAGE_CONCURRENCY,
+                rate_limit=app.config.HOLODEX_RATE_LIMIT,
+                rate_burst=app.config.HOLODEX_RATE_BURST,
+                http=app.http,
+            )
             logger.info("Initializing Holodex API")
             await holodex.create()
             app.holodex = holodex
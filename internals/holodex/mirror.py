@@ -0,0 +1,117 @@
+"""
+MIT License
+
+Copyright (c) 2020-present noaione
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from .models import HolodexVideo
+
+__all__ = ("HolodexLiveDelta", "HolodexLiveMirror")
+
+
+@dataclass
+class HolodexLiveDelta:
+    added: List[HolodexVideo] = field(default_factory=list)
+    changed: List[HolodexVideo] = field(default_factory=list)
+    removed: List[str] = field(default_factory=list)
+    unchanged: int = 0
+    not_modified: bool = False
+
+    @property
+    def updated(self) -> List[HolodexVideo]:
+        return self.added + self.changed
+
+    def __repr__(self) -> str:
+        if self.not_modified:
+            return "<HolodexLiveDelta not_modified>"
+        return (
+            f"<HolodexLiveDelta added={len(self.added)} changed={len(self.changed)} "
+            f"removed={len(self.removed)} unchanged={self.unchanged}>"
+        )
+
+
+class HolodexLiveMirror:
+    """
+    A local copy of the Holodex live/upcoming set.
+
+    Every poll is applied as a delta against the previous one, a video is only reported again
+    if it's new or any of the field the auto scheduler cares about has changed.
+    """
+
+    def __init__(self):
+        self.videos: Dict[str, HolodexVideo] = {}
+        self._fingerprints: Dict[str, int] = {}
+        # Validator for the conditional request, and the last response body digest
+        # as the fallback when Holodex does not send any of it.
+        self.etag: Optional[str] = None
+        self.last_modified: Optional[str] = None
+        self.body_digest: Optional[int] = None
+        # Opaque marker set by the consumer to know what the full set was last evaluated with
+        self.evaluated_by: Any = None
+
+    @staticmethod
+    def fingerprint(video: HolodexVideo) -> int:
+        # The status is not included since upcoming -> live should not be treated as a new video
+        return hash((video.title, video.start_time, video.channel_id, video.org, video.is_member))
+
+    def conditional_headers(self) -> Dict[str, str]:
+        headers = {}
+        if self.etag is not None:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified is not None:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+    def apply(self, videos: List[HolodexVideo]) -> HolodexLiveDelta:
+        delta = HolodexLiveDelta()
+        fingerprints: Dict[str, int] = {}
+        mirrored: Dict[str, HolodexVideo] = {}
+        for video in videos:
+            fingerprint = self.fingerprint(video)
+            fingerprints[video.id] = fingerprint
+            mirrored[video.id] = video
+            old_fingerprint = self._fingerprints.get(video.id)
+            if old_fingerprint is None:
+                delta.added.append(video)
+            elif old_fingerprint != fingerprint:
+                delta.changed.append(video)
+            else:
+                delta.unchanged += 1
+        delta.removed = [video_id for video_id in self.videos if video_id not in mirrored]
+        self.videos = mirrored
+        self._fingerprints = fingerprints
+        return delta
+
+    def reset(self):
+        self.videos.clear()
+        self._fingerprints.clear()
+        self.etag = None
+        self.last_modified = None
+        self.body_digest = None
+        self.evaluated_by = None
+
+    def __len__(self) -> int:
+        return len(self.videos)
@@ -0,0 +1,256 @@
+"""
+MIT License
+
+Copyright (c) 2020-present noaione
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import random
+from bisect import bisect_left
+from dataclasses import dataclass
+from typing import Any, Dict, List, Mapping, Optional
+
+import aiohttp
+import orjson
+import pendulum
+
+__all__ = ("HolodexResponse", "LatencyHistogram", "TokenBucket", "HolodexTransport")
+
+logger = logging.getLogger("Internals.Holodex.Transport")
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+
+@dataclass
+class HolodexResponse:
+    status: int
+    headers: Mapping[str, str]
+    body: bytes
+
+    def json(self) -> Any:
+        return orjson.loads(self.body)
+
+
+class LatencyHistogram:
+    BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self):
+        self.counts: List[int] = [0] * (len(self.BUCKETS) + 1)
+        self.total = 0
+        self.sum = 0.0
+
+    def observe(self, seconds: float):
+        self.counts[bisect_left(self.BUCKETS, seconds)] += 1
+        self.total += 1
+        self.sum += seconds
+
+    def to_json(self) -> Dict[str, Any]:
+        buckets = {str(bucket): count for bucket, count in zip(self.BUCKETS, self.counts)}
+        buckets["+Inf"] = self.counts[-1]
+        return {
+            "count": self.total,
+            "sum": round(self.sum, 4),
+            "avg": round(self.sum / self.total, 4) if self.total > 0 else 0.0,
+            "buckets": buckets,
+        }
+
+
+class TokenBucket:
+    """Pace the request to a steady rate, while still allowing a small burst"""
+
+    def __init__(self, rate: float, capacity: float, *, loop: asyncio.AbstractEventLoop):
+        self.rate = rate
+        self.capacity = max(capacity, 1.0)
+        self._loop = loop
+        self._tokens = self.capacity
+        self._updated_at = loop.time()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = self._loop.time()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    async def acquire(self):
+        if self.rate <= 0:
+            return
+        async with self._lock:
+            self._refill()
+            while self._tokens < 1:
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+                self._refill()
+            self._tokens -= 1
+
+
+class HolodexTransport:
+    """
+    Send every request to Holodex, following the rate limit that Holodex told us.
+
+    - Every request need a token from the token bucket first.
+    - Retry-After and the X-RateLimit headers pause every request until it's safe again, and when
+      the remaining quota is running low the request is spread evenly until the quota reset.
+    - 429, 5xx, and connection error is retried with jittered exponential backoff.
+    """
+
+    MAX_ATTEMPTS = 4
+    BACKOFF_BASE = 1.0
+    BACKOFF_MAX = 30.0
+    MAX_PAUSE = 120.0
+    # Start spreading the request when the remaining quota is below this ratio
+    LOW_QUOTA_RATIO = 0.1
+
+    def __init__(self, client: aiohttp.ClientSession, rate: float, burst: float, *, loop: asyncio.AbstractEventLoop):
+        self.client = client
+        self._loop = loop
+        self.bucket = TokenBucket(rate, burst, loop=loop)
+        self._paused_until = 0.0
+
+        self.latency: Dict[str, LatencyHistogram] = {}
+        self.responses: Dict[str, Dict[str, int]] = {}
+        self.retries: Dict[str, int] = {}
+        self.quota: Dict[str, Optional[float]] = {"limit": None, "remaining": None, "reset": None}
+
+    @staticmethod
+    def _parse_float(value: Optional[str]) -> Optional[float]:
+        if value is None:
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            return None
+
+    def _pause_for(self, seconds: float):
+        seconds = min(max(seconds, 0.0), self.MAX_PAUSE)
+        self._paused_until = max(self._paused_until, self._loop.time() + seconds)
+
+    def _update_quota(self, headers: Mapping[str, str]) -> Optional[float]:
+        """Update the quota gauge from the response headers, returns Retry-After if there's any"""
+        retry_after = self._parse_float(headers.get("Retry-After"))
+        limit = self._parse_float(headers.get("X-RateLimit-Limit"))
+        remaining = self._parse_float(headers.get("X-RateLimit-Remaining"))
+        reset_at = self._parse_float(headers.get("X-RateLimit-Reset"))
+        if limit is not None:
+            self.quota["limit"] = limit
+        if remaining is not None:
+            self.quota["remaining"] = remaining
+        reset_in = None
+        if reset_at is not None:
+            # Holodex send the reset time as an unix timestamp, but accept the delta seconds too.
+            if reset_at > 1_000_000_000:
+                self.quota["reset"] = reset_at
+                reset_in = reset_at - pendulum.now("UTC").float_timestamp
+            else:
+                self.quota["reset"] = pendulum.now("UTC").float_timestamp + reset_at
+                reset_in = reset_at
+
+        if retry_after is not None:
+            self._pause_for(retry_after)
+        elif remaining is not None and reset_in is not None and reset_in > 0:
+            if remaining <= 0:
+                logger.warning(f"Holodex quota exhausted, pausing request for {reset_in:.1f}s")
+                self._pause_for(reset_in)
+            elif limit is not None and remaining <= limit * self.LOW_QUOTA_RATIO:
+                # Spread the rest of the quota evenly until it's reset
+                self._pause_for(reset_in / remaining)
+        return retry_after
+
+    def _backoff(self, attempt: int) -> float:
+        delay = min(self.BACKOFF_BASE * (2 ** attempt), self.BACKOFF_MAX)
+        return delay * random.uniform(0.5, 1.5)
+
+    def _record(self, name: str, status: str, elapsed: float):
+        self.latency.setdefault(name, LatencyHistogram()).observe(elapsed)
+        statuses = self.responses.setdefault(name, {})
+        statuses[status] = statuses.get(status, 0) + 1
+
+    async def request(
+        self,
+        name: str,
+        url: str,
+        *,
+        method: str = "GET",
+        params: Optional[Dict[str, Any]] = None,
+        headers: Optional[Dict[str, str]] = None,
+    ) -> Optional[HolodexResponse]:
+        """
+        Send a request, `name` is the endpoint name for the telemetry.
+        Returns None if every attempt failed, non-retryable status is returned as is.
+        """
+        response: Optional[HolodexResponse] = None
+        # Backoff of this request only, the global pause is reserved for rate limit and quota
+        retry_in = 0.0
+        for attempt in range(self.MAX_ATTEMPTS):
+            if attempt > 0:
+                self.retries[name] = self.retries.get(name, 0) + 1
+                await asyncio.sleep(retry_in)
+            delay = self._paused_until - self._loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            await self.bucket.acquire()
+
+            started_at = self._loop.time()
+            try:
+                async with self.client.request(method, url, params=params, headers=headers) as resp:
+                    body = await resp.read()
+                    response = HolodexResponse(resp.status, resp.headers, body)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as exc:
+                self._record(name, "error", self._loop.time() - started_at)
+                logger.warning(f"Failed to request {name} (attempt {attempt + 1}): {exc!r}")
+                retry_in = self._backoff(attempt)
+                continue
+            self._record(name, str(response.status), self._loop.time() - started_at)
+
+            retry_after = self._update_quota(response.headers)
+            if response.status not in RETRY_STATUS:
+                return response
+            logger.warning(f"Holodex returned {response.status} for {name} (attempt {attempt + 1})")
+            if retry_after is not None:
+                # Already paused by the Retry-After header, add a bit of jitter
+                # so every waiting request does not come back at the same time
+                retry_in = random.uniform(0, 1)
+            elif response.status == 429:
+                # Rate limited without telling us how long, slow down every request
+                self._pause_for(self._backoff(attempt))
+                retry_in = 0.0
+            else:
+                retry_in = self._backoff(attempt)
+        if response is not None:
+            logger.error(f"Giving up requesting {name} after {self.MAX_ATTEMPTS} attempts: {response.status}")
+        else:
+            logger.error(f"Giving up requesting {name} after {self.MAX_ATTEMPTS} attempts")
+        return response
+
+    def stats(self) -> Dict[str, Any]:
+        paused_for = max(self._paused_until - self._loop.time(), 0.0)
+        return {
+            "quota": dict(self.quota),
+            "paused_for": round(paused_for, 3),
+            "endpoints": {
+                name: {
+                    "latency": histogram.to_json(),
+                    "responses": dict(self.responses.get(name, {})),
+                    "retries": self.retries.get(name, 0),
+                }
+                for name, histogram in self.latency.items()
+            },
+        }
@@ -0,0 +1,123 @@
+"""
+MIT License
+
+Copyright (c) 2020-present noaione
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+from http.cookies import Morsel
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+import aiofiles
+import aiofiles.os
+import aiohttp
+
+from internals.utils import find_cookies_file, parse_cookie_to_morsel
+
+__all__ = ("HTTPClientManager",)
+
+logger = logging.getLogger("Internals.HTTPClient")
+
+
+class HTTPClientManager:
+    """
+    A shared connection pool for every outgoing HTTP request.
+
+    Every client (chat downloader, Holodex, Discord) still gets its own session
+    since they have their own headers and cookies, but all of them share a single
+    keep-alive connector with a DNS cache, so concurrent chat downloads reuse the
+    same TLS connections to YouTube instead of opening a new pool each.
+
+    The parsed cookie file is also cached and only re-parsed when the file changed.
+    """
+
+    LIMIT = 100
+    LIMIT_PER_HOST = 30
+    DNS_CACHE_TTL = 300
+    KEEPALIVE_TIMEOUT = 30
+
+    def __init__(self):
+        self._connector: Optional[aiohttp.TCPConnector] = None
+        # Created lazily since the loop is not running yet on init
+        self._cookie_lock: Optional[asyncio.Lock] = None
+        self._cookie_key: Optional[Tuple[Path, float]] = None
+        self._cookies: Dict[str, Morsel] = {}
+
+    @property
+    def connector(self) -> aiohttp.TCPConnector:
+        if self._connector is None or self._connector.closed:
+            self._connector = aiohttp.TCPConnector(
+                limit=self.LIMIT,
+                limit_per_host=self.LIMIT_PER_HOST,
+                use_dns_cache=True,
+                ttl_dns_cache=self.DNS_CACHE_TTL,
+                keepalive_timeout=self.KEEPALIVE_TIMEOUT,
+            )
+        return self._connector
+
+    def create_session(self, **kwargs: Any) -> aiohttp.ClientSession:
+        """
+        Create a new session on top of the shared connector.
+        Closing the session will not close the connector.
+        """
+        return aiohttp.ClientSession(connector=self.connector, connector_owner=False, **kwargs)
+
+    def _get_cookie_lock(self) -> asyncio.Lock:
+        if self._cookie_lock is None:
+            self._cookie_lock = asyncio.Lock()
+        return self._cookie_lock
+
+    async def load_cookies(self) -> Dict[str, Morsel]:
+        """
+        Get the cookies from the cookie file, the file is only parsed again if it has been modified.
+        A copy is returned every time so the caller can modify it freely.
+        """
+        cookie_path = await find_cookies_file()
+        if cookie_path is None:
+            self._cookie_key = None
+            self._cookies = {}
+            return {}
+
+        async with self._get_cookie_lock():
+            stat = await aiofiles.os.stat(cookie_path)
+            cookie_key = (cookie_path, stat.st_mtime)
+            if cookie_key != self._cookie_key:
+                logger.info("Loading cookies from %s", cookie_path)
+                async with aiofiles.open(cookie_path, "r") as fp:
+                    cookies_str = await fp.read()
+                try:
+                    self._cookies = parse_cookie_to_morsel(cookies_str)
+                    logger.info("Loaded %d cookies", len(self._cookies))
+                except ValueError:
+                    logger.error("Invalid Netscape Cookie File, ignoring cookies!")
+                    self._cookies = {}
+                self._cookie_key = cookie_key
+
+        return {name: cookie.copy() for name, cookie in self._cookies.items()}
+
+    async def close(self):
+        if self._connector is not None and not self._connector.closed:
+            await self._connector.close()
+        self._connector = None
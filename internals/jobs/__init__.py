@@ -0,0 +1,15 @@
+"""
+internals.jobs
+~~~~~~~~~~~~~~~
+Job timing and bookkeeping helpers for the downloader.
+
+:copyright: (c) 2020-present noaione
+:license: MIT, see LICENSE for more details.
+"""
+
+from .checkpoint import *
+from .pipeline import *
+from .progress import *
+from .state import *
+from .supervisor import *
+from .timer import *
@@ -0,0 +1,141 @@
+"""
+MIT License
+
+Copyright (c) 2020-present noaione
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+from __future__ import annotations
+
+import logging
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Type
+
+import aiofiles.os
+import pendulum
+
+from internals.db import models
+
+if TYPE_CHECKING:
+    from .progress import JobProgress
+
+__all__ = ("JobCheckpoint",)
+
+logger = logging.getLogger("Internals.JobCheckpoint")
+STREAMDUMP_PATH = Path(__file__).absolute().parent.parent.parent / "streamdump"
+
+
+class JobCheckpoint:
+    """
+    Keep track of the partial download of a job, so the error recovery does not throw it away.
+
+    The progress of the current attempt is saved every ``SAVE_INTERVAL`` seconds,
+    and any partial output is kept as a numbered part that will be appended on muxing.
+    """
+
+    SAVE_INTERVAL = 30
+
+    def __init__(self, record: models.VTHellJobCheckpoint):
+        self._record = record
+        self._last_save = 0.0
+
+    @classmethod
+    async def load(cls: Type[JobCheckpoint], job_id: str) -> JobCheckpoint:
+        """Load the checkpoint of a job, the row is only created on the first save"""
+        record = await models.VTHellJobCheckpoint.get_or_none(id=job_id)
+        if record is None:
+            record = models.VTHellJobCheckpoint(id=job_id)
+        return cls(record)
+
+    @classmethod
+    async def get(cls: Type[JobCheckpoint], job_id: str) -> Optional[JobCheckpoint]:
+        record = await models.VTHellJobCheckpoint.get_or_none(id=job_id)
+        if record is None:
+            return None
+        return cls(record)
+
+    @staticmethod
+    async def clear(job_id: str):
+        await models.VTHellJobCheckpoint.filter(id=job_id).delete()
+
+    @classmethod
+    async def discard(cls: Type[JobCheckpoint], job_id: str):
+        """Remove the checkpoint of a job along with all of the partial download it kept"""
+        checkpoint = await cls.get(job_id)
+        if checkpoint is None:
+            return
+        for part_file in checkpoint.part_files:
+            try:
+                logger.info(f"[{job_id}] Trying to delete partial download {part_file}...")
+                await aiofiles.os.remove(str(STREAMDUMP_PATH / part_file))
+            except FileNotFoundError:
+                pass
+            except Exception:
+                logger.error(f"[{job_id}] Failed to delete partial download, silently skipping")
+        await cls.clear(job_id)
+
+    @property
+    def job_id(self) -> str:
+        return self._record.id
+
+    @property
+    def parts(self) -> List[Dict[str, Any]]:
+        return self._record.parts or []
+
+    @property
+    def part_files(self) -> List[str]:
+        return [part["file"] for part in self.parts]
+
+    @property
+    def fragments(self) -> int:
+        return self._record.fragments
+
+    @property
+    def downloaded(self) -> int:
+        return self._record.downloaded
+
+    async def _save(self):
+        self._record.updated_at = pendulum.now("UTC").int_timestamp
+        await self._record.save()
+        self._last_save = time.monotonic()
+
+    async def update(self, progress: Optional[JobProgress], force: bool = False):
+        """Update the progress of the current attempt, throttled to every ``SAVE_INTERVAL`` seconds"""
+        if progress is None:
+            return
+        if progress.fragments is not None:
+            self._record.fragments = progress.fragments
+        if progress.downloaded is not None:
+            self._record.downloaded = progress.downloaded
+        if force or time.monotonic() - self._last_save >= self.SAVE_INTERVAL:
+            try:
+                await self._save()
+            except Exception as exc:
+                logger.error(f"[{self.job_id}] Failed to save download checkpoint", exc_info=exc)
+
+    async def add_part(self, filename: str):
+        """Keep the partial output of the current attempt as the next part, and reset the progress"""
+        parts = self.parts
+        parts.append({"file": filename, "fragments": self.fragments, "downloaded": self.downloaded})
+        self._record.parts = parts
+        self._record.fragments = 0
+        self._record.downloaded = 0
+        await self._save()
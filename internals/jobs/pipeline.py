@@ -0,0 +1,149 @@
+"""
+MIT License
+
+Copyright (c) 2020-present noaione
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import heapq
+import itertools
+import logging
+from contextlib import asynccontextmanager
+from typing import TYPE_CHECKING, AsyncIterator, Dict, List, Optional, Tuple
+
+from internals.db import models
+
+if TYPE_CHECKING:
+    from internals.vth import SanicVTHell
+
+__all__ = ("StageLimiter", "JobPipeline")
+
+logger = logging.getLogger("Internals.JobPipeline")
+
+
+class StageLimiter:
+    """
+    A concurrency limiter with a priority aware waiting queue.
+
+    Up to ``workers`` job can run the stage at once, the rest is waiting on a heap
+    ordered by ``(priority, arrival)`` so lower priority number jumps the queue.
+    Zero or negative ``workers`` means the stage is not limited.
+    """
+
+    def __init__(self, name: str, workers: int):
+        self.name = name
+        self.workers = int(workers)
+        self._active = 0
+        self._counter = itertools.count()
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+
+    @property
+    def active(self) -> int:
+        return self._active
+
+    @property
+    def waiting(self) -> int:
+        return sum(1 for _, _, waiter in self._waiters if not waiter.done())
+
+    def _has_slot(self) -> bool:
+        return self.workers <= 0 or self._active < self.workers
+
+    def _wake_next(self):
+        while self._waiters and self._has_slot():
+            _, _, waiter = heapq.heappop(self._waiters)
+            # Cancelled waiter is dropped lazily here
+            if waiter.done():
+                continue
+            self._active += 1
+            waiter.set_result(None)
+
+    async def acquire(self, priority: int = 0):
+        if self._has_slot() and not self._waiters:
+            self._active += 1
+            return
+        waiter = asyncio.get_event_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._counter), waiter))
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # We got the slot right before being cancelled, pass it to the next one.
+                self.release()
+            raise
+
+    def release(self):
+        self._active = max(self._active - 1, 0)
+        self._wake_next()
+
+
+class JobPipeline:
+    """
+    The staged download -> mux -> upload pipeline of the downloader.
+
+    Each stage has its own worker pool so a burst of streams starting at the same
+    time does not spawn the same amount of mkvmerge and rclone at once.
+    Member-only job has a higher priority and will jump the mux and upload queue.
+    """
+
+    STAGES = ("download", "mux", "upload")
+    PRIORITY_HIGH = 0
+    PRIORITY_NORMAL = 10
+
+    def __init__(self, app: SanicVTHell):
+        self._app = app
+        self._limiters: Dict[str, StageLimiter] = {}
+        for stage in self.STAGES:
+            workers = app.config.get(f"VTHELL_WORKERS_{stage.upper()}", 0)
+            self._limiters[stage] = StageLimiter(stage, workers)
+
+    def __getitem__(self, stage: str) -> StageLimiter:
+        return self._limiters[stage]
+
+    @classmethod
+    def priority_of(cls, job: models.VTHellJob, stage: Optional[str] = None) -> int:
+        # Download always go by arrival, a live stream should never be kept waiting for a member stream.
+        if stage == "download":
+            return cls.PRIORITY_NORMAL
+        if job.member_only:
+            return cls.PRIORITY_HIGH
+        return cls.PRIORITY_NORMAL
+
+    @asynccontextmanager
+    async def stage(self, stage: str, job: models.VTHellJob) -> AsyncIterator[StageLimiter]:
+        """Wait for a free worker slot on the stage, and release it after the block is done"""
+        limiter = self._limiters[stage]
+        if not limiter._has_slot() or limiter._waiters:
+            logger.info(
+                f"[{job.id}] Waiting for a free {stage} worker ({limiter.active} running, {limiter.waiting} queued)"
+            )
+        await limiter.acquire(self.priority_of(job, stage))
+        try:
+            yield limiter
+        finally:
+            limiter.release()
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        return {
+            stage: {"workers": limiter.workers, "active": limiter.active, "waiting": limiter.waiting}
+            for stage, limiter in self._limiters.items()
+        }
@@ -0,0 +1,213 @@
+"""
+MIT License
+
+Copyright (c) 2020-present noaione
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+from __future__ import annotations
+
+import logging
+import re
+import time
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, Dict, Optional, Pattern
+
+if TYPE_CHECKING:
+    from internals.vth import SanicVTHell
+
+__all__ = (
+    "JobProgress",
+    "ProgressReporter",
+    "parse_size",
+    "parse_ytarchive_progress",
+    "parse_ffmpeg_progress",
+    "parse_rclone_progress",
+)
+
+logger = logging.getLogger("Internals.JobProgress")
+
+SIZE_UNITS = {
+    "": 1,
+    "b": 1,
+    "k": 1000,
+    "kb": 1000,
+    "kib": 1024,
+    "mb": 1000**2,
+    "mib": 1024**2,
+    "gb": 1000**3,
+    "gib": 1024**3,
+    "tb": 1000**4,
+    "tib": 1024**4,
+}
+# Video Fragments: 12; Audio Fragments: 12; Total Downloaded: 34.56MiB
+YTARCHIVE_PROGRESS: Pattern[str] = re.compile(
+    r"video fragments:\s*(?P<video>\d+);\s*audio fragments:\s*(?P<audio>\d+);"
+    r"\s*total downloaded:\s*(?P<size>[\d.]+)\s*(?P<unit>[kmgt]?i?b)",
+    re.I,
+)
+# frame=  120 fps=30 q=-1.0 size=    1024kB time=00:00:04.00 bitrate=2097.2kbits/s speed=1.01x
+FFMPEG_PROGRESS: Pattern[str] = re.compile(
+    r"size=\s*(?P<size>[\d.]+)\s*(?P<unit>[kmgt]?i?b)\s+"
+    r"time=\s*(?P<time>[\d:.]+)\s+"
+    r"bitrate=\s*(?P<bitrate>[\d.]+|N/A)(?:kbits/s)?"
+    r"(?:.*?speed=\s*(?P<speed>[\d.]+)x)?",
+    re.I,
+)
+# Transferred:   	  512 MiB / 1.000 GiB, 50%, 10.000 MiB/s, ETA 51s
+RCLONE_PROGRESS: Pattern[str] = re.compile(
+    r"transferred:\s*(?P<size>[\d.]+)\s*(?P<unit>[kmgt]?i?b)\s*/\s*(?P<total>[\d.]+)\s*(?P<total_unit>[kmgt]?i?b),"
+    r"\s*(?P<percent>[\d.]+|-)%?,\s*(?P<speed>[\d.]+)\s*(?P<speed_unit>[kmgt]?i?b)/s,\s*eta\s*(?P<eta>\S+)",
+    re.I,
+)
+RCLONE_ETA: Pattern[str] = re.compile(r"(?P<value>\d+(?:\.\d+)?)(?P<unit>[dhms])")
+ETA_UNITS = {"d": 86400, "h": 3600, "m": 60, "s": 1}
+
+
+def parse_size(value: str, unit: str = "") -> int:
+    """Parse a size like ``12.5`` + ``MiB`` into bytes"""
+    multiplier = SIZE_UNITS.get(unit.strip().lower(), 1)
+    return int(float(value) * multiplier)
+
+
+def _parse_timestamp(timestamp: str) -> float:
+    total = 0.0
+    for part in timestamp.split(":"):
+        total = total * 60 + float(part)
+    return total
+
+
+def _parse_rclone_eta(eta: str) -> Optional[int]:
+    matches = RCLONE_ETA.findall(eta)
+    if not matches:
+        return None
+    return int(sum(float(value) * ETA_UNITS[unit] for value, unit in matches))
+
+
+@dataclass
+class JobProgress:
+    source: str
+    downloaded: Optional[int] = None
+    total: Optional[int] = None
+    fragments: Optional[int] = None
+    speed: Optional[float] = None
+    eta: Optional[int] = None
+    percent: Optional[float] = None
+    elapsed: Optional[float] = None
+    extras: Dict[str, Any] = field(default_factory=dict)
+
+    def to_json(self) -> Dict[str, Any]:
+        base = {"source": self.source}
+        for key in ("downloaded", "total", "fragments", "speed", "eta", "percent", "elapsed"):
+            value = getattr(self, key)
+            if value is not None:
+                base[key] = value
+        if self.extras:
+            base.update(self.extras)
+        return base
+
+
+def parse_ytarchive_progress(line: str) -> Optional[JobProgress]:
+    match = YTARCHIVE_PROGRESS.search(line)
+    if match is None:
+        return None
+    video, audio = int(match.group("video")), int(match.group("audio"))
+    return JobProgress(
+        source="ytarchive",
+        downloaded=parse_size(match.group("size"), match.group("unit")),
+        fragments=min(video, audio),
+        extras={"video_fragments": video, "audio_fragments": audio},
+    )
+
+
+def parse_ffmpeg_progress(line: str) -> Optional[JobProgress]:
+    match = FFMPEG_PROGRESS.search(line)
+    if match is None:
+        return None
+    speed = None
+    bitrate = match.group("bitrate")
+    if bitrate and bitrate.lower() != "n/a":
+        # kbits/s to bytes/s
+        speed = float(bitrate) * 1000 / 8
+    extras = {}
+    if match.group("speed") is not None:
+        extras["realtime"] = float(match.group("speed"))
+    return JobProgress(
+        source="ffmpeg",
+        downloaded=parse_size(match.group("size"), match.group("unit")),
+        speed=speed,
+        elapsed=_parse_timestamp(match.group("time")),
+        extras=extras,
+    )
+
+
+def parse_rclone_progress(line: str) -> Optional[JobProgress]:
+    match = RCLONE_PROGRESS.search(line)
+    if match is None:
+        return None
+    percent = match.group("percent")
+    return JobProgress(
+        source="rclone",
+        downloaded=parse_size(match.group("size"), match.group("unit")),
+        total=parse_size(match.group("total"), match.group("total_unit")),
+        speed=float(parse_size(match.group("speed"), match.group("speed_unit"))),
+        eta=_parse_rclone_eta(match.group("eta")),
+        percent=float(percent) if percent != "-" else None,
+    )
+
+
+class ProgressReporter:
+    """
+    Throttle the parsed progress of a job into ``job_progress`` websocket event.
+
+    The latest progress is always kept, but it will only be emitted (and logged)
+    once every ``interval`` seconds so a chatty process does not flood the websocket or log.
+    """
+
+    def __init__(self, app: SanicVTHell, job_id: str, interval: float = 1.0):
+        self._app = app
+        self.job_id = job_id
+        self.interval = interval
+        self.latest: Optional[JobProgress] = None
+        self._last_emit = 0.0
+        self._last_downloaded: Optional[int] = None
+
+    async def feed(self, progress: Optional[JobProgress], force: bool = False) -> bool:
+        if progress is None:
+            return False
+        self.latest = progress
+        now = time.monotonic()
+        if not force and now - self._last_emit < self.interval:
+            return False
+        elapsed = now - self._last_emit
+        self._last_emit = now
+        if progress.speed is None and progress.downloaded is not None and self._last_downloaded is not None:
+            # Derive the speed from the last emitted sample, ytarchive does not report it.
+            progress.speed = max(progress.downloaded - self._last_downloaded, 0) / elapsed
+        self._last_downloaded = progress.downloaded
+        await self.emit(progress)
+        return True
+
+    async def emit(self, progress: JobProgress):
+        data_update = {"id": self.job_id, **progress.to_json()}
+        logger.debug(f"[{self.job_id}] {progress.source} progress: {data_update}")
+        await self._app.wshandler.emit("job_progress", data_update)
+        if self._app.first_process and self._app.ipc:
+            await self._app.ipc.emit("ws_job_progress", data_update)
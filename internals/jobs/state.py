@@ -0,0 +1,119 @@
+"""
+MIT License
+
+Copyright (c) 2020-present noaione
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import TYPE_CHECKING, Dict, Optional
+
+from tortoise.transactions import in_transaction
+
+from internals.db import models
+
+if TYPE_CHECKING:
+    from internals.vth import SanicVTHell
+
+__all__ = ("JobStateCache",)
+
+logger = logging.getLogger("Internals.JobState")
+
+
+class JobStateCache:
+    """
+    A write-behind cache for the downloader job state.
+
+    Rapid transitions (downloading -> resolution update, and more) are coalesced
+    and written in a single transaction every ``FLUSH_INTERVAL`` seconds.
+    Terminal state (done, error, cancelled) and the move out of waiting (preparing)
+    are always persisted immediately, the schedule routes and other workers rely on
+    the database to know that a job is being processed.
+    """
+
+    FLUSH_INTERVAL = 5
+    STATE_FIELDS = ("status", "last_status", "error", "resolution")
+    TERMINAL_STATUS = (
+        models.VTHellJobStatus.done,
+        models.VTHellJobStatus.error,
+        models.VTHellJobStatus.cancelled,
+    )
+    WRITE_THROUGH_STATUS = TERMINAL_STATUS + (models.VTHellJobStatus.preparing,)
+
+    def __init__(self, app: SanicVTHell):
+        self._app = app
+        self._pending: Dict[str, models.VTHellJob] = {}
+        # Created lazily since the loop is not running yet on init
+        self._lock: Optional[asyncio.Lock] = None
+        self._flush_task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def _get_lock(self) -> asyncio.Lock:
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        return self._lock
+
+    async def save(self, job: models.VTHellJob):
+        """
+        Save the state of the job, terminal and preparing state will be written
+        immediately while the other one will be written on the next flush.
+        """
+        if job.status in self.WRITE_THROUGH_STATUS:
+            async with self._get_lock():
+                self._pending.pop(job.id, None)
+                await job.save()
+            return
+
+        self._pending[job.id] = job
+        if self._flush_task is None or self._flush_task.done():
+            task_name = f"JobStateCache-flush-{job.id}"
+            self._flush_task = self._app.loop.create_task(self._flush_later(), name=task_name)
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.FLUSH_INTERVAL)
+        await self.flush()
+
+    async def flush(self):
+        """Write every pending job state in a single transaction"""
+        async with self._get_lock():
+            if not self._pending:
+                return
+            pending_jobs = list(self._pending.values())
+            self._pending.clear()
+            logger.debug(f"Flushing {len(pending_jobs)} pending job state(s)")
+            try:
+                async with in_transaction():
+                    for job in pending_jobs:
+                        updated = {field: getattr(job, field) for field in self.STATE_FIELDS}
+                        await models.VTHellJob.filter(id=job.id).update(**updated)
+            except Exception as exc:
+                logger.error("Failed to flush job state, will be retried on next flush", exc_info=exc)
+                for job in pending_jobs:
+                    self._pending.setdefault(job.id, job)
+
+    async def close(self):
+        await self.flush()
+        if self._flush_task is not None and not self._flush_task.done():
+            self._flush_task.cancel()
@@ -0,0 +1,230 @@
+"""
+MIT License
+
+Copyright (c) 2020-present noaione
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import signal
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict, Optional, Type
+
+import pendulum
+
+from internals.db import models
+
+if TYPE_CHECKING:
+    from internals.vth import SanicVTHell
+
+__all__ = ("ProcessSupervisor",)
+
+logger = logging.getLogger("Internals.ProcessSupervisor")
+
+
+class ProcessSupervisor:
+    """
+    Keep track of every child process spawned for a job in the database.
+
+    If VTHell died or restarted, the child process is not attached to anything anymore.
+    On boot, :meth:`reconcile` will interrupt any orphaned process that is still alive
+    (ytarchive will merge whatever it got so far so it can be kept as a partial download),
+    and any job that is stuck in a processing state will be marked as error so the downloader
+    can recover it from the last status.
+    """
+
+    # The status that means a job is being processed by the downloader
+    PROCESSING_STATUS = (
+        models.VTHellJobStatus.preparing,
+        models.VTHellJobStatus.downloading,
+        models.VTHellJobStatus.muxing,
+        models.VTHellJobStatus.uploading,
+        models.VTHellJobStatus.cleaning,
+    )
+    KILL_TIMEOUT = 30
+    # How far apart (in seconds) the recorded and the actual process start time can be
+    START_TOLERANCE = 2
+
+    def __init__(self, app: SanicVTHell):
+        self._app = app
+        self._processes: Dict[int, asyncio.subprocess.Process] = {}
+        # Anything recorded after this is spawned by the current run
+        self._booted_at = pendulum.now("UTC").int_timestamp
+
+    def __len__(self) -> int:
+        return len(self._processes)
+
+    async def spawn(self, job_id: str, name: str, *args: Any, **kwargs: Any) -> asyncio.subprocess.Process:
+        """Spawn a child process with :func:`asyncio.create_subprocess_exec` and track it"""
+        process = await asyncio.create_subprocess_exec(*args, **kwargs)
+        self._processes[process.pid] = process
+        record = None
+        try:
+            record = await models.VTHellJobProcess.create(
+                job_id=job_id,
+                name=name,
+                pid=process.pid,
+                executable=str(args[0]),
+                started_at=self._process_start_time(process.pid) or pendulum.now("UTC").int_timestamp,
+            )
+        except Exception as exc:
+            logger.error(f"[{job_id}] Failed to record {name} process {process.pid}", exc_info=exc)
+        self._app.loop.create_task(self._watch(job_id, name, process, record), name=f"supervisor-{process.pid}")
+        return process
+
+    async def _watch(
+        self,
+        job_id: str,
+        name: str,
+        process: asyncio.subprocess.Process,
+        record: Optional[models.VTHellJobProcess],
+    ):
+        try:
+            await process.wait()
+        finally:
+            self._processes.pop(process.pid, None)
+        logger.debug(f"[{job_id}] {name} process {process.pid} exited with code {process.returncode}")
+        if record is not None:
+            try:
+                await record.delete()
+            except Exception as exc:
+                logger.error(f"[{job_id}] Failed to remove {name} process {process.pid} record", exc_info=exc)
+
+    @staticmethod
+    def _process_start_time(pid: int) -> Optional[int]:
+        """Get the UNIX timestamp of when the process started from /proc, None if it's not available"""
+        try:
+            proc_stat = (Path("/proc") / str(pid) / "stat").read_text()
+            boot_stat = (Path("/proc") / "stat").read_text()
+            clock_ticks = os.sysconf("SC_CLK_TCK")
+        except (OSError, ValueError, AttributeError):
+            return None
+        # The process name is wrapped in parentheses and can contain spaces,
+        # so the fields are counted after the last closing parenthesis (field 3 onward)
+        fields = proc_stat.rsplit(")", 1)[-1].split()
+        boot_time = None
+        for line in boot_stat.splitlines():
+            if line.startswith("btime "):
+                boot_time = int(line.split()[1])
+                break
+        if boot_time is None or len(fields) < 20:
+            return None
+        # Field 22, starttime: clock ticks since boot
+        return boot_time + int(fields[19]) // clock_ticks
+
+    @classmethod
+    def _is_same_process(cls: Type[ProcessSupervisor], record: models.VTHellJobProcess) -> bool:
+        """Check if the PID is still alive and still the same process we spawned"""
+        pid = record.pid
+        proc_cmdline = Path("/proc") / str(pid) / "cmdline"
+        try:
+            cmdline = proc_cmdline.read_bytes()
+        except FileNotFoundError:
+            return False
+        except OSError:
+            return False
+        if not cmdline:
+            # Zombie or kernel thread
+            return False
+        first_arg = cmdline.split(b"\0", 1)[0].decode("utf-8", errors="replace")
+        if os.path.basename(first_arg) != os.path.basename(record.executable):
+            return False
+        # Same executable is not enough, the PID might be reused after a reboot
+        start_time = cls._process_start_time(pid)
+        if start_time is None:
+            return False
+        return abs(start_time - record.started_at) <= cls.START_TOLERANCE
+
+    async def _interrupt_orphan(self, record: models.VTHellJobProcess):
+        pid = record.pid
+        # SIGINT first, ytarchive and ffmpeg will finalize their output file on interrupt.
+        logger.warning(f"[{record.job_id}] Interrupting orphaned {record.name} process {pid}")
+        try:
+            os.kill(pid, signal.SIGINT)
+        except ProcessLookupError:
+            return
+        for _ in range(self.KILL_TIMEOUT):
+            await asyncio.sleep(1)
+            if not self._is_same_process(record):
+                return
+        logger.warning(f"[{record.job_id}] Orphaned {record.name} process {pid} is still alive, killing it")
+        try:
+            os.kill(pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+    async def reap_orphans(self):
+        records = await models.VTHellJobProcess.all()
+        # Skip anything that we spawned ourselves in this run
+        records = [
+            record
+            for record in records
+            if record.pid not in self._processes and record.started_at < self._booted_at - self.START_TOLERANCE
+        ]
+        if not records:
+            return
+        if os.name == "nt" or not Path("/proc").is_dir():
+            logger.warning(
+                f"Found {len(records)} process record(s) from previous run, but can't verify them on this platform"
+            )
+        else:
+            orphans = [record for record in records if self._is_same_process(record)]
+            if orphans:
+                logger.info(f"Found {len(orphans)} orphaned process(es) from previous run")
+                await asyncio.gather(*[self._interrupt_orphan(record) for record in orphans])
+        await models.VTHellJobProcess.filter(id__in=[record.id for record in records]).delete()
+
+    async def reset_stuck_jobs(self):
+        stuck_jobs = await models.VTHellJob.filter(status__in=self.PROCESSING_STATUS)
+        for job in stuck_jobs:
+            last_status = job.status
+            if last_status == models.VTHellJobStatus.preparing:
+                last_status = models.VTHellJobStatus.downloading
+            logger.warning(f"[{job.id}] Job is stuck at {job.status.value}, marking as error to be recovered")
+            job.status = models.VTHellJobStatus.error
+            job.last_status = last_status
+            job.error = "Job was interrupted by VTHell restart"
+            await job.save()
+
+    async def reconcile(self):
+        """Reap any orphaned child process and reset stuck jobs from previous run, only run on boot"""
+        try:
+            await self.reap_orphans()
+        except Exception as exc:
+            logger.error("Failed to reap orphaned process", exc_info=exc)
+        try:
+            await self.reset_stuck_jobs()
+        except Exception as exc:
+            logger.error("Failed to reset stuck jobs", exc_info=exc)
+
+    async def close(self):
+        """Interrupt every running child process, used when VTHell is shutting down"""
+        for pid, process in list(self._processes.items()):
+            if process.returncode is not None:
+                continue
+            logger.info(f"Interrupting child process {pid}")
+            try:
+                process.send_signal(signal.SIGINT if os.name != "nt" else signal.SIGTERM)
+            except ProcessLookupError:
+                pass
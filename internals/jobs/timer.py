@@ -0,0 +1,170 @@
+"""
+MIT License
+
+Copyright (c) 2020-present noaione
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import heapq
+import logging
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+
+import pendulum
+
+from internals.db import models
+
+if TYPE_CHECKING:
+    from internals.vth import SanicVTHell
+
+__all__ = ("JobTimer",)
+
+logger = logging.getLogger("Internals.JobTimer")
+
+
+class JobTimer:
+    """
+    A heap based timer that keep track when each job should be started.
+
+    Each job is keyed on ``start_time - VTHELL_GRACE_PERIOD``, the downloader
+    will then sleep until the earliest job is due instead of polling the database.
+    Only the first process is running the timer, other workers forward their changes via IPC.
+    """
+
+    def __init__(self, app: SanicVTHell):
+        self._app = app
+        self._heap: List[Tuple[int, str]] = []
+        self._armed: Dict[str, int] = {}
+        # Created lazily since the loop is not running yet on init
+        self._wakeup: Optional[asyncio.Event] = None
+
+    def __len__(self) -> int:
+        return len(self._armed)
+
+    def __contains__(self, job_id: str) -> bool:
+        return job_id in self._armed
+
+    def _event(self) -> asyncio.Event:
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+        return self._wakeup
+
+    def arm(self, job_id: str, due_at: int):
+        """Arm or re-arm a job to be dispatched at ``due_at`` (unix timestamp)"""
+        due_at = int(due_at)
+        if self._armed.get(job_id) == due_at:
+            return
+        # Old entries are left in the heap and dropped lazily when popped.
+        self._armed[job_id] = due_at
+        heapq.heappush(self._heap, (due_at, job_id))
+        self._event().set()
+
+    def disarm(self, job_id: str):
+        self._armed.pop(job_id, None)
+
+    def _schedule(self, job_id: str, start_time: int, status: models.VTHellJobStatus):
+        if status == models.VTHellJobStatus.waiting:
+            self.arm(job_id, start_time - self._app.config.VTHELL_GRACE_PERIOD)
+        elif status == models.VTHellJobStatus.error:
+            self.arm(job_id, pendulum.now("UTC").int_timestamp)
+        else:
+            self.disarm(job_id)
+
+    def schedule(self, job: models.VTHellJob):
+        """Arm a job based on the current status of it"""
+        self._schedule(job.id, job.start_time, job.status)
+
+    def _drop_stale(self):
+        while self._heap:
+            due_at, job_id = self._heap[0]
+            if self._armed.get(job_id) == due_at:
+                break
+            heapq.heappop(self._heap)
+
+    def _pop_due(self, now: int) -> List[str]:
+        due_jobs: List[str] = []
+        while True:
+            self._drop_stale()
+            if not self._heap or self._heap[0][0] > now:
+                break
+            _, job_id = heapq.heappop(self._heap)
+            self._armed.pop(job_id, None)
+            due_jobs.append(job_id)
+        return due_jobs
+
+    @property
+    def next_due(self) -> Optional[int]:
+        self._drop_stale()
+        if not self._heap:
+            return None
+        return self._heap[0][0]
+
+    async def wait(self) -> List[str]:
+        """Block until at least one job is due, and return all the due job IDs"""
+        wakeup = self._event()
+        while True:
+            ctime = pendulum.now("UTC").int_timestamp
+            due_jobs = self._pop_due(ctime)
+            if due_jobs:
+                return due_jobs
+            wakeup.clear()
+            next_due = self.next_due
+            timeout = None if next_due is None else max(next_due - ctime, 0)
+            logger.debug(f"Sleeping until next job is due at {next_due}")
+            try:
+                await asyncio.wait_for(wakeup.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def reschedule(self, job: models.VTHellJob):
+        """
+        Notify the timer that a job got inserted or updated.
+        Can be called from any worker, it will be forwarded to the first process.
+        """
+        if self._app.first_process:
+            self.schedule(job)
+        elif self._app.ipc:
+            await self._app.ipc.emit(
+                "job_reschedule",
+                {"id": job.id, "start_time": job.start_time, "status": job.status.value},
+            )
+
+    async def unschedule(self, job_id: str):
+        """Notify the timer that a job got removed, can be called from any worker."""
+        if self._app.first_process:
+            self.disarm(job_id)
+        elif self._app.ipc:
+            await self._app.ipc.emit("job_unschedule", {"id": job_id})
+
+    async def on_ipc_reschedule(self, data: Any):
+        if not isinstance(data, dict) or "id" not in data:
+            return
+        try:
+            status = models.VTHellJobStatus(data.get("status"))
+        except ValueError:
+            return
+        self._schedule(data["id"], data.get("start_time") or 0, status)
+
+    async def on_ipc_unschedule(self, data: Any):
+        if not isinstance(data, dict) or "id" not in data:
+            return
+        self.disarm(data["id"])
@@ -25,7 +25,7 @@ SOFTWARE.
 from __future__ import annotations
 
 import logging
-from typing import TYPE_CHECKING, Any, Dict
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Union
 
 import aiohttp
 from discord_webhook import DiscordEmbed, DiscordWebhook
@@ -34,10 +34,12 @@ from internals.db import models
 from internals.struct import InternalSignalHandler
 
 if TYPE_CHECKING:
+    from ..httpclient import HTTPClientManager
     from ..vth import SanicVTHell
 
 logger = logging.getLogger("Notifier.Discord")
 __all__ = ("DiscordNotificationHandler",)
+MAX_EMBEDS = 10
 
 
 def make_update_discord_embed(data: models.VTHellJob):
@@ -75,22 +77,38 @@ def make_schedule_discord_embed(data: models.VTHellJob):
     return webhook.get_embeds()[0]
 
 
-async def one_time_shot(embed: Dict[str, Any], url: str):
-    if embed is None or url is None:
+async def send_embeds(embeds: List[Dict[str, Any]], url: str, http: Optional[HTTPClientManager] = None):
+    if not embeds or url is None:
         return
 
     base_url, hook_token = url.rsplit("/", 1)
     hook_redact = base_url + "/" + "*" * len(hook_token)
 
     params = {"wait": "true"}
-    json_files = {"embeds": [embed], "username": "VTHell", "avatar_url": "https://p.n4o.xyz/i/cococlock.png"}
     header = {"User-Agent": "VTHell/3.0 (+https://github.com/noaione/vthell)"}
-    async with aiohttp.ClientSession(headers=header) as session:
-        async with session.post(url, json=json_files, params=params) as resp:
-            if resp.status >= 400:
-                logger.error(f"Discord webhook returned {resp.status}")
-            logger.debug(f"Sent discord webhook with {json_files}")
-            logger.info(f"Succesfully sent a Discord Webhook to {hook_redact}")
+    if http is not None:
+        session = http.create_session(headers=header)
+    else:
+        session = aiohttp.ClientSession(headers=header)
+    async with session:
+        # Discord only allows 10 embeds per message
+        for i in range(0, len(embeds), MAX_EMBEDS):
+            json_files = {
+                "embeds": embeds[i : i + MAX_EMBEDS],
+                "username": "VTHell",
+                "avatar_url": "https://p.n4o.xyz/i/cococlock.png",
+            }
+            async with session.post(url, json=json_files, params=params) as resp:
+                if resp.status >= 400:
+                    logger.error(f"Discord webhook returned {resp.status}")
+                logger.debug(f"Sent discord webhook with {json_files}")
+                logger.info(f"Succesfully sent a Discord Webhook to {hook_redact}")
+
+
+async def one_time_shot(embed: Dict[str, Any], url: str, http: Optional[HTTPClientManager] = None):
+    if embed is None:
+        return
+    await send_embeds([embed], url, http)
 
 
 class DiscordNotificationHandler(InternalSignalHandler):
@@ -103,7 +121,7 @@ class DiscordNotificationHandler(InternalSignalHandler):
             logger.error("app context is missing!")
             return
         logger.info("Building Discord Webhook embed...")
-        data: models.VTHellJob = context.get("data")
+        data: Union[models.VTHellJob, List[models.VTHellJob]] = context.get("data")
         if data is None:
             logger.error("data context is missing!")
             return
@@ -117,7 +135,10 @@ class DiscordNotificationHandler(InternalSignalHandler):
             embeds = make_update_discord_embed(data)
             if embeds is None:
                 logger.debug("No embeds to send for update signal")
-            await one_time_shot(embeds, webhook_url)
+            await one_time_shot(embeds, webhook_url, app.http)
         elif emit_type == "schedule":
             embeds = make_schedule_discord_embed(data)
-            await one_time_shot(embeds, webhook_url)
+            await one_time_shot(embeds, webhook_url, app.http)
+        elif emit_type == "schedule_batch":
+            all_embeds = [make_schedule_discord_embed(job) for job in data]
+            await send_embeds(all_embeds, webhook_url, app.http)
@@ -153,6 +153,7 @@ async def post_auto_scheduler(request: Request):
         chains=chains,
     )
     await auto_sched.save()
+    await app.autorules.notify_changed()
     return json(
         {
             "id": auto_sched.pk,
@@ -242,6 +243,7 @@ async def patch_auto_scheduler(request: Request, id: int):
     if is_chain_update_only and not chain_updated:
         return json({"error": "No valid chains can be used to update"}, status=400)
     await sched.save()
+    await app.autorules.notify_changed()
     return empty()
 
 
@@ -264,4 +266,5 @@ async def delete_auto_scheduler(request: Request, id: int):
     sched = sched[0]
 
     await sched.delete()
+    await app.autorules.notify_changed()
     return json({"id": sched.pk, "data": sched.data, "type": sched.type.name})
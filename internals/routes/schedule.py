@@ -23,15 +23,19 @@ SOFTWARE.
 """
 
 import logging
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Any, Dict, List
 
 import pendulum
 from sanic import Blueprint
 from sanic.request import Request
 from sanic.response import json
+from tortoise.exceptions import IntegrityError
+from tortoise.transactions import in_transaction
 
 from internals.db import models
 from internals.decorator import secure_access
+from internals.holodex import HolodexVideo
+from internals.jobs import JobCheckpoint
 from internals.utils import map_to_boolean, secure_filename
 
 if TYPE_CHECKING:
@@ -41,6 +45,69 @@ bp_sched = Blueprint("api_scheduler", url_prefix="/api")
 logger = logging.getLogger("Routes.API.Schedule")
 
 
+def make_job_filename(video: HolodexVideo) -> str:
+    title_safe = secure_filename(video.title)
+    utc_unix = pendulum.from_timestamp(video.start_time, tz="UTC")
+    as_jst = utc_unix.in_timezone("Asia/Tokyo")
+    return f"[{as_jst.year}.{as_jst.month}.{as_jst.day}.{video.id}] {title_safe}"
+
+
+def create_new_job(video: HolodexVideo) -> models.VTHellJob:
+    return models.VTHellJob(
+        id=video.id,
+        title=video.title,
+        filename=make_job_filename(video),
+        start_time=video.start_time,
+        channel_id=video.channel_id,
+        member_only=video.is_member,
+    )
+
+
+def merge_existing_job(existing_job: models.VTHellJob, video: HolodexVideo) -> bool:
+    """Merge the new data into the existing job, returns True if a cancelled job is restarted from scratch"""
+    existing_job.title = video.title
+    existing_job.filename = make_job_filename(video)
+    existing_job.start_time = video.start_time
+    existing_job.member_only = video.is_member
+    if existing_job.status == models.VTHellJobStatus.error:
+        last_status = existing_job.last_status
+        if last_status in [models.VTHellJobStatus.downloading, models.VTHellJobStatus.preparing]:
+            existing_job.status = models.VTHellJobStatus.waiting
+            existing_job.last_status = None
+            existing_job.error = None
+    elif existing_job.status == models.VTHellJobStatus.cancelled:
+        existing_job.last_status = None
+        existing_job.error = None
+        existing_job.status = models.VTHellJobStatus.waiting
+        return True
+    return False
+
+
+def job_update_payload(job: models.VTHellJob):
+    return {
+        "id": job.id,
+        "title": job.title,
+        "start_time": job.start_time,
+        "channel_id": job.channel_id,
+        "is_member": job.member_only,
+        "status": job.status.value,
+    }
+
+
+def job_scheduled_payload(job: models.VTHellJob):
+    return {
+        "id": job.id,
+        "title": job.title,
+        "filename": job.filename,
+        "start_time": job.start_time,
+        "channel_id": job.channel_id,
+        "is_member": job.member_only,
+        "status": job.status.value,
+        "resolution": job.resolution,
+        "error": job.error,
+    }
+
+
 @bp_sched.post("/schedule")
 @secure_access
 async def add_new_jobs(request: Request):
@@ -65,60 +132,24 @@ async def add_new_jobs(request: Request):
         logger.error(f"ScheduleRequest: Video {video_id} not found")
         return json({"error": "Video not found or invalid"}, status=404)
 
-    title_safe = secure_filename(video_res.title)
-    utc_unix = pendulum.from_timestamp(video_res.start_time, tz="UTC")
-    as_jst = utc_unix.in_timezone("Asia/Tokyo")
-    filename = f"[{as_jst.year}.{as_jst.month}.{as_jst.day}.{video_res.id}] {title_safe}"
     if existing_job is not None:
         logger.info(f"ScheduleRequest: Video {video_id} already exists, merging data...")
-        existing_job.title = video_res.title
-        existing_job.filename = filename
-        existing_job.start_time = video_res.start_time
-        existing_job.member_only = video_res.is_member
-        if existing_job.status == models.VTHellJobStatus.error:
-            last_status = existing_job.last_status
-            if last_status in [models.VTHellJobStatus.downloading, models.VTHellJobStatus.preparing]:
-                existing_job.status = models.VTHellJobStatus.waiting
-                existing_job.last_status = None
-                existing_job.error = None
-        elif existing_job.status == models.VTHellJobStatus.cancelled:
-            existing_job.last_status = None
-            existing_job.error = None
-            existing_job.status = models.VTHellJobStatus.waiting
+        if merge_existing_job(existing_job, video_res):
+            await JobCheckpoint.discard(video_id)
         await existing_job.save()
-        job_update_data = {
-            "id": existing_job.id,
-            "title": existing_job.title,
-            "start_time": existing_job.start_time,
-            "channel_id": existing_job.channel_id,
-            "is_member": existing_job.member_only,
-            "status": existing_job.status.value,
-        }
+        await app.jobtimer.reschedule(existing_job)
+        job_update_data = job_update_payload(existing_job)
         await app.wshandler.emit("job_update", job_update_data)
         if app.first_process and app.ipc:
             await app.ipc.emit("ws_job_update", job_update_data)
     else:
         logger.info(f"ScheduleRequest: Video {video_id} not found, creating new job...")
-        job_request = models.VTHellJob(
-            id=video_res.id,
-            title=video_res.title,
-            filename=filename,
-            start_time=video_res.start_time,
-            channel_id=video_res.channel_id,
-            member_only=video_res.is_member,
-        )
+        job_request = create_new_job(video_res)
+        # Make sure nothing is left behind from a previous job with the same video
+        await JobCheckpoint.discard(video_id)
         await job_request.save()
-        job_data_update = {
-            "id": job_request.id,
-            "title": job_request.title,
-            "filename": job_request.filename,
-            "start_time": job_request.start_time,
-            "channel_id": job_request.channel_id,
-            "is_member": job_request.member_only,
-            "status": job_request.status.value,
-            "resolution": job_request.resolution,
-            "error": job_request.error,
-        }
+        await app.jobtimer.reschedule(job_request)
+        job_data_update = job_scheduled_payload(job_request)
         await app.wshandler.emit("job_scheduled", job_data_update)
         if app.first_process and app.ipc:
             await app.ipc.emit("ws_job_scheduled", job_data_update)
@@ -126,6 +157,85 @@ async def add_new_jobs(request: Request):
     return json(video_res.to_json())
 
 
+@bp_sched.post("/schedule/bulk")
+@secure_access
+async def add_new_jobs_bulk(request: Request):
+    app: SanicVTHell = request.app
+    await app.wait_until_ready()
+    try:
+        json_request = request.json
+    except Exception as cep:
+        logger.error("Error while parsing request: %s", cep, exc_info=cep)
+        return json({"error": "Invalid JSON"}, status=400)
+    holodex = app.holodex
+
+    if not isinstance(json_request, dict) or "ids" not in json_request:
+        return json({"error": "Missing `ids` in json request"}, status=400)
+    video_ids = json_request["ids"]
+    if not isinstance(video_ids, list) or not all(isinstance(video_id, str) for video_id in video_ids):
+        return json({"error": "Invalid `ids` format, must be a list of string"}, status=400)
+    video_ids = list(dict.fromkeys(video_id.strip() for video_id in video_ids if video_id.strip()))
+    if len(video_ids) < 1:
+        return json({"error": "`ids` cannot be empty"}, status=400)
+
+    logger.info(f"ScheduleBulkRequest: Received request for {len(video_ids)} videos")
+    videos_res = await holodex.get_videos(video_ids)
+    existing_jobs = {job.id: job for job in await models.VTHellJob.filter(id__in=video_ids)}
+
+    results: List[Dict[str, Any]] = []
+    new_jobs: List[models.VTHellJob] = []
+    updated_jobs: List[models.VTHellJob] = []
+    restarted_ids: List[str] = []
+    for video_id in video_ids:
+        if video_id not in videos_res:
+            results.append({"id": video_id, "status": "error", "error": "Failed to fetch video from Holodex"})
+            continue
+        video_res = videos_res[video_id]
+        if video_res is None:
+            logger.error(f"ScheduleBulkRequest: Video {video_id} not found")
+            results.append({"id": video_id, "status": "error", "error": "Video not found or invalid"})
+            continue
+        existing_job = existing_jobs.get(video_id)
+        if existing_job is not None:
+            if merge_existing_job(existing_job, video_res):
+                restarted_ids.append(video_id)
+            updated_jobs.append(existing_job)
+            results.append({"id": video_id, "status": "updated", "data": video_res.to_json()})
+        else:
+            new_jobs.append(create_new_job(video_res))
+            results.append({"id": video_id, "status": "scheduled", "data": video_res.to_json()})
+
+    try:
+        async with in_transaction():
+            for existing_job in updated_jobs:
+                await existing_job.save()
+            if new_jobs:
+                await models.VTHellJob.bulk_create(new_jobs)
+    except IntegrityError:
+        logger.error("ScheduleBulkRequest: Some of the video got scheduled at the same time, rolling back")
+        return json({"error": "Some of the video got scheduled at the same time, please try again"}, status=409)
+
+    for video_id in restarted_ids + [job.id for job in new_jobs]:
+        await JobCheckpoint.discard(video_id)
+    for job in updated_jobs + new_jobs:
+        await app.jobtimer.reschedule(job)
+    for existing_job in updated_jobs:
+        job_update_data = job_update_payload(existing_job)
+        await app.wshandler.emit("job_update", job_update_data)
+        if app.first_process and app.ipc:
+            await app.ipc.emit("ws_job_update", job_update_data)
+    if new_jobs:
+        jobs_data_update = {"jobs": [job_scheduled_payload(job) for job in new_jobs]}
+        await app.wshandler.emit("jobs_scheduled", jobs_data_update)
+        if app.first_process and app.ipc:
+            await app.ipc.emit("ws_jobs_scheduled", jobs_data_update)
+    logger.info(
+        f"ScheduleBulkRequest: {len(new_jobs)} videos added and {len(updated_jobs)} videos updated, "
+        "sending back request"
+    )
+    return json({"results": results})
+
+
 @bp_sched.delete("/schedule/<video_id>")
 @secure_access
 async def delete_job(request: Request, video_id: str):
@@ -151,6 +261,8 @@ async def delete_job(request: Request, video_id: str):
         return json({"error": "Current video status does not allow you to delete video"}, status=406)
 
     await job.delete()
+    await app.jobtimer.unschedule(video_id)
+    await JobCheckpoint.discard(video_id)
     await app.wshandler.emit("job_delete", {"id": video_id})
     if app.first_process and app.ipc:
         await app.ipc.emit("ws_job_delete", {"id": video_id})
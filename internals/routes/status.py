@@ -52,10 +52,12 @@ async def existing_jobs(request: Request):
         pass
     await app.wait_until_ready()
 
+    fields = ["id", "title", "start_time", "channel_id", "member_only", "status", "error"]
     if include_done:
-        jobs = await models.VTHellJob.all()
+        jobs = await models.VTHellJob.all().only(*fields)
     else:
-        jobs = await models.VTHellJob.exclude(status=models.VTHellJobStatus.done)
+        active_status = models.VTHellJobStatus.except_for(models.VTHellJobStatus.done)
+        jobs = await models.VTHellJob.filter(status__in=active_status).only(*fields)
 
     as_json_fmt = []
     for job in jobs:
@@ -93,3 +95,13 @@ async def existing_single_job(request: Request, id: str):
             "error": job.error,
         }
     )
+
+
+@bp_status.get("/holodex/stats")
+async def holodex_cache_stats(request: Request):
+    """
+    Get the Holodex response cache statistics of the worker that handle the request.
+    """
+    app: SanicVTHell = request.app
+    await app.wait_until_ready()
+    return json({"worker": app.worker_num, **app.holodex.stats()})
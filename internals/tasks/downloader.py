@@ -28,7 +28,7 @@ import asyncio
 import logging
 from os import getenv
 from pathlib import Path
-from typing import TYPE_CHECKING, Any, Dict, List, Optional, Type
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple, Type
 
 import aiofiles
 import aiofiles.os
@@ -36,8 +36,22 @@ import pendulum
 import yt_dlp
 
 from internals.db import models
+from internals.jobs import (
+    JobCheckpoint,
+    ProgressReporter,
+    parse_ffmpeg_progress,
+    parse_rclone_progress,
+    parse_ytarchive_progress,
+)
 from internals.struct import InternalTaskBase
-from internals.utils import build_rclone_path, find_cookies_file, map_to_boolean, parse_cookie_to_morsel
+from internals.utils import (
+    build_rclone_path,
+    find_cookies_file,
+    map_to_boolean,
+    parse_cookie_to_morsel,
+    read_stream_lines,
+    read_stream_tail,
+)
 
 if TYPE_CHECKING:
     from internals.vth import SanicVTHell
@@ -45,6 +59,10 @@ if TYPE_CHECKING:
 logger = logging.getLogger("Tasks.Downloader")
 STREAMDUMP_PATH = Path(__file__).absolute().parent.parent.parent / "streamdump"
 STREAMDUMP_PATH.mkdir(exist_ok=True, parents=True)
+MUX_OUTPUT_EXTENSIONS = (".mkv", ".mp4", ".ts")
+STREAM_CHUNK_SIZE = 1024 * 1024
+# How long a single chunk can wait for rclone rcat before it's dropped
+RCAT_DRAIN_TIMEOUT = 30
 
 __all__ = ("DownloaderTasks",)
 
@@ -96,6 +114,19 @@ def ydl_format_selector_fallback(formats: List[dict]):
         return None, None
 
 
+def get_mux_output(data: models.VTHellJob, extension: str = ".mkv") -> Path:
+    return STREAMDUMP_PATH / f"{data.filename} [{data.resolution} AAC]{extension}"
+
+
+def find_mux_output(data: models.VTHellJob) -> Path:
+    """Find the final output, passthrough mode keep the original container instead of mkv"""
+    for extension in MUX_OUTPUT_EXTENSIONS:
+        mux_output = get_mux_output(data, extension)
+        if mux_output.exists():
+            return mux_output
+    return get_mux_output(data)
+
+
 def ytarchive_should_cancel(errors: str):
     lower_error = errors.lower()
     if "private" in lower_error:
@@ -105,6 +136,53 @@ def ytarchive_should_cancel(errors: str):
     return False
 
 
+async def tee_to_rclone(
+    job_id: str, stream: asyncio.StreamReader, output_file: Path, rcat_process: asyncio.subprocess.Process
+) -> bool:
+    """
+    Write the stream into the local file while feeding the same chunk to ``rclone rcat``.
+    The local file is always written, so a failed rcat can be reuploaded normally later.
+
+    A stalled rcat that could not take a chunk in ``RCAT_DRAIN_TIMEOUT`` seconds is killed,
+    so a slow uplink will never throttle ffmpeg (and the recording) itself.
+    """
+    rcat_alive = True
+    stderr_task = asyncio.ensure_future(read_stream_tail(rcat_process.stderr))
+    async with aiofiles.open(output_file, "wb") as fp:
+        while True:
+            chunk = await stream.read(STREAM_CHUNK_SIZE)
+            if not chunk:
+                break
+            await fp.write(chunk)
+            if not rcat_alive:
+                continue
+            try:
+                rcat_process.stdin.write(chunk)
+                await asyncio.wait_for(rcat_process.stdin.drain(), RCAT_DRAIN_TIMEOUT)
+            except (BrokenPipeError, ConnectionResetError):
+                logger.error(f"[{job_id}] rclone rcat closed the pipe, continuing with local file only")
+                rcat_alive = False
+            except asyncio.TimeoutError:
+                logger.error(
+                    f"[{job_id}] rclone rcat stalled for {RCAT_DRAIN_TIMEOUT}s, continuing with local file only"
+                )
+                rcat_alive = False
+                try:
+                    rcat_process.kill()
+                except ProcessLookupError:
+                    pass
+    try:
+        rcat_process.stdin.close()
+    except (BrokenPipeError, ConnectionResetError):
+        pass
+    await rcat_process.wait()
+    stderr = await stderr_task
+    if rcat_process.returncode != 0:
+        logger.error(f"[{job_id}] rclone rcat exited with code {rcat_process.returncode}: {stderr}")
+        return False
+    return rcat_alive
+
+
 async def read_and_parse_cookie(cookie_file: Optional[Path]):
     if cookie_file is None:
         return None
@@ -130,6 +208,9 @@ async def read_and_parse_cookie(cookie_file: Optional[Path]):
 
 
 class DownloaderTasks(InternalTaskBase):
+    # Job that has been uploaded with rclone rcat while being recorded
+    _streamed_uploads: Set[str] = set()
+
     @staticmethod
     async def download_video_with_ytarchive(data: models.VTHellJob, app: SanicVTHell):
         notify_chat_dl = map_to_boolean(getenv("VTHELL_CHAT_DOWNLOADER", "false"))
@@ -153,91 +234,88 @@ class DownloaderTasks(InternalTaskBase):
         ytarchive_args.append(f"https://youtube.com/watch?v={data.id}")
         ytarchive_args.append("best")
         logger.debug(f"[{data.id}] Starting ytarchive with args: {ytarchive_args}")
-        ytarchive_process = await asyncio.create_subprocess_exec(
-            *ytarchive_args, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+        ytarchive_process = await app.supervisor.spawn(
+            data.id, "ytarchive", *ytarchive_args, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
         )
         is_error = False
         already_announced = False
         error_line = None
-        while True:
-            try:
-                async for line in ytarchive_process.stdout:
-                    line = line.decode("utf-8").rstrip()
-                    lower_line = line.lower()
-                    if "selected quality" in lower_line:
-                        actual_quality = line.split(": ")[1].split()[0]
-                        data.resolution = actual_quality
-                        await data.save()
-                        logger.info(f"Selected quality: {actual_quality}")
-                    elif "error" in lower_line:
-                        is_error = True
-                        error_line = line
-                        logger.error(f"[{data.id}] {line}")
-                        break
-                    elif "unable to retrieve" in lower_line:
-                        is_error = True
-                        logger.error(f"[{data.id}] {line}")
-                        error_line = line
-                        break
-                    elif "could not find" in lower_line:
-                        is_error = True
-                        logger.error(f"[{data.id}] {line}")
-                        error_line = line
-                        break
-                    elif "unable to download" in lower_line:
-                        is_error = True
-                        logger.error(f"[{data.id}] {line}")
-                        error_line = line
-                        break
-                    elif "starting download" in lower_line and not already_announced:
-                        already_announced = True
-                        await DownloaderTasks.update_state(
-                            data,
-                            app,
-                            models.VTHellJobStatus.downloading,
-                            True,
-                            {"resolution": data.resolution},
+        progress = ProgressReporter(app, data.id)
+        checkpoint = await JobCheckpoint.load(data.id)
+        stderr_task = app.loop.create_task(read_stream_tail(ytarchive_process.stderr))
+        async for line in read_stream_lines(ytarchive_process.stdout):
+            lower_line = line.lower()
+            if "selected quality" in lower_line:
+                actual_quality = line.split(": ")[1].split()[0]
+                data.resolution = actual_quality
+                await app.jobstate.save(data)
+                logger.info(f"Selected quality: {actual_quality}")
+            elif "error" in lower_line:
+                is_error = True
+                error_line = line
+                logger.error(f"[{data.id}] {line}")
+                break
+            elif "unable to retrieve" in lower_line:
+                is_error = True
+                logger.error(f"[{data.id}] {line}")
+                error_line = line
+                break
+            elif "could not find" in lower_line:
+                is_error = True
+                logger.error(f"[{data.id}] {line}")
+                error_line = line
+                break
+            elif "unable to download" in lower_line:
+                is_error = True
+                logger.error(f"[{data.id}] {line}")
+                error_line = line
+                break
+            elif "starting download" in lower_line and not already_announced:
+                already_announced = True
+                await DownloaderTasks.update_state(
+                    data,
+                    app,
+                    models.VTHellJobStatus.downloading,
+                    True,
+                    {"resolution": data.resolution},
+                )
+                if notify_chat_dl:
+                    await app.dispatch("internals.chat.manager", context={"app": app, "video": data})
+            elif "livestream" in lower_line and "process" in lower_line:
+                is_error = True
+                logger.error(f"[{data.id}] {line}")
+                error_line = line
+            if "total downloaded" in lower_line:
+                if await progress.feed(parse_ytarchive_progress(line)):
+                    await checkpoint.update(progress.latest)
+                if not already_announced:
+                    logger.info(f"[{data.id}] Download started for both video and audio")
+                    already_announced = True
+                    await DownloaderTasks.update_state(
+                        data,
+                        app,
+                        models.VTHellJobStatus.downloading,
+                        True,
+                        {
+                            "resolution": data.resolution,
+                        },
+                    )
+                    if notify_chat_dl:
+                        await app.dispatch(
+                            "internals.chat.manager",
+                            context={"app": app, "video": data},
                         )
-                        if notify_chat_dl:
-                            await app.dispatch("internals.chat.manager", context={"app": app, "video": data})
-                    elif "livestream" in lower_line and "process" in lower_line:
-                        is_error = True
-                        logger.error(f"[{data.id}] {line}")
-                        error_line = line
-                    if "total downloaded" in lower_line:
-                        logger.debug(f"[{data.id}] {line}")
-                        if not already_announced:
-                            logger.info(f"[{data.id}] Download started for both video and audio")
-                            already_announced = True
-                            await DownloaderTasks.update_state(
-                                data,
-                                app,
-                                models.VTHellJobStatus.downloading,
-                                True,
-                                {
-                                    "resolution": data.resolution,
-                                },
-                            )
-                            if notify_chat_dl:
-                                await app.dispatch(
-                                    "internals.chat.manager",
-                                    context={"app": app, "video": data},
-                                )
-                    else:
-                        logger.debug(f"[{data.id}] {line}")
-            except ValueError:
-                logger.debug(f"[{data.id}] ytarchive buffer exceeded, silently ignoring...")
-                continue
             else:
-                break
+                logger.debug(f"[{data.id}] {line}")
 
         await ytarchive_process.wait()
+        stderr = await stderr_task
         ret_code = ytarchive_process.returncode
         if is_error or ret_code != 0:
             logger.error(f"[{data.id}] ytarchive exited with code {ret_code}")
+            await checkpoint.update(progress.latest, force=True)
             if error_line is None:
-                error_line = await ytarchive_process.stderr.read()
-                error_line = error_line.decode("utf-8").rstrip()
+                error_line = stderr
             data.last_status = models.VTHellJobStatus.downloading
             data.status = models.VTHellJobStatus.error
             data.error = f"ytarchive exited with code {ret_code} ({error_line})"
@@ -246,7 +324,7 @@ class DownloaderTasks(InternalTaskBase):
             if should_cancel:
                 data.status = models.VTHellJobStatus.cancelled
                 emit_data["status"] = "CANCELLED"
-            await data.save()
+            await app.jobstate.save(data)
             await app.wshandler.emit("job_update", emit_data)
             if app.first_process and app.ipc:
                 await app.ipc.emit("ws_job_update", emit_data)
@@ -282,7 +360,7 @@ class DownloaderTasks(InternalTaskBase):
             data.last_status = models.VTHellJobStatus.downloading
             data.status = models.VTHellJobStatus.cancelled
             data.error = str(exc)
-            await data.save()
+            await app.jobstate.save(data)
             emit_data = {"id": data.id, "status": "CANCELLED", "error": data.error}
             await app.wshandler.emit("job_update", emit_data)
             if app.first_process and app.ipc:
@@ -293,6 +371,7 @@ class DownloaderTasks(InternalTaskBase):
             data.status = models.VTHellJobStatus.error
             data.last_status = models.VTHellJobStatus.downloading
             data.error = f"Failed to extract info from ID {data.id} with yt-dlp"
+            await app.jobstate.save(data)
             data_update = {"id": data.id, "status": "ERROR", "error": "YTDL failed to extract info"}
             await app.wshandler.emit("job_update", data_update)
             if app.first_process and app.ipc:
@@ -316,6 +395,7 @@ class DownloaderTasks(InternalTaskBase):
                 if "captcha" in reason or "private video" in reason:
                     data.status = models.VTHellJobStatus.cancelled
                     data_update["status"] = "CANCELLED"
+            await app.jobstate.save(data)
             await app.wshandler.emit("job_update", data_update)
             if app.first_process and app.ipc:
                 await app.ipc.emit("ws_job_update", data_update)
@@ -331,9 +411,10 @@ class DownloaderTasks(InternalTaskBase):
             video_format, audio_format = ydl_format_selector_fallback(sanitized_json.get("formats", []))
             if video_format is None or audio_format is None:
                 logger.error("Failed to get requested formats from ID %s with yt-dlp", data.id)
-                data.error = models.VTHellJobStatus.error
+                data.status = models.VTHellJobStatus.error
                 data.last_status = models.VTHellJobStatus.downloading
                 data.error = f"Failed to get requested formats for {data.id} with yt-dlp"
+                await app.jobstate.save(data)
                 data_update = {"id": data.id, "status": "ERROR", "error": "YTDL failed to get formats"}
                 await app.wshandler.emit("job_update", data_update)
                 if app.first_process and app.ipc:
@@ -344,7 +425,7 @@ class DownloaderTasks(InternalTaskBase):
         resolution = video_format.get("resolution", video_format.get("format_note", "Unknown"))
         logger.debug(f"[{data.id}] Downloading with resolution {resolution} format")
         data.resolution = resolution
-        await data.save()
+        await app.jobstate.save(data)
 
         ffmpeg_args = [
             app.config.FFMPEG_PATH,
@@ -361,56 +442,91 @@ class DownloaderTasks(InternalTaskBase):
                 "".join(f"{k}: {v}\r\n" for k, v in http_header.items()),
             ]
         )
-        ffmpeg_args.extend(
-            ["-i", video_format["url"], "-i", audio_format["url"], "-c", "copy", temp_file, "-y"]
-        )
+        ffmpeg_args.extend(["-i", video_format["url"], "-i", audio_format["url"], "-c", "copy"])
+        checkpoint = await JobCheckpoint.load(data.id)
+        # Partial download from previous attempt need to be joined first, so it can't be streamed.
+        stream_upload = app.config.RCLONE_STREAM_UPLOAD and not app.config.RCLONE_DISABLE and not checkpoint.parts
+        if stream_upload:
+            # Write mpegts into stdout, which will be teed into local file and rclone rcat
+            ffmpeg_args.extend(["-f", "mpegts", "pipe:1"])
+        else:
+            ffmpeg_args.extend([temp_file, "-y"])
         logger.debug(f"[{data.id}] Starting ffmpeg with args: {ffmpeg_args}")
         # Only pipe stderr since stdout is the actual data.
-        ffmpeg_process = await asyncio.create_subprocess_exec(
-            *ffmpeg_args, stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE
+        ffmpeg_process = await app.supervisor.spawn(
+            data.id,
+            "ffmpeg",
+            *ffmpeg_args,
+            stdout=asyncio.subprocess.PIPE if stream_upload else asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.PIPE,
         )
+        tee_task: Optional[asyncio.Task] = None
+        if stream_upload:
+            target_folder, _ = DownloaderTasks.get_upload_target(data, app)
+            rcat_target = build_rclone_path(target_folder, get_mux_output(data, ".ts").name)
+            rcat_args = [app.config.RCLONE_PATH, "rcat", rcat_target]
+            logger.debug(f"[{data.id}] Starting rclone rcat with args: {rcat_args}")
+            rcat_process = await app.supervisor.spawn(
+                data.id,
+                "rclone",
+                *rcat_args,
+                stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.DEVNULL,
+                stderr=asyncio.subprocess.PIPE,
+            )
+            tee_task = app.loop.create_task(
+                tee_to_rclone(data.id, ffmpeg_process.stdout, temp_file, rcat_process),
+                name=f"downloader-tee-{data.id}",
+            )
         is_error = False
         already_announced = False
         error_line = None
-        while True:
-            try:
-                async for line in ffmpeg_process.stderr:
-                    line = line.decode("utf-8").rstrip()
-                    lower_line = line.lower()
-                    if "press [q] to stop" in lower_line or ("press" in lower_line and "stop" in lower_line):
-                        if not already_announced:
-                            already_announced = True
-                            await DownloaderTasks.update_state(
-                                data,
-                                app,
-                                models.VTHellJobStatus.downloading,
-                                True,
-                                {"resolution": resolution},
-                            )
-                            if notify_chat_dl:
-                                await app.dispatch(
-                                    "internals.chat.manager",
-                                    context={"app": app, "video": data, "force": True},
-                                )
-                    elif "io error" in lower_line:
-                        logger.error(f"[{data.id}] ffmpeg IO error, cancelling...")
-                        is_error = True
-                        error_line = lower_line
-                        break
-                    logger.debug(f"[{data.id}] ffmpeg: {line}")
-            except ValueError:
-                logger.debug(f"[{data.id}] ffmpeg buffer exceeded, silently ignoring...")
-                continue
-            else:
+        progress = ProgressReporter(app, data.id)
+        async for line in read_stream_lines(ffmpeg_process.stderr):
+            lower_line = line.lower()
+            if "press [q] to stop" in lower_line or ("press" in lower_line and "stop" in lower_line):
+                if not already_announced:
+                    already_announced = True
+                    await DownloaderTasks.update_state(
+                        data,
+                        app,
+                        models.VTHellJobStatus.downloading,
+                        True,
+                        {"resolution": resolution},
+                    )
+                    if notify_chat_dl:
+                        await app.dispatch(
+                            "internals.chat.manager",
+                            context={"app": app, "video": data, "force": True},
+                        )
+            elif "io error" in lower_line:
+                logger.error(f"[{data.id}] ffmpeg IO error, cancelling...")
+                is_error = True
+                error_line = lower_line
                 break
+            ffmpeg_progress = parse_ffmpeg_progress(line)
+            if ffmpeg_progress is not None:
+                if await progress.feed(ffmpeg_progress):
+                    await checkpoint.update(progress.latest)
+            else:
+                logger.debug(f"[{data.id}] ffmpeg: {line}")
 
         await ffmpeg_process.wait()
         ret_code = ffmpeg_process.returncode
+        if tee_task is not None:
+            if await tee_task:
+                logger.info(f"[{data.id}] Stream has been uploaded with rclone rcat while recording")
+                DownloaderTasks._streamed_uploads.add(data.id)
+            else:
+                logger.warning(f"[{data.id}] rclone rcat failed, will be uploaded normally later")
         if ret_code != 0 or is_error:
+            DownloaderTasks._streamed_uploads.discard(data.id)
             logger.error(f"[{data.id}] ffmpeg exited with code {ret_code}")
+            await checkpoint.update(progress.latest, force=True)
             data.status = models.VTHellJobStatus.error
             data.last_status = models.VTHellJobStatus.muxing
             data.error = f"ffmpeg exited with code {ret_code}: {error_line}"
+            await app.jobstate.save(data)
             data_update = {"id": data.id, "status": "ERROR", "error": "FFMPEG+YTDL_DL_FAIL"}
             await app.wshandler.emit("job_update", data_update)
             if app.first_process and app.ipc:
@@ -418,6 +534,28 @@ class DownloaderTasks(InternalTaskBase):
             return True
         return False
 
+    @staticmethod
+    async def preserve_partial_download(data: models.VTHellJob, app: SanicVTHell):
+        """Keep the output of the previous failed attempt as a part instead of overwriting it"""
+        checkpoint = await JobCheckpoint.load(data.id)
+        for extension in (".mp4", ".ts"):
+            temp_output = STREAMDUMP_PATH / f"{data.filename} [temp]{extension}"
+            if not await app.loop.run_in_executor(None, temp_output.exists):
+                continue
+            if (await aiofiles.os.stat(str(temp_output))).st_size == 0:
+                continue
+            part_name = f"{data.filename} [temp] [part{len(checkpoint.parts) + 1}]{extension}"
+            try:
+                await aiofiles.os.rename(str(temp_output), str(STREAMDUMP_PATH / part_name))
+            except OSError as exc:
+                logger.error(f"[{data.id}] Failed to keep partial download {temp_output}", exc_info=exc)
+                continue
+            logger.info(
+                f"[{data.id}] Keeping partial download as {part_name} "
+                f"({checkpoint.fragments} fragments, {checkpoint.downloaded} bytes)"
+            )
+            await checkpoint.add_part(part_name)
+
     @staticmethod
     async def download_stream(data: models.VTHellJob, app: SanicVTHell):
         is_error, error_line = await DownloaderTasks.download_video_with_ytarchive(data, app)
@@ -437,20 +575,64 @@ class DownloaderTasks(InternalTaskBase):
 
     @staticmethod
     async def mux_files(data: models.VTHellJob, app: SanicVTHell):
-        # Spawn mkvmerge
+        passthrough = app.config.VTHELL_MUX_MODE == "passthrough"
+        checkpoint = await JobCheckpoint.get(data.id)
+        part_files: List[Path] = []
+        if checkpoint is not None:
+            for part_file in checkpoint.part_files:
+                part_path = STREAMDUMP_PATH / part_file
+                if await app.loop.run_in_executor(None, part_path.exists):
+                    part_files.append(part_path)
+        if part_files and passthrough:
+            logger.info(f"[{data.id}] Job has {len(part_files)} partial download, muxing with mkvmerge to join them.")
+            passthrough = False
         temp_output = STREAMDUMP_PATH / f"{data.filename} [temp].mp4"
         if not await app.loop.run_in_executor(None, temp_output.exists):
             temp_output = STREAMDUMP_PATH / f"{data.filename} [temp].ts"
             if not await app.loop.run_in_executor(None, temp_output.exists):
-                logger.warning(f"[{data.id}] downloaded file not found, skipping.")
+                if passthrough and await app.loop.run_in_executor(None, find_mux_output(data).exists):
+                    logger.info(f"[{data.id}] downloaded file already renamed, skipping.")
+                    return False
+                if not part_files:
+                    logger.warning(f"[{data.id}] downloaded file not found, skipping.")
+                    return True
+                # The last attempt produced nothing, mux whatever partial download we have.
+                temp_output = part_files.pop()
+        if passthrough:
+            # Keep the original container and only rename it, the file is never rewritten.
+            mux_output = get_mux_output(data, temp_output.suffix)
+            logger.debug(f"[{data.id}] Passthrough mode, renaming {temp_output} to {mux_output}")
+            try:
+                await aiofiles.os.rename(str(temp_output), str(mux_output))
+            except OSError as exc:
+                logger.error(f"[{data.id}] Failed to rename downloaded file", exc_info=exc)
+                data.status = models.VTHellJobStatus.error
+                data.last_status = models.VTHellJobStatus.muxing
+                data.error = f"Failed to rename downloaded file: {exc}"
+                await app.jobstate.save(data)
+                data_update = {"id": data.id, "status": "ERROR", "error": "MKV_MUX_FAIL"}
+                await app.wshandler.emit("job_update", data_update)
+                if app.first_process and app.ipc:
+                    await app.ipc.emit("ws_job_update", data_update)
                 return True
+            return False
+
+        # Spawn mkvmerge
         logger.debug(f"[{data.id}] Will mux the following output: {temp_output}")
-        mux_output = STREAMDUMP_PATH / f"{data.filename} [{data.resolution} AAC].mkv"
-        mkvmerge_args = [app.config.MKVMERGE_PATH, "-o", str(mux_output), str(temp_output)]
+        mux_output = get_mux_output(data)
+        mkvmerge_args = [app.config.MKVMERGE_PATH, "-o", str(mux_output)]
+        # Append the kept partial download in order, then the last attempt
+        for part_path in part_files:
+            mkvmerge_args.extend([str(part_path), "+"])
+        mkvmerge_args.append(str(temp_output))
 
         logger.debug(f"[{data.id}] Starting mkvmerge with args: {mkvmerge_args}")
-        mkvmerge_process = await asyncio.create_subprocess_exec(
-            *mkvmerge_args, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+        mkvmerge_process = await app.supervisor.spawn(
+            data.id, "mkvmerge", *mkvmerge_args, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+        )
+        # Drain both pipes while waiting, mkvmerge progress can fill the pipe buffer.
+        stdout, stderr = await asyncio.gather(
+            read_stream_tail(mkvmerge_process.stdout), read_stream_tail(mkvmerge_process.stderr)
         )
         await mkvmerge_process.wait()
         ret_code = mkvmerge_process.returncode
@@ -458,14 +640,12 @@ class DownloaderTasks(InternalTaskBase):
             logger.error(
                 f"[{data.id}] mkvmerge exited with code {ret_code}, aborting uploading please do manual upload later!"
             )
-            stderr = await mkvmerge_process.stderr.read()
-            stdout = await mkvmerge_process.stdout.read()
             if not stderr:
                 stderr = stdout
-            stderr = stderr.decode("utf-8").rstrip()
             data.status = models.VTHellJobStatus.error
             data.last_status = models.VTHellJobStatus.muxing
             data.error = f"mkvmerge exited with code {ret_code}:\n{stderr}"
+            await app.jobstate.save(data)
             data_update = {"id": data.id, "status": "ERROR", "error": "MKV_MUX_FAIL"}
             await app.wshandler.emit("job_update", data_update)
             if app.first_process and app.ipc:
@@ -474,61 +654,66 @@ class DownloaderTasks(InternalTaskBase):
         return False
 
     @staticmethod
-    async def upload_files(data: models.VTHellJob, app: SanicVTHell):
-        mux_output = STREAMDUMP_PATH / f"{data.filename} [{data.resolution} AAC].mkv"
-        if not mux_output.exists():
-            logger.warning(f"[{data.id}] muxed file not found, skipping.")
-            return True
-
+    def get_upload_target(data: models.VTHellJob, app: SanicVTHell) -> Tuple[str, str]:
         base_folder = "Stream Archive"
         if data.member_only:
             base_folder = "Member-Only Stream Archive"
-        joined_target = []
         joined_target = app.create_rclone_path(data.channel_id, "youtube")
 
         target_folder = build_rclone_path(app.config.RCLONE_DRIVE_TARGET, base_folder, *joined_target)
         announce_folder = build_rclone_path("mock:", base_folder, *joined_target).split("mock:", 1)[1]
+        return target_folder, announce_folder
+
+    @staticmethod
+    async def upload_files(data: models.VTHellJob, app: SanicVTHell):
+        mux_output = find_mux_output(data)
+        if not mux_output.exists():
+            logger.warning(f"[{data.id}] muxed file not found, skipping.")
+            return True
+
+        target_folder, announce_folder = DownloaderTasks.get_upload_target(data, app)
         await DownloaderTasks.update_state(
             data,
             app,
             models.VTHellJobStatus.uploading,
             True,
             {
-                "filename": f"{data.filename} [{data.resolution} AAC].mkv",
+                "filename": mux_output.name,
                 "path": announce_folder,
             },
         )
         rclone_args = [app.config.RCLONE_PATH, "-v", "-P", "copy", str(mux_output), target_folder]
         logger.debug(f"[{data.id}] Starting rclone with args: {rclone_args}")
-        rclone_process = await asyncio.create_subprocess_exec(
-            *rclone_args, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+        rclone_process = await app.supervisor.spawn(
+            data.id, "rclone", *rclone_args, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
         )
         error_line = ""
-        while True:
-            try:
-                async for line in rclone_process.stdout:
-                    line = line.decode("utf-8").rstrip()
-                    logger.debug(f"[{data.id}] rclone: {line}")
-                    if "error" in line.lower():
-                        error_line = line
-                    elif "failed to copy" in line.lower():
-                        error_line = line
-            except Exception:
-                logger.debug(f"[{data.id}] rclone buffer exceeded, silently ignoring...")
+        progress = ProgressReporter(app, data.id)
+        stderr_task = app.loop.create_task(read_stream_tail(rclone_process.stderr))
+        async for line in read_stream_lines(rclone_process.stdout):
+            rclone_progress = parse_rclone_progress(line)
+            if rclone_progress is not None:
+                await progress.feed(rclone_progress)
                 continue
-            else:
-                break
+            logger.debug(f"[{data.id}] rclone: {line}")
+            if "error" in line.lower():
+                error_line = line
+            elif "failed to copy" in line.lower():
+                error_line = line
 
         await rclone_process.wait()
+        stderr = await stderr_task
         ret_code = rclone_process.returncode
         if ret_code != 0:
             logger.error(
                 f"[{data.id}] rclone exited with code {ret_code}, aborting uploading please do manual upload later!"
             )
+            if not error_line:
+                error_line = stderr
             data.status = models.VTHellJobStatus.error
             data.last_status = models.VTHellJobStatus.uploading
             data.error = f"rclone exited with code {ret_code}:\n{error_line}"
-            await data.save()
+            await app.jobstate.save(data)
             data_update = {"id": data.id, "status": "ERROR", "error": "RCLONE_UPLOAD_FAIL"}
             await app.wshandler.emit("job_update", data_update)
             if app.first_process and app.ipc:
@@ -536,9 +721,20 @@ class DownloaderTasks(InternalTaskBase):
             return True
         return False
 
+    @staticmethod
+    async def run_stage(
+        stage: str,
+        stage_func: Callable[[models.VTHellJob, SanicVTHell], Awaitable[bool]],
+        data: models.VTHellJob,
+        app: SanicVTHell,
+    ) -> bool:
+        # Wait for a free worker on the stage pool before running it.
+        async with app.jobpipeline.stage(stage, data):
+            return await stage_func(data, app)
+
     @staticmethod
     async def cleanup_files(data: models.VTHellJob, app: SanicVTHell):
-        mux_output = STREAMDUMP_PATH / f"{data.filename} [{data.resolution} AAC].mkv"
+        mux_output = find_mux_output(data)
         temp_output_mp4 = STREAMDUMP_PATH / f"{data.filename} [temp].mp4"
         temp_output_ts = STREAMDUMP_PATH / f"{data.filename} [temp].ts"
         try:
@@ -551,6 +747,7 @@ class DownloaderTasks(InternalTaskBase):
             await aiofiles.os.remove(str(temp_output_ts))
         except Exception:
             logger.error(f"[{data.id}] Failed to delete temporary ts files, silently skipping")
+        await JobCheckpoint.discard(data.id)
 
         if app.config.RCLONE_DISABLE:
             logger.info(f"[{data.id}] Rclone is disabled, skipping muxed mkv deletion...")
@@ -566,42 +763,46 @@ class DownloaderTasks(InternalTaskBase):
         logger.info(f"[{data.id}] Trying to process error job.")
         if data.last_status == models.VTHellJobStatus.downloading:
             logger.info(f"[{data.id}][d] Last status was download job, trying to redo from download point.")
+            await DownloaderTasks.preserve_partial_download(data, app)
             # Reset to preparing
             await DownloaderTasks.update_state(data, app, models.VTHellJobStatus.preparing)
-            is_error = await DownloaderTasks.download_stream(data, app)
+            is_error = await DownloaderTasks.run_stage("download", DownloaderTasks.download_stream, data, app)
             if is_error:
                 logger.error(f"[{data.id}][d] Failed to redo stream download, aborting job.")
                 return
-            logger.info(f"[{data.id}][m] download job redone, continuing with muxing files...")
-            is_error = await DownloaderTasks.mux_files(data, app)
-            if is_error:
-                logger.error(f"[{data.id}][m] Failed to redo mux job, aborting.")
-                return
-            logger.info(f"[{data.id}][m] Mux job done, continuing with upload files...")
-            if not app.config.RCLONE_DISABLE:
-                is_error = await DownloaderTasks.upload_files(data, app)
+            if DownloaderTasks.pop_streamed_upload(data.id):
+                logger.info(f"[{data.id}][d] download job redone and uploaded while recording, cleaning files...")
+            else:
+                logger.info(f"[{data.id}][m] download job redone, continuing with muxing files...")
+                is_error = await DownloaderTasks.run_stage("mux", DownloaderTasks.mux_files, data, app)
                 if is_error:
-                    logger.error(f"[{data.id}][m] Failed to do upload job, aborting.")
+                    logger.error(f"[{data.id}][m] Failed to redo mux job, aborting.")
                     return
-                logger.info(f"[{data.id}][m] Upload job done, cleaning files...")
-            else:
-                logger.info(f"[{data.id}][m] Upload step skipped since Rclone is disabled...")
+                logger.info(f"[{data.id}][m] Mux job done, continuing with upload files...")
+                if not app.config.RCLONE_DISABLE:
+                    is_error = await DownloaderTasks.run_stage("upload", DownloaderTasks.upload_files, data, app)
+                    if is_error:
+                        logger.error(f"[{data.id}][m] Failed to do upload job, aborting.")
+                        return
+                    logger.info(f"[{data.id}][m] Upload job done, cleaning files...")
+                else:
+                    logger.info(f"[{data.id}][m] Upload step skipped since Rclone is disabled...")
             await DownloaderTasks.update_state(data, app, models.VTHellJobStatus.cleaning, True)
             await DownloaderTasks.cleanup_files(data, app)
             logger.info(f"[{data.id}] Cleanup job done, marking job as finished!")
             data.status = models.VTHellJobStatus.done
             data.error = None
             data.last_status = None
-            await data.save()
+            await app.jobstate.save(data)
         elif data.last_status == models.VTHellJobStatus.muxing:
             logger.info(f"[{data.id}][m] Last status was mux job, trying to redo from mux point.")
-            is_error = await DownloaderTasks.mux_files(data, app)
+            is_error = await DownloaderTasks.run_stage("mux", DownloaderTasks.mux_files, data, app)
             if is_error:
                 logger.error(f"[{data.id}][m] Failed to redo mux job, aborting.")
                 return
             logger.info(f"[{data.id}][m] Mux job redone, continuing with upload files...")
             if not app.config.RCLONE_DISABLE:
-                is_error = await DownloaderTasks.upload_files(data, app)
+                is_error = await DownloaderTasks.run_stage("upload", DownloaderTasks.upload_files, data, app)
                 if is_error:
                     logger.error(f"[{data.id}][m] Failed to do upload job, aborting.")
                     return
@@ -614,11 +815,11 @@ class DownloaderTasks(InternalTaskBase):
             data.status = models.VTHellJobStatus.done
             data.error = None
             data.last_status = None
-            await data.save()
+            await app.jobstate.save(data)
         elif data.last_status == models.VTHellJobStatus.uploading:
             logger.info(f"[{data.id}][u] Last status was upload job, trying to redo from upload point.")
             if not app.config.RCLONE_DISABLE:
-                is_error = await DownloaderTasks.upload_files(data, app)
+                is_error = await DownloaderTasks.run_stage("upload", DownloaderTasks.upload_files, data, app)
                 if is_error:
                     logger.error(f"[{data.id}][u] Failed to redo upload job, aborting.")
                     return
@@ -631,7 +832,7 @@ class DownloaderTasks(InternalTaskBase):
             data.status = models.VTHellJobStatus.done
             data.error = None
             data.last_status = None
-            await data.save()
+            await app.jobstate.save(data)
         elif data.last_status == models.VTHellJobStatus.cleaning:
             logger.info(f"[{data.id}][c] Last status was cleanup job, trying to redo from cleanup point.")
             await DownloaderTasks.cleanup_files(data, app)
@@ -639,7 +840,7 @@ class DownloaderTasks(InternalTaskBase):
             data.status = models.VTHellJobStatus.done
             data.error = None
             data.last_status = None
-            await data.save()
+            await app.jobstate.save(data)
 
     @staticmethod
     async def update_state(
@@ -652,7 +853,7 @@ class DownloaderTasks(InternalTaskBase):
         data.status = status
         data.error = None
         data.last_status = None
-        await data.save()
+        await app.jobstate.save(data)
         data_update = {"id": data.id, "status": status.value}
         if extras:
             extras.pop("id", None)
@@ -685,29 +886,32 @@ class DownloaderTasks(InternalTaskBase):
 
         logger.info(f"Trying to start job {data.id}")
         await DownloaderTasks.update_state(data, app, models.VTHellJobStatus.preparing)
-        is_error = await DownloaderTasks.download_stream(data, app)
+        is_error = await DownloaderTasks.run_stage("download", DownloaderTasks.download_stream, data, app)
         if is_error:
             return
 
-        await DownloaderTasks.update_state(data, app, models.VTHellJobStatus.muxing, True)
-        logger.info(f"Job {data.id} finished downloading, muxing into mkv files...")
-        is_error = await DownloaderTasks.mux_files(data, app)
-        if is_error:
-            return
-
-        if not app.config.RCLONE_DISABLE:
-            logger.info(f"Job {data.id} finished muxing, uploading to drive target...")
-            is_error = await DownloaderTasks.upload_files(data, app)
+        if DownloaderTasks.pop_streamed_upload(data.id):
+            logger.info(f"Job {data.id} already uploaded while recording, skipping mux and upload...")
+        else:
+            await DownloaderTasks.update_state(data, app, models.VTHellJobStatus.muxing, True)
+            logger.info(f"Job {data.id} finished downloading, muxing into mkv files...")
+            is_error = await DownloaderTasks.run_stage("mux", DownloaderTasks.mux_files, data, app)
             if is_error:
                 return
-            logger.info(f"Job {data.id} finished uploading, deleting temp files...")
-        else:
-            logger.info(f"Job {data.id} finished muxing, skipping upload since rclone is disabled...")
+
+            if not app.config.RCLONE_DISABLE:
+                logger.info(f"Job {data.id} finished muxing, uploading to drive target...")
+                is_error = await DownloaderTasks.run_stage("upload", DownloaderTasks.upload_files, data, app)
+                if is_error:
+                    return
+                logger.info(f"Job {data.id} finished uploading, deleting temp files...")
+            else:
+                logger.info(f"Job {data.id} finished muxing, skipping upload since rclone is disabled...")
 
         data.status = models.VTHellJobStatus.cleaning
         data.error = None
         data.last_status = None
-        await data.save()
+        await app.jobstate.save(data)
         await app.dispatch(
             "internals.notifier.discord",
             context={"app": app, "data": data, "emit_type": "update"},
@@ -722,51 +926,85 @@ class DownloaderTasks(InternalTaskBase):
         data.status = models.VTHellJobStatus.done
         data.error = None
         data.last_status = None
-        await data.save()
+        await app.jobstate.save(data)
 
     @staticmethod
     async def get_scheduled_job():
         try:
-            all_jobs = await models.VTHellJob.all()
-            all_jobs = list(
-                filter(
-                    lambda job: job.status
-                    not in [models.VTHellJobStatus.done, models.VTHellJobStatus.cancelled],
-                    all_jobs,
-                )
-            )
+            # Only the job that can be armed, the timer only need this three fields.
+            all_jobs = await models.VTHellJob.filter(
+                status__in=[models.VTHellJobStatus.waiting, models.VTHellJobStatus.error]
+            ).only("id", "start_time", "status")
         except Exception as e:
             logger.error(f"Failed to get scheduled jobs: {e}", exc_info=e)
             return []
         return all_jobs
 
+    @classmethod
+    def _is_job_running(cls: Type[DownloaderTasks], job_id: str) -> bool:
+        prefix = f"downloader-{job_id}-"
+        return any(name.startswith(prefix) for name in cls._tasks.keys())
+
+    @classmethod
+    def pop_streamed_upload(cls: Type[DownloaderTasks], job_id: str) -> bool:
+        if job_id in cls._streamed_uploads:
+            cls._streamed_uploads.discard(job_id)
+            return True
+        return False
+
+    @staticmethod
+    def executor_rearm(data: models.VTHellJob, app: SanicVTHell):
+        def _rearm_callback(task: asyncio.Task):
+            ctime = pendulum.now("UTC").int_timestamp
+            if data.status == models.VTHellJobStatus.error:
+                # Retry errored job on the next downloader loop
+                retry_at = ctime + app.config.VTHELL_LOOP_DOWNLOADER
+                logger.info(f"Job {data.id} errored, will be retried at {retry_at}")
+                app.jobtimer.arm(data.id, retry_at)
+            elif data.status == models.VTHellJobStatus.waiting:
+                # The start time got pushed back while the job is being dispatched
+                if data.start_time - app.config.VTHELL_GRACE_PERIOD > ctime:
+                    app.jobtimer.schedule(data)
+
+        return _rearm_callback
+
     @classmethod
     async def main_loop(cls: Type[DownloaderTasks], app: SanicVTHell):
         if not app.first_process:
             logger.warning("Downloader is not running in the first process, skipping it")
             return
         loop = app.loop
-        config = app.config
         await app.wait_until_ready()
+        if map_to_boolean(getenv("SKIP_MAIN_TASK", "0")):
+            logger.info("Skipping main task loop")
+            return
+        # Clean up after previous run before arming, stuck job will be marked as error.
+        await app.supervisor.reconcile()
+        timer = app.jobtimer
+        for job in await cls.get_scheduled_job():
+            timer.schedule(job)
+        logger.info(f"Armed {len(timer)} scheduled job(s), next job is due at {timer.next_due}")
         try:
             while True:
-                if map_to_boolean(getenv("SKIP_MAIN_TASK", "0")):
-                    logger.info("Skipping main task loop")
-                    return
+                due_jobs = await timer.wait()
                 ctime = pendulum.now("UTC").int_timestamp
-                logger.info(f"Checking for scheduled jobs at {ctime}")
-                scheduled_jobs = await cls.get_scheduled_job()
-                for job in scheduled_jobs:
+                logger.info(f"Got {len(due_jobs)} due job(s) at {ctime}")
+                for job_id in due_jobs:
+                    if cls._is_job_running(job_id):
+                        logger.info(f"Job {job_id} is still being processed, skipping")
+                        continue
+                    job = await models.VTHellJob.get_or_none(id=job_id)
+                    if job is None:
+                        logger.warning(f"Job {job_id} is missing from database, skipping")
+                        continue
                     task_name = f"downloader-{job.id}-{ctime}"
                     try:
                         task = loop.create_task(cls.executor(job, ctime, task_name, app), name=task_name)
                         task.add_done_callback(cls.executor_done)
+                        task.add_done_callback(cls.executor_rearm(job, app))
                         cls._tasks[task_name] = task
                     except Exception as e:
                         logger.error(f"Failed to create task {task_name}: {e}", exc_info=e)
-                if not scheduled_jobs:
-                    logger.info("No scheduled jobs found")
-                await asyncio.sleep(config.VTHELL_LOOP_DOWNLOADER)
         except asyncio.CancelledError:
             logger.warning("Got cancel signal, cleaning up all running tasks")
             for name, task in cls._tasks.items():
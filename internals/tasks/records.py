@@ -91,6 +91,20 @@ def utcstamp_to_unix(isodate: Optional[str]) -> Optional[int]:
     return int(round(as_utc.timestamp()))
 
 
+# rclone does not know most of these, so it will report them as a generic binary
+COMPRESSED_CHAT_MIMETYPES = {
+    ".json.zst": "application/zstd",
+    ".json.gz": "application/gzip",
+}
+
+
+def guess_mimetype(file: RCloneListJson) -> str:
+    for suffix, mimetype in COMPRESSED_CHAT_MIMETYPES.items():
+        if file["Name"].endswith(suffix):
+            return mimetype
+    return file.get("MimeType", "application/octet-stream")
+
+
 VALID_SUBFOLDER = [
     "Chat Archive",
     "Member-Only Chat Archive",
@@ -191,7 +205,7 @@ class RecordedStreamTasks(InternalTaskBase):
                     name=files,
                     type="file",
                     size=file["Size"],
-                    mimetype=file.get("MimeType", "application/octet-stream"),
+                    mimetype=guess_mimetype(file),
                     modtime=utcstamp_to_unix(file.get("ModTime")),
                 )
                 use_base.children.append(sub_data)
@@ -26,14 +26,16 @@ from __future__ import annotations
 
 import asyncio
 import logging
-import re
 from os import getenv
-from typing import TYPE_CHECKING, Dict, List, Type
+from typing import TYPE_CHECKING, Dict, List, Optional, Type
 
 import pendulum
+from tortoise.exceptions import IntegrityError
+from tortoise.transactions import in_transaction
 
+from internals.autoscheduler import CompiledRuleSet
 from internals.db import models
-from internals.holodex import HolodexVideo
+from internals.holodex import HolodexLiveDelta, HolodexLiveMirror, HolodexVideo
 from internals.struct import InternalTaskBase
 from internals.utils import map_to_boolean, secure_filename
 
@@ -45,193 +47,212 @@ logger = logging.getLogger("Tasks.AutoScheduler")
 __all__ = ("AutoSchedulerTasks",)
 
 
-def determine_chains(chains: List[Dict[str, str]], data: HolodexVideo):
-    if not chains:
-        return True
-    chains_results = []
-    for chain in chains:
-        if chain["type"] == "word":
-            if chain["data"].casefold() in data.title.casefold():
-                chains_results.append(True)
-            else:
-                chains_results.append(False)
-        elif chain["type"] == "regex_word":
-            if re.search(chain["data"], data.title, re.IGNORECASE):
-                chains_results.append(True)
-            else:
-                chains_results.append(False)
-        elif chain["type"] == "group":
-            if data.org and chain["data"].casefold() == data.org.casefold():
-                chains_results.append(True)
-            else:
-                chains_results.append(False)
-        elif chain["type"] == "channel":
-            if chain["data"] == data.channel_id:
-                chains_results.append(True)
-            else:
-                chains_results.append(False)
-    return all(chains_results)
-
-
 class AutoSchedulerTasks(InternalTaskBase):
     @staticmethod
-    async def executor(
-        schedulers: List[models.VTHellAutoScheduler], time: int, task_name: str, app: SanicVTHell
-    ):
+    async def executor(rules: CompiledRuleSet, time: int, task_name: str, app: SanicVTHell):
         logger.info(f"Executing auto scheduler job {time} (task {task_name})")
-        if len(schedulers) < 1:
+        if rules.total < 1:
             logger.info("No auto schedulers found")
             return
 
-        include = list(filter(lambda x: x.include, schedulers))
-        if len(include) < 1:
+        if not rules.has_include:
             logger.warning("No active auto schedulers found")
             return
 
-        exclude = list(filter(lambda x: not x.include, schedulers))
-        existing_jobs = await models.VTHellJob.all()
-        existing_jobs_ids = [job.id for job in existing_jobs]
-
         logger.info("Checking Holodex for live and scheduled stream...")
-        results = await app.holodex.get_lives()
-        if len(results) < 1:
+        delta = await app.holodex.sync_lives()
+        if delta is None:
+            logger.warning("Failed to sync lives/upcoming stream from Holodex")
+            return
+        lives = app.holodex.lives
+        if len(lives) < 1:
             logger.warning("No lives/upcoming stream found from Holodex")
+            lives.evaluated_by = rules
             return
-        logger.info(f"Found {len(results)} live/upcoming stream(s)")
 
-        exclude_ids = list(
-            map(lambda x: x.data, filter(lambda x: x.type == models.VTHellAutoType.channel, exclude))
-        )
-        exclude_groups = list(
-            map(lambda x: x.data.casefold(), filter(lambda x: x.type == models.VTHellAutoType.group, exclude))
-        )
-        word_blacklist = list(
-            map(lambda x: x.data, filter(lambda x: x.type == models.VTHellAutoType.word, exclude))
-        )
-        regex_blacklist = list(
-            map(
-                lambda x: re.compile(x.data, re.I),
-                filter(lambda x: x.type == models.VTHellAutoType.regex_word, exclude),
-            )
-        )
+        await AutoSchedulerTasks.evaluate_mirror(lives, delta, rules, time, app)
 
-        logger.info("Filtering results with exclude filters...")
-        filtered_videos: List[HolodexVideo] = []
-        for video in results:
-            if video.channel_id in exclude_ids:
-                continue
-            if video.org and video.org in exclude_groups:
-                continue
-            skip_it = False
-            for blacklist in word_blacklist:
-                if blacklist.casefold() in video.title.casefold():
-                    skip_it = True
-                    break
-            if skip_it:
-                continue
-            skip_it = False
-            for blacklist in regex_blacklist:
-                if blacklist.search(video.title) is not None:
-                    skip_it = True
-                    break
-            if skip_it:
-                continue
-            filtered_videos.append(video)
-
-        if len(filtered_videos) < 1:
-            logger.warning("No videos found to be scheduled since all of them got filtered at the start")
+    @staticmethod
+    async def evaluate_mirror(
+        lives: HolodexLiveMirror, delta: HolodexLiveDelta, rules: CompiledRuleSet, time: int, app: SanicVTHell
+    ):
+        if lives.evaluated_by is not rules:
+            # First run or the rules got changed, everything need to be checked again.
+            candidates = list(lives.videos.values())
+            logger.info(f"Checking all {len(candidates)} live/upcoming stream(s) with the current rules")
+        else:
+            candidates = delta.updated
+            logger.info(
+                f"Found {len(lives)} live/upcoming stream(s), {len(delta.added)} new and "
+                f"{len(delta.changed)} changed since last check"
+            )
+        if len(candidates) < 1:
+            logger.info("No new or changed live/upcoming stream, skipping")
+            lives.evaluated_by = rules
             return
+        # Reset it until this run finished, so a failed run will check everything again next time
+        lives.evaluated_by = None
 
-        include_ids = list(
-            map(lambda x: x.data, filter(lambda x: x.type == models.VTHellAutoType.channel, include))
-        )
-        include_groups = list(
-            map(lambda x: x.data.casefold(), filter(lambda x: x.type == models.VTHellAutoType.group, include))
-        )
-        word_whitelist = list(filter(lambda x: x.type == models.VTHellAutoType.word, include))
-        regex_whitelist = list(filter(lambda x: x.type == models.VTHellAutoType.regex_word, include))
-
-        logger.info("Filtering results with include filters...")
-        double_filtered_videos: List[HolodexVideo] = []
-        for video in filtered_videos:
-            if video.channel_id in include_ids:
-                double_filtered_videos.append(video)
-                continue
-            if video.org and video.org.casefold() in include_groups:
-                double_filtered_videos.append(video)
-                continue
-            include_it = False
-            for whitelist in word_whitelist:
-                if whitelist.data.casefold() in video.title.casefold():
-                    if determine_chains(whitelist.chains, video):
-                        include_it = True
-                        break
-            if include_it:
-                double_filtered_videos.append(video)
-                continue
-            include_it = False
-            for whitelist in regex_whitelist:
-                if whitelist.search(video.title) is not None:
-                    if determine_chains(whitelist.chains, video):
-                        include_it = True
-                        break
-            if include_it:
-                double_filtered_videos.append(video)
-                continue
-
+        logger.info("Filtering results with include/exclude filters...")
+        double_filtered_videos = rules.filter(candidates)
         if len(double_filtered_videos) < 1:
             logger.warning("No videos found to be schedule with both include/exclude filters")
+            lives.evaluated_by = rules
             return
 
-        deduplicated_videos: List[HolodexVideo] = []
-        for video in double_filtered_videos:
-            if video.id in existing_jobs_ids:
-                continue
-            deduplicated_videos.append(video)
+        # Holodex should not return duplicate, but make sure anyway.
+        candidate_videos: Dict[str, HolodexVideo] = {video.id: video for video in double_filtered_videos}
+        existing_jobs_ids = set(
+            await models.VTHellJob.filter(id__in=list(candidate_videos.keys())).values_list("id", flat=True)
+        )
+        for video_id in existing_jobs_ids:
+            logger.debug(f"Video <{video_id}> already scheduled, skipping")
+            candidate_videos.pop(video_id, None)
+        if len(candidate_videos) < 1:
+            logger.info("All matching videos are already scheduled")
+            lives.evaluated_by = rules
+            return
 
         # Add to database/schedule it
-        logger.info(f"Adding {len(double_filtered_videos)} videos to the jobs scheduler")
-        executed_videos = []
-        for video in double_filtered_videos:
-            if video.id in executed_videos or video.id in existing_jobs_ids:
-                logger.warning(f"Video <{video.id}> already scheduled, skipping")
-                continue
+        logger.info(f"Adding {len(candidate_videos)} videos to the jobs scheduler")
+        jobs: List[models.VTHellJob] = []
+        for video in candidate_videos.values():
             title_safe = secure_filename(video.title)
             utc_unix = pendulum.from_timestamp(video.start_time, tz="UTC")
             as_jst = utc_unix.in_timezone("Asia/Tokyo")
             filename = f"[{as_jst.year}.{as_jst.month}.{as_jst.day}.{video.id}] {title_safe}"
-            job = models.VTHellJob(
-                id=video.id,
-                title=video.title,
-                filename=filename,
-                start_time=video.start_time,
-                channel_id=video.channel_id,
-                member_only=video.is_member,
-            )
-            logger.info(f"Scheduling <{video.id}> from Autoscheduler run {time}")
-            await job.save()
-            executed_videos.append(video.id)
-            await app.dispatch(
-                "internals.notifier.discord", context={"app": app, "data": job, "emit_type": "schedule"}
+            jobs.append(
+                models.VTHellJob(
+                    id=video.id,
+                    title=video.title,
+                    filename=filename,
+                    start_time=video.start_time,
+                    channel_id=video.channel_id,
+                    member_only=video.is_member,
+                )
             )
-            data_update = {
-                "id": job.id,
-                "title": job.title,
-                "filename": job.filename,
-                "start_time": job.start_time,
-                "channel_id": job.channel_id,
-                "is_member": job.member_only,
-                "status": job.status.value,
-                "resolution": job.resolution,
-                "error": job.error,
-            }
-            await app.wshandler.emit("job_scheduled", data_update)
-            if app.first_process and app.ipc:
-                await app.ipc.emit("ws_job_scheduled", data_update)
+        jobs = await AutoSchedulerTasks.insert_jobs(jobs)
+        if len(jobs) < 1:
+            lives.evaluated_by = rules
+            return
+
+        logger.info(f"Scheduled {len(jobs)} job(s) from Autoscheduler run {time}")
+        for job in jobs:
+            await app.jobtimer.reschedule(job)
+        await app.dispatch(
+            "internals.notifier.discord", context={"app": app, "data": jobs, "emit_type": "schedule_batch"}
+        )
+        data_update = {
+            "jobs": [
+                {
+                    "id": job.id,
+                    "title": job.title,
+                    "filename": job.filename,
+                    "start_time": job.start_time,
+                    "channel_id": job.channel_id,
+                    "is_member": job.member_only,
+                    "status": job.status.value,
+                    "resolution": job.resolution,
+                    "error": job.error,
+                }
+                for job in jobs
+            ]
+        }
+        await app.wshandler.emit("jobs_scheduled", data_update)
+        if app.first_process and app.ipc:
+            await app.ipc.emit("ws_jobs_scheduled", data_update)
+        lives.evaluated_by = rules
+
+    @staticmethod
+    async def channel_executor(
+        channel_id: str, lives: HolodexLiveMirror, rules: CompiledRuleSet, time: int, app: SanicVTHell
+    ):
+        logger.info(f"Checking Holodex for live and scheduled stream of {channel_id}...")
+        # Always refresh it, the cache TTL might be longer than the watch interval
+        videos = await app.holodex.get_channel_videos(channel_id, refresh=True)
+        videos = [video for video in videos if video.status in ("upcoming", "live")]
+        delta = lives.apply(videos)
+        if len(lives) < 1:
+            logger.info(f"No lives/upcoming stream found for {channel_id}")
+            lives.evaluated_by = rules
+            return
+        await AutoSchedulerTasks.evaluate_mirror(lives, delta, rules, time, app)
+
+    @classmethod
+    async def channel_watch_loop(cls: Type[AutoSchedulerTasks], app: SanicVTHell):
+        """
+        Poll only the channel from the channel include rules, each channel is polled once per
+        VTHELL_LOOP_SCHEDULER but the request is spread evenly across the interval.
+        Every channel has its own mirror as the last-seen cursor, so only new or changed
+        stream will be checked and scheduled.
+        """
+        loop = app.loop
+        interval = app.config.VTHELL_LOOP_SCHEDULER
+        channel_lives: Dict[str, HolodexLiveMirror] = {}
+        last_rules: Optional[CompiledRuleSet] = None
+        while True:
+            if map_to_boolean(getenv("SKIP_MAIN_TASK", "0")):
+                logger.info("Skipping main task loop")
+                return
+            rules = await cls.get_auto_schedulers(app)
+            channels = sorted(rules.include_channels)
+            for channel_id in list(channel_lives.keys()):
+                if channel_id not in rules.include_channels:
+                    channel_lives.pop(channel_id)
+            if len(channels) < 1:
+                logger.warning("No channel include rules found for the channel watch mode")
+                await app.autorules.wait_for_change(interval)
+                continue
+            slot = interval / len(channels)
+            if rules is not last_rules:
+                ignored_rules = rules.total_include - len(channels)
+                if ignored_rules > 0:
+                    logger.warning(
+                        f"Channel watch mode only use channel rules, ignoring {ignored_rules} include rule(s)"
+                    )
+                logger.info(f"Watching {len(channels)} channel(s), polling one every {slot:.1f}s")
+                last_rules = rules
+            for channel_id in channels:
+                started_at = loop.time()
+                ctime = pendulum.now("UTC").int_timestamp
+                task_name = f"auto-scheduler-{channel_id}-{ctime}"
+                lives = channel_lives.setdefault(channel_id, HolodexLiveMirror())
+                try:
+                    task = loop.create_task(cls.channel_executor(channel_id, lives, rules, ctime, app), name=task_name)
+                    task.add_done_callback(cls.executor_done)
+                    cls._tasks[task_name] = task
+                    await task
+                except Exception as e:
+                    logger.error(f"Failed to create task {task_name}", exc_info=e)
+                if await app.autorules.wait_for_change(max(slot - (loop.time() - started_at), 0)):
+                    logger.info("Auto scheduler rules got changed, restarting the channel watch")
+                    break
+
+    @staticmethod
+    async def insert_jobs(jobs: List[models.VTHellJob]) -> List[models.VTHellJob]:
+        """
+        Insert all the jobs in a single statement, if one of them got inserted by something else
+        in the meantime fallback to insert it one by one and skip the conflicting one.
+        """
+        try:
+            async with in_transaction():
+                await models.VTHellJob.bulk_create(jobs)
+            return jobs
+        except IntegrityError:
+            logger.warning("Some of the job got scheduled in the meantime, inserting it one by one")
+        inserted: List[models.VTHellJob] = []
+        for job in jobs:
+            try:
+                await job.save(force_create=True)
+            except IntegrityError:
+                logger.warning(f"Video <{job.id}> already scheduled, skipping")
+                continue
+            inserted.append(job)
+        return inserted
 
     @staticmethod
-    async def get_auto_schedulers():
-        return await models.VTHellAutoScheduler.all()
+    async def get_auto_schedulers(app: SanicVTHell):
+        return await app.autorules.get()
 
     @classmethod
     async def main_loop(cls: Type[AutoSchedulerTasks], app: SanicVTHell):
@@ -242,17 +263,22 @@ class AutoSchedulerTasks(InternalTaskBase):
         config = app.config
         await app.wait_until_ready()
         try:
+            if config.VTHELL_SCHEDULER_MODE == "channel":
+                logger.info("Running the auto scheduler in channel watch mode")
+                await cls.channel_watch_loop(app)
+                return
             while True:
                 if map_to_boolean(getenv("SKIP_MAIN_TASK", "0")):
                     logger.info("Skipping main task loop")
                     return
-                await asyncio.sleep(config.VTHELL_LOOP_SCHEDULER)
+                if await app.autorules.wait_for_change(config.VTHELL_LOOP_SCHEDULER):
+                    logger.info("Auto scheduler rules got changed, running it early")
                 ctime = pendulum.now("UTC").int_timestamp
                 logger.info(f"Checking for auto scheduler at {ctime}")
                 task_name = f"auto-scheduler-{ctime}"
                 try:
                     task = loop.create_task(
-                        cls.executor(await cls.get_auto_schedulers(), ctime, task_name, app), name=task_name
+                        cls.executor(await cls.get_auto_schedulers(app), ctime, task_name, app), name=task_name
                     )
                     task.add_done_callback(cls.executor_done)
                     cls._tasks[task_name] = task
@@ -27,13 +27,16 @@ from __future__ import annotations
 import asyncio
 import logging
 import os
-from typing import TYPE_CHECKING, List, Optional, Type
+import re
+from pathlib import Path
+from typing import TYPE_CHECKING, Optional, Type
 
 import aiofiles
 import orjson
 import pendulum
 
 from internals.chat.parser import complex_walk
+from internals.chat.writer import JSONWriter
 from internals.db import VTHellJob, VTHellJobChatTemporary, VTHellJobStatus
 from internals.struct import InternalTaskBase
 
@@ -45,37 +48,52 @@ logger = logging.getLogger("Tasks.TemporaryChat")
 __all__ = ("TemporaryChatTasks",)
 
 
-async def backtrack_read_json(file_path: str, max_size: int = -5000) -> Optional[dict]:
-    logger.debug(f"Backtracking file: {file_path}")
-    fp = await aiofiles.open(file_path, "rb")
-    await fp.seek(0, os.SEEK_END)
-
-    current = -1
-    read_json: Optional[List[dict]] = None
-    # Little by litte read the data until it reach the maximum backtracking
-    # This function is much efficient than reading a 100mb file directly.
-    while current > max_size:
-        await fp.seek(current, os.SEEK_END)
-        data = await fp.read()
-        await fp.seek(0, os.SEEK_END)
-        decoded = data.decode("utf-8")
-        current -= 1
-
-        # We dont want to add our opening bracket
-        # before there is a curly bracket since it will stop at:
-        # [], before it until parse anything meaningful
-        if decoded.endswith("}\n]") or decoded.endswith("}]"):
-            decoded = "[\n" + decoded
-
+CHATARCHIVE_PATH = Path(__file__).absolute().parent.parent.parent / "chatarchive"
+BACKTRACK_BLOCK_SIZE = 8192
+# A message starts on its own line with two spaces indent, right after the array start or a separator.
+# Objects nested inside a message are indented deeper, and a string can't contain a raw newline.
+_ARRAY_ITEM_START = re.compile(rb"[\[,][ \t\r]*\n {0,2}\{")
+
+
+def _find_last_object(data: bytes) -> Optional[dict]:
+    """
+    Find the last complete top-level object in the tail of a JSON array chat archive.
+    A torn trailing object is skipped, returns None if there is no complete one in the given data yet.
+    """
+    starts = [(match.start(), match.end() - 1) for match in _ARRAY_ITEM_START.finditer(data)]
+    # The last one might be followed by the array end or a separator without the next message yet
+    end = len(data.rstrip().rstrip(b",]"))
+    for separator, start in reversed(starts):
+        candidate = data[start:end]
+        end = separator
         try:
-            read_json = orjson.loads(decoded)
-            break
+            read_json = orjson.loads(candidate)
         except orjson.JSONDecodeError:
-            pass
+            continue
+        if isinstance(read_json, dict):
+            return read_json
+    return None
+
 
-    await fp.close()
-    if isinstance(read_json, list) and len(read_json) > 0:
-        return read_json[-1]
+async def backtrack_read_json(file_path: Path, max_size: int = 1024 * 1024) -> Optional[dict]:
+    """
+    Read the last chat message from an old JSON array archive.
+    The file is read backwards in blocks until a complete message is found or max_size is reached.
+    """
+    logger.debug(f"Backtracking file: {file_path}")
+    async with aiofiles.open(str(file_path), "rb") as fp:
+        await fp.seek(0, os.SEEK_END)
+        file_size = await fp.tell()
+        max_size = min(max_size, file_size)
+
+        tail = b""
+        while len(tail) < max_size:
+            block_size = min(BACKTRACK_BLOCK_SIZE, max_size - len(tail))
+            await fp.seek(file_size - len(tail) - block_size)
+            tail = await fp.read(block_size) + tail
+            read_json = _find_last_object(tail)
+            if read_json is not None:
+                return read_json
     return None
 
 
@@ -107,12 +125,18 @@ class TemporaryChatTasks(InternalTaskBase):
                 )
             return
 
-        # Video exist, time to read it temporarily to check the last timestamp of the message
-        # Loading this to memory might be a really bad idea lmao.
-        last_content = await backtrack_read_json(video_data.filename)
+        # Video exist, check the last timestamp of the message that we have
         last_timestamp = None
-        if isinstance(last_content, dict):
-            last_timestamp = complex_walk(last_content, "timestamp")
+        chat_path = CHATARCHIVE_PATH / chat_job.filename
+        stream_index = JSONWriter.read_index(chat_job.filename)
+        if stream_index is not None:
+            # The stream will be cut back to the index on resume, so only trust the index
+            last_timestamp = stream_index.get("last_timestamp")
+        elif chat_path.exists():
+            # Old JSON array archive, read the tail of it
+            last_content = await backtrack_read_json(chat_path)
+            if isinstance(last_content, dict):
+                last_timestamp = complex_walk(last_content, "timestamp")
         logger.info(f"Dispatching downloader for <{video_data.id}> with last timestamp at {last_timestamp}")
         await app.dispatch(
             "internals.chat.manager",
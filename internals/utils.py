@@ -29,9 +29,10 @@ import random
 import re
 import string as pystring
 import subprocess
+from collections import deque
 from http.cookies import Morsel
 from pathlib import Path
-from typing import IO, Any, Dict, NoReturn
+from typing import IO, Any, AsyncIterator, Dict, NoReturn, Optional
 from urllib.parse import quote as url_quote
 
 import aiofiles.ospath
@@ -57,10 +58,13 @@ __all__ = (
     "remove_acquired_lock",
     "parse_expiry_as_date",
     "parse_cookie_to_morsel",
+    "read_stream_lines",
+    "read_stream_tail",
 )
 
 logger = logging.getLogger("Internals.Utils")
 BASE_PATH = Path(__file__).absolute().parent.parent
+LINE_BREAK = re.compile(rb"[\r\n]")
 
 
 def secure_filename(fn: str):
@@ -417,3 +421,54 @@ def parse_cookie_to_morsel(cookie_content: str):
         netscape_cookies[name] = cookie
 
     return netscape_cookies
+
+
+async def read_stream_lines(
+    stream: Optional[asyncio.StreamReader], chunk_size: int = 4096, max_line_size: int = 64 * 1024
+) -> AsyncIterator[str]:
+    """
+    Read a subprocess stream in fixed size chunks and yield each line split on ``\\r`` or ``\\n``.
+
+    Unlike iterating the StreamReader directly, this never raise when a line exceed the reader limit.
+    A line longer than ``max_line_size`` is yielded truncated and the rest of it is dropped,
+    so the memory used per stream is capped. Empty lines are skipped.
+    """
+    if stream is None:
+        return
+    buffer = bytearray()
+    truncated = False
+    while True:
+        chunk = await stream.read(chunk_size)
+        if not chunk:
+            break
+        buffer.extend(chunk)
+        while True:
+            match = LINE_BREAK.search(buffer)
+            if match is None:
+                break
+            line = bytes(buffer[: match.start()])
+            del buffer[: match.end()]
+            if truncated:
+                # The rest of a line that has been yielded truncated
+                truncated = False
+                continue
+            line = line.decode("utf-8", errors="replace").rstrip()
+            if line:
+                yield line
+        if len(buffer) > max_line_size:
+            if not truncated:
+                truncated = True
+                yield bytes(buffer[:max_line_size]).decode("utf-8", errors="replace").rstrip()
+            buffer.clear()
+    if buffer and not truncated:
+        line = bytes(buffer).decode("utf-8", errors="replace").rstrip()
+        if line:
+            yield line
+
+
+async def read_stream_tail(stream: Optional[asyncio.StreamReader], max_lines: int = 50) -> str:
+    """Drain the stream until EOF and only keep the last ``max_lines`` lines"""
+    lines = deque(maxlen=max_lines)
+    async for line in read_stream_lines(stream):
+        lines.append(line)
+    return "\n".join(lines)
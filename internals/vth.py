@@ -30,7 +30,7 @@ import os
 from dataclasses import dataclass, field
 from glob import glob
 from pathlib import Path
-from typing import TYPE_CHECKING, Any, AnyStr, Callable, Dict, List, Optional, Tuple, Type, Union
+from typing import TYPE_CHECKING, Any, AnyStr, Callable, Dict, List, Literal, Optional, Tuple, Type, Union
 
 import aiofiles
 import orjson
@@ -41,7 +41,11 @@ from sanic.config import SANIC_PREFIX, Config
 from sanic.server.protocols.http_protocol import HttpProtocol
 from sanic.server.protocols.websocket_protocol import WebSocketProtocol
 
+from internals.autoscheduler import AutoSchedulerRules
+from internals.chat.writer import has_zstandard
 from internals.db import IPCServerClientBridge
+from internals.httpclient import HTTPClientManager
+from internals.jobs import JobPipeline, JobStateCache, JobTimer, ProcessSupervisor
 from internals.runner import serve_multiple, serve_single
 from internals.struct import VTHellRecords
 from internals.ws import WebsocketServer
@@ -178,11 +182,25 @@ class SanicVTHellConfig(Config):
     VTHELL_LOOP_DOWNLOADER: int
     VTHELL_LOOP_SCHEDULER: int
     VTHELL_GRACE_PERIOD: int
+    VTHELL_WORKERS_DOWNLOAD: int
+    VTHELL_WORKERS_MUX: int
+    VTHELL_WORKERS_UPLOAD: int
+    VTHELL_MUX_MODE: Literal["mkv", "passthrough"]
+    VTHELL_SCHEDULER_MODE: Literal["live", "channel"]
+    VTHELL_CHAT_COMPRESSION: Literal["none", "gzip", "zstd"]
+    VTHELL_CHAT_COMPRESSION_LEVEL: int
 
     HOLODEX_API_KEY: str
+    HOLODEX_CACHE_VIDEO_TTL: int
+    HOLODEX_CACHE_CHANNEL_TTL: int
+    HOLODEX_CACHE_SIZE: int
+    HOLODEX_PAGE_CONCURRENCY: int
+    HOLODEX_RATE_LIMIT: int
+    HOLODEX_RATE_BURST: int
 
     RCLONE_PATH: str
     RCLONE_DISABLE: bool
+    RCLONE_STREAM_UPLOAD: bool
     RCLONE_DRIVE_TARGET: str
     YTARCHIVE_PATH: str
     MKVMERGE_PATH: str
@@ -203,6 +221,12 @@ class SanicVTHell(Sanic):
     vtrecords: VTHellRecordedData
     wshandler: WebsocketServer
     ipc: IPCServerClientBridge
+    jobtimer: JobTimer
+    jobstate: JobStateCache
+    jobpipeline: JobPipeline
+    supervisor: ProcessSupervisor
+    autorules: AutoSchedulerRules
+    http: HTTPClientManager
     worker_num: int
 
     def __init__(
@@ -290,6 +314,55 @@ class SanicVTHell(Sanic):
             # Default to start waiting 2 minutes before scheduled start
             self.config["VTHELL_GRACE_PERIOD"] = 120
 
+        # Default to unlimited download, and 2 concurrent mux and upload
+        for config_key, config_default in (
+            ("VTHELL_WORKERS_DOWNLOAD", 0),
+            ("VTHELL_WORKERS_MUX", 2),
+            ("VTHELL_WORKERS_UPLOAD", 2),
+            # Holodex response cache, in seconds and entries
+            ("HOLODEX_CACHE_VIDEO_TTL", 60),
+            ("HOLODEX_CACHE_CHANNEL_TTL", 300),
+            ("HOLODEX_CACHE_SIZE", 256),
+            ("HOLODEX_PAGE_CONCURRENCY", 4),
+            ("HOLODEX_RATE_LIMIT", 4),
+            ("HOLODEX_RATE_BURST", 10),
+            # 0 will use the default level of the compression
+            ("VTHELL_CHAT_COMPRESSION_LEVEL", 0),
+        ):
+            check = self.config.get(config_key, config_default)
+            if not isinstance(check, int):
+                try:
+                    check = int(check)
+                except ValueError:
+                    logger.error("%s must be a number, not %s (fallback to %d)", config_key, check, config_default)
+                    check = config_default
+            self.config[config_key] = check
+
+        mux_mode = str(self.config.get("VTHELL_MUX_MODE", "mkv")).lower()
+        if mux_mode not in ("mkv", "passthrough"):
+            logger.error("VTHELL_MUX_MODE must be either mkv or passthrough, not %s (fallback to mkv)", mux_mode)
+            mux_mode = "mkv"
+        self.config["VTHELL_MUX_MODE"] = mux_mode
+
+        scheduler_mode = str(self.config.get("VTHELL_SCHEDULER_MODE", "live")).lower()
+        if scheduler_mode not in ("live", "channel"):
+            logger.error(
+                "VTHELL_SCHEDULER_MODE must be either live or channel, not %s (fallback to live)", scheduler_mode
+            )
+            scheduler_mode = "live"
+        self.config["VTHELL_SCHEDULER_MODE"] = scheduler_mode
+
+        chat_compression = str(self.config.get("VTHELL_CHAT_COMPRESSION", "none")).lower()
+        if chat_compression not in ("none", "gzip", "zstd"):
+            logger.error(
+                "VTHELL_CHAT_COMPRESSION must be either none, gzip or zstd, not %s (fallback to none)", chat_compression
+            )
+            chat_compression = "none"
+        if chat_compression == "zstd" and not has_zstandard():
+            logger.error("VTHELL_CHAT_COMPRESSION is zstd but zstandard is not installed (fallback to gzip)")
+            chat_compression = "gzip"
+        self.config["VTHELL_CHAT_COMPRESSION"] = chat_compression
+
         if self.config.get("WEBSERVER_REVERSE_PROXY", False):
             secret_reverse = self.config.get("WEBSERVER_REVERSE_PROXY_SECRET", "").strip()
             if secret_reverse == "":
@@ -305,6 +378,12 @@ class SanicVTHell(Sanic):
         self.startup_vthell_dataset()
         self.wshandler = WebsocketServer(self)
         self.wshandler.attach()
+        self.jobtimer = JobTimer(self)
+        self.jobstate = JobStateCache(self)
+        self.jobpipeline = JobPipeline(self)
+        self.supervisor = ProcessSupervisor(self)
+        self.autorules = AutoSchedulerRules(self)
+        self.http = HTTPClientManager()
 
         self.ipc = None
         self.worker_num = 0
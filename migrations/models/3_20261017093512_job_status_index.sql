@@ -0,0 +1,4 @@
+-- upgrade --
+CREATE INDEX "idx_vthelljob_status_e59005" ON "vthelljob" ("status", "start_time");
+-- downgrade --
+DROP INDEX "idx_vthelljob_status_e59005";
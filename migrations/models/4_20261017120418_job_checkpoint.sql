@@ -0,0 +1,10 @@
+-- upgrade --
+CREATE TABLE IF NOT EXISTS "vthelljobcheckpoint" (
+    "id" VARCHAR(128) NOT NULL  PRIMARY KEY,
+    "parts" JSON NOT NULL,
+    "fragments" INT NOT NULL  DEFAULT 0,
+    "downloaded" BIGINT NOT NULL  DEFAULT 0,
+    "updated_at" BIGINT NOT NULL  DEFAULT 0
+);
+-- downgrade --
+DROP TABLE IF EXISTS "vthelljobcheckpoint";
@@ -0,0 +1,12 @@
+-- upgrade --
+CREATE TABLE IF NOT EXISTS "vthelljobprocess" (
+    "id" INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
+    "job_id" VARCHAR(128) NOT NULL,
+    "name" VARCHAR(24) NOT NULL,
+    "pid" INT NOT NULL,
+    "executable" TEXT NOT NULL,
+    "started_at" BIGINT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS "idx_vthelljobpr_job_id_880424" ON "vthelljobprocess" ("job_id");
+-- downgrade --
+DROP TABLE IF EXISTS "vthelljobprocess";
@@ -0,0 +1,274 @@
+import argparse
+import copy
+import random
+import re
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).absolute().parent.parent))
+
+from internals.chat.client import ChatDownloader  # noqa: E402
+from internals.chat.parser import YoutubeChatParser, complex_walk  # noqa: E402
+from internals.chat.utils import remove_prefixes, remove_suffixes, try_get_first_key  # noqa: E402
+
+parser = argparse.ArgumentParser()
+parser.add_argument("-n", "--count", help="Number of chat actions to generate", type=int, default=20000)
+parser.add_argument("-r", "--rounds", help="Number of rounds to run, the best one is reported", type=int, default=5)
+parser.add_argument("-s", "--seed", help="Seed for the action generator", type=int, default=0)
+parser.add_argument(
+    "-m",
+    "--mode",
+    help="Parser to run: the current one, the old if/elif loop body, or both alternating",
+    choices=["both", "new", "old"],
+    default="both",
+)
+args = parser.parse_args()
+
+
+def text_message(index: int):
+    return {
+        "clickTrackingParams": "CAEQl98BIhMI",
+        "addChatItemAction": {
+            "item": {
+                "liveChatTextMessageRenderer": {
+                    "message": {
+                        "runs": [
+                            {"text": f"hello world {index} "},
+                            {
+                                "emoji": {
+                                    "emojiId": "UC/emoji",
+                                    "shortcuts": [":yay:"],
+                                    "searchTerms": ["yay"],
+                                    "image": {
+                                        "thumbnails": [
+                                            {"url": "https://yt3.ggpht.com/emoji=w24-h24", "width": 24, "height": 24}
+                                        ]
+                                    },
+                                    "isCustomEmoji": True,
+                                }
+                            },
+                        ]
+                    },
+                    "authorName": {"simpleText": f"User {index % 500}"},
+                    "authorPhoto": {
+                        "thumbnails": [
+                            {"url": "https://yt4.ggpht.com/photo=s32-c-k", "width": 32, "height": 32},
+                            {"url": "https://yt4.ggpht.com/photo=s64-c-k", "width": 64, "height": 64},
+                        ]
+                    },
+                    "contextMenuEndpoint": {"liveChatItemContextMenuEndpoint": {"params": "Q2g0S0dn"}},
+                    "id": f"CjkKGkNQ{index:08d}",
+                    "timestampUsec": str(1639559148000000 + index * 1000),
+                    "authorBadges": [
+                        {
+                            "liveChatAuthorBadgeRenderer": {
+                                "customThumbnail": {
+                                    "thumbnails": [
+                                        {"url": "https://yt3.ggpht.com/badge=s16-c-k", "width": 16, "height": 16}
+                                    ]
+                                },
+                                "tooltip": "Member (1 month)",
+                                "accessibility": {"accessibilityData": {"label": "Member (1 month)"}},
+                            }
+                        }
+                    ],
+                    "authorExternalChannelId": f"UC{index % 500:022d}",
+                    "contextMenuAccessibility": {"accessibilityData": {"label": "Chat actions"}},
+                    "trackingParams": "CAEQl98BIhMI",
+                }
+            },
+            "clientId": f"CNq{index}",
+        },
+    }
+
+
+def paid_message(index: int):
+    action = text_message(index)
+    renderer = action["addChatItemAction"]["item"].pop("liveChatTextMessageRenderer")
+    renderer.update(
+        {
+            "purchaseAmountText": {"simpleText": "¥1,000"},
+            "headerBackgroundColor": 4278239141,
+            "headerTextColor": 4278190080,
+            "bodyBackgroundColor": 4280150454,
+            "bodyTextColor": 4278190080,
+            "authorNameTextColor": 2315255808,
+            "timestampColor": 2147483648,
+        }
+    )
+    action["addChatItemAction"]["item"]["liveChatPaidMessageRenderer"] = renderer
+    return action
+
+
+def placeholder_message(index: int):
+    return {
+        "addChatItemAction": {
+            "item": {"liveChatPlaceholderItemRenderer": {"id": f"ph{index}", "timestampUsec": "1639559148000000"}}
+        }
+    }
+
+
+def deleted_message(index: int):
+    return {
+        "markChatItemAsDeletedAction": {
+            "deletedStateMessage": {"runs": [{"text": "[message retracted]"}]},
+            "targetItemId": f"CjkKGkNQ{index:08d}",
+        }
+    }
+
+
+def poll_update(index: int):
+    return {"updateLiveChatPollAction": {"pollToUpdate": {}}}
+
+
+def legacy_camel_case_split(word):
+    return "_".join(re.findall(r"[A-Z]?[a-z]+|[A-Z]+(?=[A-Z]|$)", word)).lower()
+
+
+def legacy_parse_action(self: ChatDownloader, action: dict, offset=None):
+    """The per-action body of ChatDownloader._iterate_chat before the dispatch table, kept as the baseline"""
+    data = {}
+
+    replay_chat_item_action = action.get("replayChatItemAction")
+    if replay_chat_item_action:
+        offset_time = replay_chat_item_action.get("videoOffsetTimeMsec")
+        if offset_time:
+            data["time_in_seconds"] = float(offset_time) / 1000
+
+        action = replay_chat_item_action["actions"][0]
+
+    action.pop("clickTrackingParams", None)
+    original_action_type = try_get_first_key(action)
+
+    data["action_type"] = legacy_camel_case_split(remove_suffixes(original_action_type, ("Action", "Command")))
+
+    original_message_type = None
+    original_item = {}
+
+    if original_action_type in self._KNOWN_ITEM_ACTION_TYPES:
+        original_item = complex_walk(action, f"{original_action_type}.item")
+
+        original_message_type = try_get_first_key(original_item)
+        data = YoutubeChatParser.parse_item(original_item, data, offset)
+    elif original_action_type in self._KNOWN_REMOVE_ACTION_TYPES:
+        original_item = action
+        if original_action_type == "markChatItemAsDeletedAction":
+            original_message_type = "deletedMessage"
+        else:  # markChatItemsByAuthorAsDeletedAction
+            original_message_type = "banUser"
+
+        data = YoutubeChatParser.parse_item(original_item, data, offset)
+    elif original_action_type in self._KNOWN_REPLACE_ACTION_TYPES:
+        original_item = complex_walk(action, f"{original_action_type}.replacementItem")
+
+        original_message_type = try_get_first_key(original_item)
+        data = YoutubeChatParser.parse_item(original_item, data, offset)
+    elif original_action_type in self._KNOWN_TOOLTIP_ACTION_TYPES:
+        original_item = complex_walk(action, f"{original_action_type}.tooltip")
+
+        original_message_type = try_get_first_key(original_item)
+        data = YoutubeChatParser.parse_item(original_item, data, offset)
+    elif original_action_type in self._KNOWN_ADD_BANNER_TYPES:
+        original_item = complex_walk(action, f"{original_action_type}.bannerRenderer")
+
+        if original_item:
+            original_message_type = try_get_first_key(original_item)
+
+            header = original_item[original_message_type].get("header")
+            parsed_header = YoutubeChatParser.parse_item(header, offset=offset)
+            header_message = parsed_header.get("message")
+
+            contents = original_item[original_message_type].get("contents")
+            parsed_contents = YoutubeChatParser.parse_item(contents, offset=offset)
+
+            data.update(parsed_header)
+            data.update(parsed_contents)
+            data["header_message"] = header_message
+        else:
+            self.logger.debug(
+                "No bannerRenderer item\n"
+                f"Action type: {original_action_type}\n"
+                f"Action: {action}\n"
+                f"Parsed data: {data}"
+            )
+    elif original_action_type in self._KNOWN_REMOVE_BANNER_TYPES:
+        original_item = action
+        original_message_type = "removeBanner"
+        data = YoutubeChatParser.parse_item(original_item, data, offset)
+    elif original_action_type in self._KNOWN_IGNORE_ACTION_TYPES:
+        return None
+    else:
+        self.logger.debug(f"Unknown action: {original_action_type}\n{action}\n{data}")
+
+    test_for_missing_keys = original_item.get(original_message_type, {}).keys()
+    missing_keys = test_for_missing_keys - self._KNOWN_KEYS
+
+    if not data:
+        self.logger.debug(f"Parse of action returned empty results: {original_action_type}\n{action}")
+
+    if missing_keys:
+        self.logger.debug(
+            f"Missing keys found: {missing_keys}\n"
+            f"Message type: {original_message_type}\n"
+            f"Action type: {original_action_type}\n"
+            f"Action: {action}\n"
+            f"Parsed data: {data}"
+        )
+
+    if original_message_type:
+        new_index = remove_prefixes(original_message_type, "liveChat")
+        new_index = remove_suffixes(new_index, "Renderer")
+        data["message_type"] = legacy_camel_case_split(new_index)
+
+        if original_message_type in self._KNOWN_IGNORE_MESSAGE_TYPES:
+            return None
+        elif original_message_type not in self._KNOWN_ACTION_TYPES[original_action_type]:
+            self.logger.debug(
+                f'Unknown message type "{original_message_type}"\n'
+                f"New message type: {data['message_type']}\n"
+                f"Action: {action}\n"
+                f"Parsed data: {data}"
+            )
+    else:
+        self.logger.debug(
+            f"No message type found for action: {original_action_type}\n"
+            f"Action: {action}\n"
+            f"Parsed data: {data}"
+        )
+        return None
+    return data
+
+
+# Roughly what a busy stream looks like, mostly plain text messages
+GENERATORS = [text_message] * 90 + [paid_message] * 4 + [placeholder_message] * 3 + [deleted_message] * 2
+GENERATORS += [poll_update]
+
+rng = random.Random(args.seed)
+actions = [rng.choice(GENERATORS)(index) for index in range(args.count)]
+downloader = ChatDownloader("benchmark")
+
+PARSERS = {
+    "new": lambda action: downloader._parse_action(action, None),
+    "old": lambda action: legacy_parse_action(downloader, action, None),
+}
+modes = ["old", "new"] if args.mode == "both" else [args.mode]
+
+print(f"[*] Parsing {args.count} chat actions, {args.rounds} rounds")
+best = {mode: 0.0 for mode in modes}
+parsed = {mode: 0 for mode in modes}
+for _ in range(args.rounds):
+    # Alternate between the parsers every round so both see the same machine load
+    for mode in modes:
+        parse_action = PARSERS[mode]
+        batch = copy.deepcopy(actions)
+        start = time.perf_counter()
+        results = [parse_action(action) for action in batch]
+        elapsed = time.perf_counter() - start
+        best[mode] = max(best[mode], len(batch) / elapsed)
+        parsed[mode] = sum(1 for result in results if result is not None)
+
+for mode in modes:
+    print(f"[*] {mode}: {parsed[mode]} messages parsed, best round: {best[mode]:,.0f} actions/sec")
+if len(modes) > 1:
+    print(f"[*] new/old: {best['new'] / best['old']:.2f}x")
@@ -6,7 +6,8 @@ import requests
 parser = argparse.ArgumentParser()
 parser.add_argument("-p", "--port", help="Port to connect to", type=int, default=12790)
 parser.add_argument("-P", "--password", help="Password to connect to the server")
-parser.add_argument("video", help="Video URL to schedule")
+parser.add_argument("-f", "--file", help="File containing the video URL to schedule, one per line")
+parser.add_argument("video", help="Video URL to schedule", nargs="*")
 args = parser.parse_args()
 
 
@@ -20,16 +21,50 @@ def extract_video_id(url: str):
     return re.sub(r"watch\?v\=", "", part)
 
 
+videos = list(args.video)
+if args.file:
+    with open(args.file, "r", encoding="utf-8") as fp:
+        for line in fp:
+            line = line.strip()
+            if line and not line.startswith("#"):
+                videos.append(line)
+
+if len(videos) < 1:
+    parser.error("Please provide at least one video URL or a file")
+
 headers = {
     "Authorization": f"Password {args.password}",
 }
-print(f"[*] Trying to schedule {args.video}")
+if len(videos) == 1:
+    print(f"[*] Trying to schedule {videos[0]}")
+    resp = requests.post(
+        f"http://localhost:{args.port}/api/schedule", json={"id": extract_video_id(videos[0])}, headers=headers
+    )
+
+    if resp.status_code != 200:
+        print(f"[!] Error scheduling video: {resp.text}")
+        exit(1)
+
+    print(f"[*] Video {videos[0]} scheduled successfully")
+    exit(0)
+
+print(f"[*] Trying to schedule {len(videos)} videos")
 resp = requests.post(
-    f"http://localhost:{args.port}/api/schedule", json={"id": extract_video_id(args.video)}, headers=headers
+    f"http://localhost:{args.port}/api/schedule/bulk",
+    json={"ids": [extract_video_id(video) for video in videos]},
+    headers=headers,
 )
 
 if resp.status_code != 200:
-    print(f"[!] Error scheduling video: {resp.text}")
+    print(f"[!] Error scheduling videos: {resp.text}")
     exit(1)
 
-print(f"[*] Video {args.video} scheduled successfully")
+failed = 0
+for result in resp.json()["results"]:
+    if result["status"] == "error":
+        failed += 1
+        print(f"[!] Error scheduling video {result['id']}: {result['error']}")
+    else:
+        print(f"[*] Video {result['id']} {result['status']} successfully")
+if failed > 0:
+    exit(1)
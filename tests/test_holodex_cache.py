@@ -0,0 +1,53 @@
+import asyncio
+
+import pytest
+
+from internals.holodex.cache import HolodexCache
+
+
+def test_leader_cancellation_does_not_cancel_waiters():
+    async def runner():
+        cache = HolodexCache("test", ttl=60)
+        calls = 0
+        release = asyncio.Event()
+
+        async def fetcher():
+            nonlocal calls
+            calls += 1
+            await release.wait()
+            return {"id": "abc"}
+
+        leader = asyncio.ensure_future(cache.get_or_fetch("abc", fetcher))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(cache.get_or_fetch("abc", fetcher))
+        await asyncio.sleep(0)
+
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+
+        release.set()
+        assert await follower == {"id": "abc"}
+        assert calls == 1
+        assert cache.get("abc") == (True, {"id": "abc"})
+        assert cache.coalesced == 1
+
+    asyncio.run(runner())
+
+
+def test_fetch_error_is_shared_and_not_cached():
+    async def runner():
+        cache = HolodexCache("test", ttl=60)
+
+        async def fetcher():
+            await asyncio.sleep(0)
+            raise RuntimeError("upstream failed")
+
+        results = await asyncio.gather(
+            cache.get_or_fetch("abc", fetcher), cache.get_or_fetch("abc", fetcher), return_exceptions=True
+        )
+        assert all(isinstance(result, RuntimeError) for result in results)
+        assert cache.get("abc") == (False, None)
+        assert not cache._inflight
+
+    asyncio.run(runner())